@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Compare the registered architectures against ResNet50
+For each architecture a checkpoint is written to a temporary directory and
+measured in a fresh interpreter: parameter count, size on disk, load time and
+latency per batch size, plus peak memory. Trained checkpoints passed with
+--checkpoints are measured the same way and also scored on data/test.
+
+Usage: python benchmarks/benchmark_architectures.py [--archs resnet50 simple_cnn mobilenet_v3_small] [--checkpoints models/a.pth models/b.pth]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+import config
+from benchmark_decode import list_images, peak_rss, reset_peak_rss
+
+def worker(args):
+    """Load one checkpoint and time it in a fresh interpreter"""
+    import torch
+    from architectures import load_checkpoint
+    baseline = reset_peak_rss()
+    start = time.perf_counter()
+    model, metadata = load_checkpoint(args.worker, 'cpu')
+    load_seconds = time.perf_counter() - start
+
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, *metadata['input_size'])
+            for _ in range(2):
+                model(batch)
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                model(batch)
+            latencies[batch_size] = (time.perf_counter() - start) / args.repeats
+    print(json.dumps({
+        'arch': metadata['arch'],
+        'parameters': sum(param.numel() for param in model.parameters()),
+        'load_seconds': load_seconds,
+        'latency_seconds': latencies,
+        'peak_rss_delta_mb': (peak_rss() - baseline) / 1024
+    }))
+
+def measure_in_subprocess(checkpoint_path, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', checkpoint_path,
+               '--repeats', str(args.repeats), '--batch-sizes'] + [str(b) for b in args.batch_sizes]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['file_size_mb'] = os.path.getsize(checkpoint_path) / 2**20
+    return result
+
+def accuracy(checkpoint_path, samples, batch_size=16):
+    """Fraction of labelled samples a trained checkpoint classifies correctly"""
+    from predict import MangroveClassifier
+    classifier = MangroveClassifier(checkpoint_path, quantized=False, backend='torch')
+    predictions = classifier.predict_batch([path for path, _ in samples], batch_size=batch_size)
+    return sum(p['prediction'] == label for p, (_, label) in zip(predictions, samples)) / len(samples)
+
+def main():
+    from architectures import ARCHITECTURES
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--archs', nargs='*', default=sorted(ARCHITECTURES),
+                        help='registered architectures to measure with untrained weights')
+    parser.add_argument('--checkpoints', nargs='*', default=[], help='trained checkpoints to measure and score')
+    parser.add_argument('--data', default=os.path.join(ROOT, config.TEST_DIR))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    from architectures import build_model, save_checkpoint
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for arch in args.archs:
+            path = save_checkpoint(build_model(arch), os.path.join(tmp_dir, f"{arch}.pth"), arch)
+            results[arch] = measure_in_subprocess(path, args)
+    for path in args.checkpoints:
+        results[path] = measure_in_subprocess(path, args)
+
+    print("🏗️  Architecture Benchmark")
+    print("=" * 50)
+    reference = next((r for r in results.values() if r['arch'] == 'resnet50'), None)
+    header = f"{'model':<24} {'params':>8} {'MB':>7} {'load s':>7} {'peak MB':>8}"
+    header += ''.join(f" {f'b{b} ms':>9}" for b in args.batch_sizes)
+    print(header)
+    for name, result in results.items():
+        row = (f"{os.path.basename(name):<24} {result['parameters'] / 1e6:>7.2f}M {result['file_size_mb']:>7.1f} "
+               f"{result['load_seconds']:>7.2f} {result['peak_rss_delta_mb']:>8.0f}")
+        row += ''.join(f" {result['latency_seconds'][str(b)] * 1000:>9.1f}" for b in args.batch_sizes)
+        print(row)
+
+    if reference is not None:
+        print(f"\n⏱️  Speed-up over resnet50 at batch {args.batch_sizes[-1]}:")
+        key = str(args.batch_sizes[-1])
+        for name, result in results.items():
+            if result is not reference:
+                print(f"   {os.path.basename(name):<24} "
+                      f"{reference['latency_seconds'][key] / result['latency_seconds'][key]:.1f}x")
+
+    samples = list_images(args.data) if args.checkpoints else []
+    if samples:
+        print(f"\n🎯 Accuracy on {args.data} ({len(samples)} images):")
+        for path in args.checkpoints:
+            print(f"   {os.path.basename(path):<24} {accuracy(path, samples):.2%} ({results[path]['arch']})")
+    elif args.checkpoints:
+        print(f"⚠️  No images found in {args.data}, skipping the accuracy check")
+
+if __name__ == "__main__":
+    main()
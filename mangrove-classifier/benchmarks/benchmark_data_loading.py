@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark training data loading: ImageFolder vs the pre-decoded dataset cache
+Times full passes over the training split with the training augmentation (what
+one epoch costs before the model sees a batch), plus the cache build itself.
+
+Usage: python benchmarks/benchmark_data_loading.py [--data data] [--epochs 3] [--batch-size 32] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+import torch
+from torchvision import datasets
+import config
+from dataset_cache import CachedImageDataset, build_cache
+from loaders import make_loader, resolve_workers
+from utils import get_data_transforms, get_tensor_transforms
+
+def time_epochs(dataset, batch_size, epochs, num_workers):
+    """Seconds per pass over `dataset` in shuffled batches (first pass and worker start-up included)"""
+    loader = make_loader(dataset, batch_size, shuffle=True, num_workers=num_workers)
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _ in loader:
+            pass
+    return (time.perf_counter() - start) / epochs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(ROOT, config.DATA_DIR))
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=config.BATCH_SIZE)
+    parser.add_argument('--workers', default=None,
+                        help="loader worker processes, or 'auto' (default: config.LOADER_WORKERS)")
+    args = parser.parse_args()
+
+    train_dir = os.path.join(args.data, 'train')
+    if not os.path.isdir(train_dir):
+        print(f"❌ Training split not found: {train_dir}")
+        sys.exit(1)
+    torch.manual_seed(0)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        index_path = build_cache(train_dir, cache_dir)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        build_cache(train_dir, cache_dir)
+        check_seconds = time.perf_counter() - start
+
+        folder = datasets.ImageFolder(train_dir, transform=get_data_transforms()[0])
+        cached = CachedImageDataset(index_path, transform=get_tensor_transforms()[0])
+        workers = resolve_workers(cached, args.batch_size, args.workers)
+        folder_seconds = time_epochs(folder, args.batch_size, args.epochs, workers)
+        cached_seconds = time_epochs(cached, args.batch_size, args.epochs, workers)
+
+    print(f"\n📦 Data Loading Benchmark ({len(folder)} training images, batch {args.batch_size}, "
+          f"{workers} loader worker(s))")
+    print("=" * 50)
+    print(f"Cache build (decode once):   {build_seconds:.2f}s")
+    print(f"Cache up-to-date check:      {check_seconds * 1000:.1f} ms")
+    print(f"ImageFolder epoch:           {folder_seconds:.2f}s ({len(folder) / folder_seconds:.0f} img/s)")
+    print(f"Cached epoch:                {cached_seconds:.2f}s ({len(cached) / cached_seconds:.0f} img/s)")
+    print(f"Speedup:                     {folder_seconds / cached_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark reduced-resolution decoding against full decoding
+Reports decode+resize time and peak memory per mode, the preprocessing
+difference between the two, and prediction agreement/accuracy on data/test.
+
+Usage: python benchmarks/benchmark_decode.py [--data data/test] [--model models/mangrove_model.pth]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+from PIL import Image
+import config
+from image_io import load_rgb
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def list_images(data_dir):
+    """Return (path, class_name) pairs for every image below data_dir"""
+    samples = []
+    for dirpath, _, filenames in os.walk(data_dir):
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(dirpath, name), os.path.basename(dirpath)))
+    return samples
+
+def make_large_jpeg(source_path, out_dir, megapixels=12):
+    """Upscale a sample to phone-camera resolution so the benchmark reflects real uploads"""
+    image = Image.open(source_path).convert('RGB')
+    scale = (megapixels * 1e6 / (image.width * image.height)) ** 0.5
+    large = image.resize((int(image.width * scale), int(image.height * scale)), Image.BICUBIC)
+    path = os.path.join(out_dir, f'synthetic_{megapixels}mp.jpg')
+    large.save(path, quality=92)
+    return path
+
+def time_decode(paths, fast, repeats):
+    # Same bilinear + antialias resize transforms.Resize applies to PIL images, without importing torch
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for path in paths:
+            load_rgb(path, target_size=config.IMG_SIZE, fast=fast).resize(config.IMG_SIZE[::-1], Image.BILINEAR)
+    return (time.perf_counter() - start) / (repeats * len(paths))
+
+def measure_in_subprocess(paths, fast, repeats):
+    """Run one mode in a fresh interpreter so peak RSS isn't polluted by the other mode"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--fast', str(int(fast)),
+               '--repeats', str(repeats), '--paths', json.dumps(paths)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def peak_rss():
+    """Peak resident set size in KB (VmHWM on Linux, ru_maxrss elsewhere)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark where supported; returns the new baseline"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    return peak_rss()
+
+def worker(args):
+    paths = json.loads(args.paths)
+    baseline = reset_peak_rss()
+    seconds = time_decode(paths, bool(args.fast), args.repeats)
+    peak = peak_rss()
+    print(json.dumps({'seconds_per_image': seconds, 'peak_rss_delta_mb': (peak - baseline) / 1024}))
+
+def preprocessing_difference(paths):
+    """Mean/max absolute difference between the normalised input tensors of both modes"""
+    from torchvision import transforms
+    transform = transforms.Compose([
+        transforms.Resize(config.IMG_SIZE),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+    mean_diffs, max_diff = [], 0.0
+    for path in paths:
+        full = transform(load_rgb(path, target_size=config.IMG_SIZE, fast=False))
+        fast = transform(load_rgb(path, target_size=config.IMG_SIZE, fast=True))
+        diff = (full - fast).abs()
+        mean_diffs.append(diff.mean().item())
+        max_diff = max(max_diff, diff.max().item())
+    return sum(mean_diffs) / len(mean_diffs), max_diff
+
+def accuracy_check(samples, model_path):
+    """Compare predictions of both decode modes with the trained model, if it can be loaded"""
+    from predict import MangroveClassifier
+    try:
+        classifier = MangroveClassifier(model_path)
+    except Exception as e:
+        print(f"⚠️  Skipping accuracy check, could not load model: {str(e).splitlines()[0]}")
+        return None
+
+    counts = {'full_correct': 0, 'fast_correct': 0, 'agree': 0, 'total': 0}
+    for path, label in samples:
+        predictions = {}
+        for mode, fast in (('full', False), ('fast', True)):
+            image = load_rgb(path, target_size=config.IMG_SIZE, fast=fast)
+            probabilities = classifier.backend.predict(classifier.transform(image).unsqueeze(0).numpy())
+            predictions[mode] = classifier.classes[int(probabilities.argmax())]
+        counts['full_correct'] += predictions['full'] == label
+        counts['fast_correct'] += predictions['fast'] == label
+        counts['agree'] += predictions['full'] == predictions['fast']
+        counts['total'] += 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(ROOT, config.TEST_DIR))
+    parser.add_argument('--model', default=os.path.join(ROOT, config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--fast', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--paths', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    samples = list_images(args.data)
+    if not samples:
+        print(f"❌ No images found in {args.data}")
+        sys.exit(1)
+
+    print("🖼️  Decode Benchmark")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as tmp:
+        jpegs = [path for path, _ in samples if path.lower().endswith(('.jpg', '.jpeg'))]
+        sets = {'dataset': [path for path, _ in samples]}
+        if jpegs:
+            sets['12MP JPEG'] = [make_large_jpeg(jpegs[0], tmp)]
+
+        for set_name, paths in sets.items():
+            print(f"\n📊 {set_name} ({len(paths)} image(s)):")
+            results = {mode: measure_in_subprocess(paths, fast, args.repeats)
+                       for mode, fast in (('full', False), ('fast', True))}
+            for mode, result in results.items():
+                print(f"   {mode:>4}: {result['seconds_per_image'] * 1000:8.1f} ms/image, "
+                      f"peak RSS +{result['peak_rss_delta_mb']:.1f} MB")
+            speedup = results['full']['seconds_per_image'] / results['fast']['seconds_per_image']
+            print(f"   ⚡ Speedup: {speedup:.1f}x")
+
+    mean_diff, max_diff = preprocessing_difference([path for path, _ in samples])
+    print(f"\n🔬 Input tensor difference (normalised units): mean {mean_diff:.4f}, max {max_diff:.4f}")
+
+    counts = accuracy_check(samples, args.model)
+    if counts:
+        total = counts['total']
+        print(f"🎯 Accuracy on {args.data}: full {counts['full_correct'] / total:.2%}, "
+              f"fast {counts['fast_correct'] / total:.2%}, agreement {counts['agree'] / total:.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark the frozen TorchScript export against the eager model
+Reports startup time (fresh interpreter: import + load + first forward pass),
+steady-state latency per batch size and the output difference between the two.
+Exports the checkpoint first if no up-to-date frozen module exists.
+
+Usage: python benchmarks/benchmark_frozen.py [--model models/mangrove_model.pth] [--batch-sizes 1 8]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+import config
+
+def load(mode, model_path):
+    """(model, checkpoint metadata) for one mode"""
+    from export_model import build_eager_model, load_frozen
+    if mode == 'frozen':
+        loaded = load_frozen(model_path, 'cpu')
+        if loaded is None:
+            raise RuntimeError("No up-to-date frozen export")
+        return loaded
+    return build_eager_model(model_path, 'cpu')
+
+def worker(args):
+    """Measure one mode in a fresh interpreter so startup includes imports and loading"""
+    start = time.perf_counter()
+    import torch
+    model, metadata = load(args.worker, args.model)
+    input_size = metadata['input_size']
+    with torch.no_grad():
+        model(torch.zeros(1, 3, *input_size))
+    startup = time.perf_counter() - start
+
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, *input_size)
+            for _ in range(2):
+                model(batch)
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                model(batch)
+            latencies[batch_size] = (time.perf_counter() - start) / args.repeats
+    print(json.dumps({'startup_seconds': startup, 'latency_seconds': latencies}))
+
+def measure_in_subprocess(mode, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', mode, '--model', args.model,
+               '--repeats', str(args.repeats), '--batch-sizes'] + [str(b) for b in args.batch_sizes]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def output_difference(model_path, batch_size=4):
+    import torch
+    from architectures import logits
+    (eager, metadata), (frozen, _) = load('eager', model_path), load('frozen', model_path)
+    batch = torch.randn(batch_size, 3, *metadata['input_size'])
+    with torch.no_grad():
+        eager_out, frozen_out = logits(eager(batch)), logits(frozen(batch))
+    agree = (eager_out.argmax(1) == frozen_out.argmax(1)).float().mean().item()
+    return (eager_out - frozen_out).abs().max().item(), agree
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(ROOT, config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--worker', choices=['eager', 'frozen'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    from export_model import load_frozen, export_frozen
+    try:
+        if load_frozen(args.model, 'cpu') is None:
+            print("🧊 Exporting frozen module...")
+            export_frozen(args.model, 'cpu')
+    except Exception as e:
+        print(f"❌ Could not export {args.model}: {str(e).splitlines()[0]}")
+        sys.exit(1)
+
+    print("🧊 Frozen vs Eager Benchmark")
+    print("=" * 50)
+    results = {mode: measure_in_subprocess(mode, args) for mode in ('eager', 'frozen')}
+
+    print(f"\n🚀 Startup (import + load + first pass):")
+    for mode, result in results.items():
+        print(f"   {mode:>6}: {result['startup_seconds']:.2f} s")
+
+    print(f"\n⏱️  Latency:")
+    for batch_size in args.batch_sizes:
+        eager = results['eager']['latency_seconds'][str(batch_size)]
+        frozen = results['frozen']['latency_seconds'][str(batch_size)]
+        print(f"   batch {batch_size:>3}: eager {eager * 1000:8.1f} ms, frozen {frozen * 1000:8.1f} ms "
+              f"({eager / frozen:.2f}x)")
+
+    max_diff, agree = output_difference(args.model)
+    print(f"\n🔬 Max logit difference: {max_diff:.2e}, prediction agreement: {agree:.0%}")
+
+if __name__ == "__main__":
+    main()
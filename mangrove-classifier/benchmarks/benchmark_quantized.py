@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Compare the INT8 quantized model against fp32
+Reports accuracy and prediction agreement on data/test, latency per batch size,
+peak memory (fresh interpreter per model) and file size, and saves the report
+as `<model>.int8.report.json` next to the checkpoint.
+
+Usage: python benchmarks/benchmark_quantized.py [--data data/test] [--model models/mangrove_model.pth]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+import config
+from benchmark_decode import list_images, peak_rss, reset_peak_rss
+
+def load(mode, model_path):
+    """(model, checkpoint metadata) for one mode"""
+    if mode == 'int8':
+        from quantize_model import load_quantized
+        loaded = load_quantized(model_path)
+        if loaded is None:
+            raise RuntimeError("No up-to-date INT8 model, run src/quantize_model.py first")
+        return loaded
+    from export_model import build_eager_model
+    return build_eager_model(model_path, 'cpu')
+
+def worker(args):
+    """Latency and peak memory of one model in a fresh interpreter"""
+    import torch
+    baseline = reset_peak_rss()
+    model, metadata = load(args.worker, args.model)
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, *metadata['input_size'])
+            for _ in range(2):
+                model(batch)
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                model(batch)
+            latencies[batch_size] = (time.perf_counter() - start) / args.repeats
+    print(json.dumps({'latency_seconds': latencies, 'peak_rss_delta_mb': (peak_rss() - baseline) / 1024}))
+
+def measure_in_subprocess(mode, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', mode, '--model', args.model,
+               '--repeats', str(args.repeats), '--batch-sizes'] + [str(b) for b in args.batch_sizes]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def accuracy(samples, model_path):
+    """Accuracy of both models and how often they agree, on labelled samples"""
+    import torch
+    from architectures import logits
+    from quantize_model import calibration_batches
+    loaded = {mode: load(mode, model_path) for mode in ('fp32', 'int8')}
+    models = {mode: model for mode, (model, _) in loaded.items()}
+    metadata = loaded['fp32'][1]
+    paths = [path for path, _ in samples]
+    predictions = {mode: [] for mode in models}
+    with torch.no_grad():
+        for batch in calibration_batches(paths, 16, metadata):
+            for mode, model in models.items():
+                predictions[mode].extend(logits(model(batch)).argmax(1).tolist())
+
+    labels = [label for _, label in samples]
+    counts = {'total': len(samples),
+              'agree': sum(a == b for a, b in zip(predictions['fp32'], predictions['int8']))}
+    for mode, predicted in predictions.items():
+        counts[f'{mode}_correct'] = sum(metadata['classes'][p] == label for p, label in zip(predicted, labels))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(ROOT, config.TEST_DIR))
+    parser.add_argument('--model', default=os.path.join(ROOT, config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--worker', choices=['fp32', 'int8'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    from quantize_model import quantized_path
+    if not os.path.exists(quantized_path(args.model)):
+        print(f"❌ {quantized_path(args.model)} not found, run src/quantize_model.py first")
+        sys.exit(1)
+
+    print("🔢 INT8 vs FP32 Report")
+    print("=" * 50)
+    report = {'model': args.model, 'data': args.data,
+              'file_size_mb': {'fp32': os.path.getsize(args.model) / 2**20,
+                               'int8': os.path.getsize(quantized_path(args.model)) / 2**20}}
+    report.update({mode: measure_in_subprocess(mode, args) for mode in ('fp32', 'int8')})
+
+    print(f"\n💾 Size on disk: fp32 {report['file_size_mb']['fp32']:.1f} MB, int8 {report['file_size_mb']['int8']:.1f} MB")
+    print(f"🧠 Peak RSS after load + inference: fp32 +{report['fp32']['peak_rss_delta_mb']:.0f} MB, "
+          f"int8 +{report['int8']['peak_rss_delta_mb']:.0f} MB")
+    print(f"⏱️  Latency:")
+    for batch_size in args.batch_sizes:
+        fp32 = report['fp32']['latency_seconds'][str(batch_size)]
+        int8 = report['int8']['latency_seconds'][str(batch_size)]
+        print(f"   batch {batch_size:>3}: fp32 {fp32 * 1000:8.1f} ms, int8 {int8 * 1000:8.1f} ms ({fp32 / int8:.2f}x)")
+
+    samples = list_images(args.data)
+    if samples:
+        counts = accuracy(samples, args.model)
+        report['accuracy'] = counts
+        total = counts['total']
+        print(f"🎯 Accuracy on {args.data} ({total} images): fp32 {counts['fp32_correct'] / total:.2%}, "
+              f"int8 {counts['int8_correct'] / total:.2%}, agreement {counts['agree'] / total:.2%}")
+    else:
+        print(f"⚠️  No images found in {args.data}, skipping the accuracy check")
+
+    report_path = os.path.splitext(args.model)[0] + '.int8.report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark model server startup
+Starts model_server.py in a fresh process and polls it: time until GET /health
+answers (liveness) and until GET /ready turns 200 (model loaded and warm at every
+batch size), plus the phases the server reports itself (imports, load, warm-up).
+Extra server settings are passed as KEY=VALUE environment variables.
+
+Usage: python benchmarks/benchmark_startup.py [--repeats 3] [--env MODEL_BACKEND=onnx MODEL_WORKERS=2]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def probe(port, path):
+    """(status, JSON body) of a GET, or (None, None) while nothing is listening"""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=2) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    except (OSError, ValueError):
+        return None, None
+
+def measure(port, env, timeout):
+    """Start the server once; returns (seconds to live, seconds to ready, server-reported startup stats)"""
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'model_server.py')], cwd=ROOT,
+                              env=dict(os.environ, MODEL_PORT=str(port), **env),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with status {server.returncode}")
+            if live is None and probe(port, '/health')[0] == 200:
+                live = time.perf_counter() - start
+            if live is not None:
+                status, body = probe(port, '/ready')
+                if status == 200:
+                    return live, time.perf_counter() - start, body
+            time.sleep(0.02)
+        raise TimeoutError(f"Server not ready after {timeout:g}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5091)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--env', nargs='*', default=[], help='server settings as KEY=VALUE')
+    args = parser.parse_args()
+    env = dict(item.split('=', 1) for item in args.env)
+
+    print("🚀 Startup Benchmark" + (f" ({' '.join(args.env)})" if args.env else ""))
+    print("=" * 50)
+    print(f"{'run':>3} {'live s':>7} {'ready s':>8} {'imports':>8} {'load':>7} {'warm-up':>8}")
+    for run in range(1, args.repeats + 1):
+        live, ready, stats = measure(args.port, env, args.timeout)
+        seconds = stats['seconds']
+        print(f"{run:>3} {live:>7.2f} {ready:>8.2f} {seconds['imports']:>8.2f} {seconds['load']:>7.2f} "
+              f"{seconds['warm_up']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
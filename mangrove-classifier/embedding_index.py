@@ -0,0 +1,471 @@
+"""
+Embedding index for nearest-neighbour lookup of previously classified images
+Every classified image's penultimate-layer embedding is appended to a float16
+matrix on disk (memory-mapped for search) with one JSON line of metadata per
+row. Search is exact while the index is small; beyond that an inverted-file
+(IVF) index of k-means clusters is built in the background and only the
+closest clusters plus the rows appended since the last build are scanned.
+
+Post-ReLU embeddings all point into the same orthant, so raw cosine similarity
+is high for unrelated images. Each index is therefore calibrated on a labelled
+sample first (calibrate()): vectors are centred on the sample's mean before
+being L2-normalised, and the similarities of distinct and of cross-class sample
+pairs are kept so callers can set thresholds that mean something for this model.
+
+Layout of one index directory (one per model version, since embeddings of
+different checkpoints are not comparable):
+    index.json    {"dim": D, "mean": [...], "calibration": {...}}
+    vectors.f16   float16 rows, appended
+    rows.jsonl    one metadata object per row, appended in the same order
+    ivf.npz       clusters of the first `built` rows (rebuilt in the background)
+Appends take an exclusive file lock, so pre-forked workers can share a directory.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (start_model_server.bat / .ps1): byte-range locks from msvcrt instead of flock
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+DIM_FILE = 'index.json'
+VECTORS_FILE = 'vectors.f16'
+ROWS_FILE = 'rows.jsonl'
+IVF_FILE = 'ivf.npz'
+LOCK_FILE = '.lock'
+BUILD_LOCK_FILE = '.build.lock'
+
+
+def lock_file(f, blocking=True):
+    """Exclusive lock on an open lock file; raises BlockingIOError if `blocking` is off and it is taken"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK gives up after ~10 s of retries, so keep waiting like flock does
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if not blocking:
+                raise BlockingIOError("lock is held by another process")
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def normalize(vectors):
+    """float32 copy of `vectors` (N, D) with unit-length rows"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def calibration_stats(vectors, labels, quantile=0.99):
+    """
+    Mean of a labelled sample of embeddings plus the `quantile` of centred cosine
+    similarity over its pairs of distinct images and over its cross-class pairs
+    (None with a single class)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.asarray(labels)
+    mean = vectors.mean(axis=0)
+    centred = normalize(vectors - mean)
+    similarities = centred @ centred.T
+    pairs = np.triu(np.ones(similarities.shape, dtype=bool), k=1)
+    cross = pairs & (labels[:, None] != labels[None, :])
+    return {
+        'mean': mean.tolist(),
+        'calibration': {
+            'images': len(vectors),
+            'quantile': quantile,
+            'distinct_similarity': float(np.quantile(similarities[pairs], quantile)),
+            'cross_class_similarity': float(np.quantile(similarities[cross], quantile)) if cross.any() else None
+        }
+    }
+
+
+def spherical_kmeans(vectors, k, iterations=10, seed=0):
+    """Cluster unit vectors by cosine similarity; returns (k, D) unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = (vectors @ centroids.T).argmax(axis=1)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=k)
+        used = counts > 0
+        sums = np.empty_like(centroids)
+        # Per-cluster sums over the rows grouped by cluster
+        sums[used] = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[used])
+        # Re-seed empty clusters from random points so every list stays in use
+        sums[~used] = vectors[rng.choice(len(vectors), size=int((~used).sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(vectors, centroids, chunk_size=8192):
+    """Closest centroid of every row, computed in chunks to bound memory"""
+    return np.concatenate([
+        (normalize(vectors[start:start + chunk_size]) @ centroids.T).argmax(axis=1)
+        for start in range(0, len(vectors), chunk_size)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+class IVF:
+    """Inverted lists: row ids grouped by closest centroid"""
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @property
+    def built(self):
+        return len(self.order)
+
+    @classmethod
+    def build(cls, vectors, points_per_list=64, seed=0):
+        count = len(vectors)
+        # ~sqrt(N) lists, each trained on up to `points_per_list` sampled rows
+        nlist = max(1, min(4096, int(math.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, size=min(count, points_per_list * nlist), replace=False))
+        centroids = spherical_kmeans(normalize(vectors[sample]), nlist, seed=seed)
+        assignment = assign(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+        return cls(centroids, order, offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['order'], data['offsets'])
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, order=self.order, offsets=self.offsets)
+        # Atomic replace so other processes never load a half-written index
+        os.replace(tmp_path, path)
+
+    def candidates(self, query, nprobe):
+        """Row ids in the `nprobe` lists closest to a unit query vector"""
+        nprobe = min(nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in closest])
+
+
+class EmbeddingIndex:
+    """
+    Append-only embedding store with approximate nearest-neighbour search.
+    `rebuild_fraction`: rebuild the IVF lists once the unindexed tail exceeds
+    this fraction of the indexed rows. Below `min_ivf_rows` search is exact.
+    """
+    def __init__(self, root_dir, nprobe=8, min_ivf_rows=4096, rebuild_fraction=0.2):
+        self.root_dir = root_dir
+        self.nprobe = nprobe
+        self.min_ivf_rows = min_ivf_rows
+        self.rebuild_fraction = rebuild_fraction
+        self.model_version = None
+        self.directory = None
+        self.rebuilds = 0
+        self.last_rebuild_seconds = None
+        self._lock = threading.RLock()
+        self._builder = None
+        self._reset()
+
+    def _reset(self):
+        self.dim = None
+        self.mean = None
+        self.calibration = None
+        self._rows = []
+        self._row_of = {}
+        self._rows_offset = 0
+        self._vectors = None
+        self._ivf = None
+        self._ivf_mtime = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def calibrated(self):
+        """Whether this version's index has its centring mean (see calibrate)"""
+        with self._lock:
+            if self.directory is not None and self.dim is None:
+                self._refresh()
+            return self.mean is not None
+
+    def _centre(self, embedding):
+        return normalize(np.asarray(embedding, dtype=np.float32) - self.mean)
+
+    def calibrate(self, vectors, labels, quantile=0.99):
+        """
+        Set this version's centring mean and similarity statistics from a labelled
+        sample of embeddings (at least two). A version is calibrated once; an index
+        written before calibration existed (no mean) stays uncalibrated.
+        Returns the calibration dict.
+        """
+        with self._lock:
+            if self.directory is None:
+                raise RuntimeError("Embedding index has no model version")
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(LOCK_FILE), 'a') as lock:
+                lock_file(lock)
+                try:
+                    self._refresh()
+                    if self.dim is None:
+                        metadata = dict(calibration_stats(vectors, labels, quantile), dim=len(vectors[0]))
+                        tmp_path = f"{self._path(DIM_FILE)}.{os.getpid()}.tmp"
+                        with open(tmp_path, 'w') as f:
+                            json.dump(metadata, f)
+                        os.replace(tmp_path, self._path(DIM_FILE))
+                        self._refresh()
+                finally:
+                    unlock_file(lock)
+            return self.calibration
+
+    def set_model_version(self, model_version):
+        """Embeddings are only comparable within one checkpoint, so each version gets its own index"""
+        with self._lock:
+            if model_version == self.model_version:
+                return
+            self.model_version = model_version
+            self.directory = os.path.join(self.root_dir, model_version)
+            self._reset()
+
+    # --- reading ---------------------------------------------------------
+
+    def _refresh(self):
+        """Pick up rows appended (by this or another process) and a newer IVF file"""
+        if self.dim is None:
+            try:
+                with open(self._path(DIM_FILE)) as f:
+                    metadata = json.load(f)
+                self.dim = metadata['dim']
+            except (OSError, ValueError, KeyError):
+                return
+            if metadata.get('mean') is not None:
+                self.mean = np.asarray(metadata['mean'], dtype=np.float32)
+                self.calibration = metadata.get('calibration')
+            else:
+                logger.warning(f"Embedding index {self.directory} predates calibration (uncentred vectors); "
+                               f"delete it to index this model version again")
+        try:
+            with open(self._path(ROWS_FILE), 'rb') as f:
+                f.seek(self._rows_offset)
+                data = f.read()
+        except OSError:
+            data = b''
+        # Only complete lines; a concurrent append may still be writing the last one
+        end = data.rfind(b'\n') + 1
+        if end:
+            for line in data[:end].splitlines():
+                row = json.loads(line)
+                self._row_of.setdefault(row.get('image_hash'), len(self._rows))
+                self._rows.append(row)
+            self._rows_offset += end
+
+        count = min(len(self._rows), self._vector_rows())
+        if count and (self._vectors is None or len(self._vectors) != count):
+            self._vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float16, mode='r',
+                                      shape=(count, self.dim))
+
+        try:
+            mtime = os.stat(self._path(IVF_FILE)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._ivf_mtime:
+            self._ivf_mtime = mtime
+            self._ivf = IVF.load(self._path(IVF_FILE)) if mtime is not None else None
+
+    def _vector_rows(self):
+        try:
+            return os.path.getsize(self._path(VECTORS_FILE)) // (2 * self.dim)
+        except OSError:
+            return 0
+
+    def __len__(self):
+        with self._lock:
+            if self.directory is None:
+                return 0
+            self._refresh()
+            return 0 if self._vectors is None else len(self._vectors)
+
+    def vector(self, image_hash):
+        """Stored (float32, centred and unit-length) embedding of a previously added image, or None"""
+        with self._lock:
+            if self.directory is None:
+                return None
+            self._refresh()
+            row = self._row_of.get(image_hash)
+            if row is None or self._vectors is None or row >= len(self._vectors):
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def search(self, embedding, k=5, centred=False):
+        """
+        Up to `k` most similar stored images, most similar first, as their row
+        metadata plus 'row' and 'similarity'. `centred`: the embedding is a stored
+        vector from vector(), already centred and normalised.
+        """
+        with self._lock:
+            if self.directory is None:
+                return []
+            self._refresh()
+            vectors, rows, ivf = self._vectors, self._rows, self._ivf
+        if vectors is None or self.mean is None or self.dim != len(embedding):
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32) if centred else self._centre(embedding)
+        count = len(vectors)
+        if ivf is None or ivf.built > count:
+            candidates = np.arange(count)
+        else:
+            # Closest clusters of the indexed rows plus everything appended since the last build
+            candidates = np.concatenate([ivf.candidates(query, self.nprobe), np.arange(ivf.built, count)])
+            candidates.sort()
+        if not len(candidates):
+            return []
+
+        similarities = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        top = np.argsort(-similarities)[:k]
+        return [dict(rows[candidates[i]], row=int(candidates[i]), similarity=float(similarities[i]))
+                for i in top]
+
+    # --- writing ---------------------------------------------------------
+
+    def add(self, embedding, **info):
+        """Append one embedding with its metadata (the index must be calibrated); returns its row id"""
+        with self._lock:
+            if self.directory is None:
+                raise RuntimeError("Embedding index has no model version")
+            if not self.calibrated:
+                raise RuntimeError("Embedding index is not calibrated")
+            vector = self._centre(embedding).astype(np.float16)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(LOCK_FILE), 'a') as lock:
+                lock_file(lock)
+                try:
+                    row = self._append(vector, info)
+                finally:
+                    unlock_file(lock)
+        self._maybe_rebuild(row + 1)
+        return row
+
+    def _append(self, vector, info):
+        if len(vector) != self.dim:
+            raise ValueError(f"Embedding has {len(vector)} dimensions, index has {self.dim}")
+
+        self._refresh()
+        row = len(self._rows)
+        # A writer that died between the two appends leaves an extra vector: drop it
+        with open(self._path(VECTORS_FILE), 'ab') as f:
+            if self._vector_rows() != row:
+                f.truncate(row * 2 * self.dim)
+            f.write(vector.tobytes())
+        with open(self._path(ROWS_FILE), 'a') as f:
+            f.write(json.dumps(dict(info, time=info.get('time', time.time()))) + '\n')
+        return row
+
+    # --- background rebuild ----------------------------------------------
+
+    def _maybe_rebuild(self, count):
+        built = self._ivf.built if self._ivf is not None else 0
+        if count < self.min_ivf_rows or count - built <= self.rebuild_fraction * built:
+            return
+        with self._lock:
+            if self._builder is not None and self._builder.is_alive():
+                return
+            self._builder = threading.Thread(target=self.rebuild, name='embedding-index-rebuild', daemon=True)
+            self._builder.start()
+
+    def rebuild(self):
+        """Re-cluster every stored row; searches keep using the previous lists meanwhile"""
+        with self._lock:
+            if self.directory is None:
+                return False
+            self._refresh()
+            vectors, directory = self._vectors, self.directory
+        if vectors is None:
+            return False
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, BUILD_LOCK_FILE), 'a') as lock:
+            try:
+                # Another process is already rebuilding this index
+                lock_file(lock, blocking=False)
+            except BlockingIOError:
+                return False
+            try:
+                start = time.perf_counter()
+                ivf = IVF.build(vectors)
+                ivf.save(os.path.join(directory, IVF_FILE))
+                self.last_rebuild_seconds = time.perf_counter() - start
+                self.rebuilds += 1
+                logger.info(f"Embedding index rebuilt: {ivf.built} rows in {len(ivf.centroids)} lists "
+                            f"({self.last_rebuild_seconds:.2f}s)")
+                return True
+            finally:
+                unlock_file(lock)
+
+    def stats(self):
+        with self._lock:
+            if self.directory is not None:
+                self._refresh()
+            count = 0 if self._vectors is None else len(self._vectors)
+            return {
+                'model_version': self.model_version,
+                'rows': count,
+                'dim': self.dim,
+                'calibration': self.calibration,
+                'indexed_rows': self._ivf.built if self._ivf is not None else 0,
+                'lists': len(self._ivf.centroids) if self._ivf is not None else 0,
+                'rebuilding': self._builder is not None and self._builder.is_alive(),
+                'rebuilds': self.rebuilds,
+                'last_rebuild_seconds': self.last_rebuild_seconds
+            }
+
+
+def knn_vote(neighbours, min_similarity, min_votes):
+    """
+    Similarity-weighted vote of the neighbours at least `min_similarity` away;
+    returns (mangrove probability, number of votes), or None with fewer than
+    `min_votes` close neighbours
+    """
+    close = [n for n in neighbours if n['similarity'] >= min_similarity]
+    if len(close) < max(1, min_votes):
+        return None
+    weights = np.array([n['similarity'] for n in close])
+    votes = np.array([1.0 if n['is_mangrove'] else 0.0 for n in close])
+    return float((weights * votes).sum() / weights.sum()), len(close)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect or rebuild an embedding index directory")
+    parser.add_argument('directory', help='index directory, e.g. models/embeddings/<model_version>')
+    parser.add_argument('--rebuild', action='store_true', help='re-cluster the IVF lists now')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    root, version = os.path.split(os.path.normpath(args.directory))
+    index = EmbeddingIndex(root, min_ivf_rows=1)
+    index.set_model_version(version)
+    if args.rebuild:
+        index.rebuild()
+    print(json.dumps(index.stats(), indent=2))
@@ -4,17 +4,37 @@ Provides a REST API for the Node.js application to use
 """
 
 import os
+import gc
 import sys
+import json
 import time
-from flask import Flask, request, jsonify
+# Startup phases are reported relative to this point (see Startup)
+PROCESS_STARTED = time.perf_counter()
+import signal
+import socket
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import torch
-import torch.nn as nn
-from torchvision import transforms, models
-from PIL import Image
-import requests
+import numpy as np
 from io import BytesIO
 import logging
+import mmap
+from contextlib import contextmanager
+from prediction_cache import PredictionCache, hash_bytes
+from embedding_index import EmbeddingIndex, knn_vote
+from metrics import Registry, BATCH_SIZE_BUCKETS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# Shared inference helpers live in src/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+import config
+from image_io import ImageTooLarge, load_rgb
+from backends import (BACKENDS, EXPORT_SUFFIXES, ONNX_METADATA, PRECISIONS, TorchBackend, checkpoint_sha256,
+                      export_metadata, export_path, load_onnx)
+from autotune import load_tuning, tuning_key
+from tiling import SceneTooLarge
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,65 +43,488 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# Image fetching: bounded concurrency over a shared keep-alive connection pool
+FETCH_CONCURRENCY = int(os.environ.get('MODEL_FETCH_CONCURRENCY', '8'))
+FETCH_TIMEOUT = float(os.environ.get('MODEL_FETCH_TIMEOUT', '10'))
+
+# Prediction cache keyed by image bytes + model version (MODEL_CACHE_SIZE=0 disables it)
+CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', '1024'))
+CACHE_TTL = float(os.environ.get('MODEL_CACHE_TTL', '3600'))
+CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', '')
+
+# Embedding index: keep the penultimate-layer embedding of every classified image (per model
+# version) for near-duplicate detection and "similar past reports". Off unless MODEL_EMBEDDINGS=1:
+# the index grows by one row per classified image and is never pruned.
+# Each model version's index is calibrated on up to MODEL_EMBEDDING_CALIBRATION_IMAGES labelled images
+# (class = folder name) before use: embeddings are centred on their mean, and the similarity thresholds
+# below are raised to what distinct (near duplicates) or cross-class (kNN) calibration pairs reach.
+# MODEL_KNN_VOTE=1 lets a vote of at least MODEL_KNN_K stored neighbours with cosine similarity
+# >= MODEL_KNN_MIN_SIMILARITY decide instead of the classification head; it stays off until the
+# calibration images cover more than one class.
+EMBEDDINGS = os.environ.get('MODEL_EMBEDDINGS', '0') == '1'
+EMBEDDING_DIR = os.environ.get('MODEL_EMBEDDING_DIR',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'embeddings'))
+EMBEDDING_CALIBRATION_DIR = os.environ.get('MODEL_EMBEDDING_CALIBRATION_DIR',
+                                           os.path.join(os.path.dirname(os.path.abspath(__file__)), config.TEST_DIR))
+EMBEDDING_CALIBRATION_IMAGES = int(os.environ.get('MODEL_EMBEDDING_CALIBRATION_IMAGES', '64'))
+NEAR_DUPLICATE_SIMILARITY = float(os.environ.get('MODEL_NEAR_DUPLICATE_SIMILARITY', '0.97'))
+KNN_VOTE = os.environ.get('MODEL_KNN_VOTE', '0') == '1'
+KNN_K = int(os.environ.get('MODEL_KNN_K', '5'))
+KNN_MIN_SIMILARITY = float(os.environ.get('MODEL_KNN_MIN_SIMILARITY', '0.9'))
+MAX_SIMILAR = 50
+
+# Local files are only read from below this root (the Node server's upload folder)
+UPLOAD_ROOT = os.path.realpath(os.environ.get(
+    'MODEL_UPLOAD_ROOT',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server', 'public', 'uploads')))
+MAX_UPLOAD_MB = float(os.environ.get('MODEL_MAX_UPLOAD_MB', '20'))
+
+# Decode JPEGs at reduced scale near the 224x224 input (and bound pixels for other formats)
+FAST_DECODE = os.environ.get('MODEL_FAST_DECODE', '1' if config.FAST_DECODE else '0') == '1'
+
+# Serve the INT8 model from src/quantize_model.py (CPU only; falls back to fp32 if it is missing)
+QUANTIZED = os.environ.get('MODEL_QUANTIZED', '1' if config.QUANTIZED else '0') == '1'
+
+# Inference backend: 'torch', or 'onnx' for the src/export_onnx.py export under ONNX Runtime.
+# The onnx backend never imports torch unless it has to fall back (missing/stale export).
+BACKEND = os.environ.get('MODEL_BACKEND', config.BACKEND)
+if BACKEND not in BACKENDS:
+    raise ValueError(f"MODEL_BACKEND must be one of {BACKENDS}, got {BACKEND!r}")
+
+# Torch precision: 'auto' serves the eager model under bf16 autocast (channels_last) when the CPU has
+# native bf16 units, 'bf16' forces that, 'fp32' disables it. bf16 is only served if, on a sample of
+# MODEL_PRECISION_CHECK_DIR images, no probability moves by more than MODEL_PRECISION_TOLERANCE
+# from fp32; the check runs on every (re)load. bf16 gets its own model version (cache namespace).
+# Unlike MangroveClassifier (config.PRECISION), the server defaults to 'auto'.
+PRECISION = os.environ.get('MODEL_PRECISION', 'auto')
+if PRECISION not in ('auto',) + PRECISIONS:
+    raise ValueError(f"MODEL_PRECISION must be one of {('auto',) + PRECISIONS}, got {PRECISION!r}")
+PRECISION_TOLERANCE = float(os.environ.get('MODEL_PRECISION_TOLERANCE', config.PRECISION_TOLERANCE))
+PRECISION_CHECK_DIR = os.environ.get('MODEL_PRECISION_CHECK_DIR',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), config.TEST_DIR))
+
+# Host-specific settings measured by src/autotune.py (models/mangrove_model.autotune.json) are
+# the defaults for the batch size, thread pools and memory format; MODEL_* variables override them
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'mangrove_model.pth')
+TUNING = load_tuning(MODEL_PATH, tuning_key(BACKEND, QUANTIZED)) or {}
+
+# Micro-batching: group /classify requests arriving within the window into one forward pass
+BATCH_WINDOW_MS = float(os.environ.get('MODEL_BATCH_WINDOW_MS', '10'))
+MAX_BATCH_SIZE = int(os.environ.get('MODEL_MAX_BATCH_SIZE', TUNING.get('batch_size', 16)))
+
+# Readiness: GET /ready answers 503 until the model is loaded and has run every batch size the
+# scheduler can form (MODEL_WARM_BATCH_SIZES, comma-separated, narrows the list); reloads warm the
+# same sizes. GET /health is the liveness probe and answers as soon as the process is listening.
+WARM_BATCH_SIZES = (tuple(int(size) for size in os.environ.get('MODEL_WARM_BATCH_SIZES', '').split(',') if size.strip())
+                    or tuple(range(1, MAX_BATCH_SIZE + 1)))
+PORT = int(os.environ.get('MODEL_PORT', '5001'))
+PRETRAINED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), config.PRETRAINED_DIR)
+
+# Run torch models on NHWC (channels_last) inputs
+CHANNELS_LAST = os.environ.get('MODEL_CHANNELS_LAST', '1' if TUNING.get('channels_last') else '0') == '1'
+
+# Admission control: at most MODEL_MAX_QUEUE images admitted at once; beyond that requests get
+# 503 + Retry-After. Callers may send X-Request-Timeout-Ms (relative) or X-Request-Deadline
+# (unix seconds) so work they have given up on is dropped before the forward pass (504).
+# The limit applies per worker process.
+MAX_QUEUE = int(os.environ.get('MODEL_MAX_QUEUE', '64'))
+RETRY_AFTER_SECONDS = int(os.environ.get('MODEL_RETRY_AFTER', '1'))
+
+# Hot reload: poll the checkpoint every MODEL_RELOAD_INTERVAL seconds (0 disables the watcher).
+# POST /admin/reload triggers a reload explicitly; set MODEL_ADMIN_TOKEN to require X-Admin-Token.
+RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '5'))
+ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN', '')
+
+# Pre-fork serving: N worker processes share one copy of the weights.
+# Each worker gets MODEL_TORCH_THREADS intra-op threads, torch or ONNX Runtime (default: the tuned
+# count for a single process, else cores / workers) and MODEL_INTEROP_THREADS torch inter-op threads.
+# A reload happens in the parent, which then replaces the workers so the new weights are shared too;
+# replaced workers get MODEL_DRAIN_SECONDS to finish the requests they have admitted.
+WORKERS = max(1, int(os.environ.get('MODEL_WORKERS', '1')))
+DRAIN_SECONDS = float(os.environ.get('MODEL_DRAIN_SECONDS', '30'))
+TORCH_THREADS = (int(os.environ.get('MODEL_TORCH_THREADS', '0'))
+                 or (TUNING.get('threads', 0) if WORKERS == 1 else 0)
+                 or max(1, (os.cpu_count() or 1) // WORKERS))
+INTEROP_THREADS = int(os.environ.get('MODEL_INTEROP_THREADS', TUNING.get('interop_threads', 0)))
+
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+# Prometheus metrics (per process; with MODEL_WORKERS > 1 each scrape sees one worker)
+registry = Registry()
+STAGE_LATENCY = registry.histogram('mangrove_stage_seconds',
+                                   'Time spent in each pipeline stage (fetch, decode, transform, inference, index, serialize)',
+                                   ['stage'])
+BATCH_SIZES = registry.histogram('mangrove_batch_size', 'Number of images per forward pass',
+                                 buckets=BATCH_SIZE_BUCKETS)
+ERRORS = registry.counter('mangrove_errors_total', 'Failed image classifications by exception type', ['type'])
+REJECTED = registry.counter('mangrove_rejected_total', 'Images refused (queue full) or dropped (deadline passed)',
+                            ['reason'])
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before the image reached the forward pass"""
+
+class QueueFull(Exception):
+    """Admission control refused the request"""
+
+def check_deadline(deadline):
+    """Raise DeadlineExceeded if a monotonic deadline has passed"""
+    if deadline is not None and time.monotonic() >= deadline:
+        REJECTED.inc(reason='deadline')
+        raise DeadlineExceeded("Request deadline exceeded")
+
+def remaining_time(deadline, default=None):
+    """Seconds left before a monotonic deadline, capped at `default`"""
+    if deadline is None:
+        return default
+    remaining = max(0.0, deadline - time.monotonic())
+    return remaining if default is None else min(default, remaining)
+
+class AdmissionController:
+    """Counts admitted images and refuses new work once `capacity` are in flight"""
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+    
+    def try_acquire(self, count=1):
+        with self._lock:
+            # A batch larger than the whole capacity is still admitted when idle
+            if self.in_flight and self.in_flight + count > self.capacity:
+                return False
+            self.in_flight += count
+            return True
+    
+    def release(self, count=1):
+        with self._lock:
+            self.in_flight -= count
+    
+    def acquire(self, count=1):
+        """Admit `count` images or raise QueueFull"""
+        if not self.try_acquire(count):
+            REJECTED.inc(count, reason='queue_full')
+            raise QueueFull(f"Server busy: {self.in_flight} images in flight (limit {self.capacity})")
+    
+    @contextmanager
+    def admit(self, count=1):
+        self.acquire(count)
+        try:
+            yield
+        finally:
+            self.release(count)
+
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+
+def resolve_upload_path(image_path):
+    """
+    Map a local path onto UPLOAD_ROOT, refusing anything that resolves outside it.
+    Accepts absolute paths, paths relative to the root, and the `/uploads/<name>`
+    form the Node server stores on reports.
+    """
+    if os.path.isabs(image_path) and not image_path.startswith('/uploads/'):
+        candidate = os.path.realpath(image_path)
+    else:
+        relative = image_path.lstrip('/\\')
+        if relative.startswith('uploads/'):
+            relative = relative[len('uploads/'):]
+        candidate = os.path.realpath(os.path.join(UPLOAD_ROOT, relative))
+    
+    if os.path.commonpath([UPLOAD_ROOT, candidate]) != UPLOAD_ROOT:
+        raise PermissionError(f"Path is outside the upload root: {image_path}")
+    if not os.path.isfile(candidate):
+        raise FileNotFoundError(f"Image not found: {image_path}")
+    return candidate
+
+def get_http_session():
+    """Return this process's pooled requests.Session (recreated after fork)"""
+    global _http_session, _http_session_pid
+    with _http_session_lock:
+        if _http_session is None or _http_session_pid != os.getpid():
+            # Imported on first fetch: local-file and upload traffic never needs it
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=FETCH_CONCURRENCY,
+                                                    pool_maxsize=FETCH_CONCURRENCY)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+            _http_session_pid = os.getpid()
+        return _http_session
+
 class MangroveClassifier:
     def __init__(self, model_path=None):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = None
-        self.transform = None
+        self._device = None
         self.is_loaded = False
+        # (backend, version) is swapped as one reference so readers never see a mix
+        self._active = (None, None)
         
-        # Initialize transform
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                               std=[0.229, 0.224, 0.225])
-        ])
-        
-        # Try to load model
-        if model_path and os.path.exists(model_path):
+        if model_path:
+            self.load(model_path)
+    
+    def load(self, model_path):
+        """Load the checkpoint, or the fallback model if there is none"""
+        if os.path.exists(model_path):
             self.load_model(model_path)
         else:
             self.create_fallback_model()
     
+    @property
+    def backend(self):
+        return self._active[0]
+    
+    @property
+    def model_version(self):
+        return self._active[1]
+    
+    @property
+    def model_format(self):
+        return self.backend.model_format if self.backend is not None else None
+    
+    @property
+    def device(self):
+        """Torch device, resolved on first use so the onnx backend never imports torch"""
+        if self.backend is not None and self.backend.name == 'onnx':
+            return 'cpu'
+        if self._device is None:
+            import torch
+            # Quantized kernels are CPU-only
+            self._device = torch.device('cuda' if torch.cuda.is_available() and not QUANTIZED else 'cpu')
+        return self._device
+    
     def create_fallback_model(self):
         """Create a fallback model for demonstration"""
+        import torch.nn as nn
+        from architectures import build_model
         logger.warning("Creating fallback model - not trained on actual mangrove data")
         
-        # Use a pretrained ResNet and adapt it
-        self.model = models.resnet50(pretrained=True)
-        self.model.fc = nn.Linear(self.model.fc.in_features, 2)  # Binary classification
+        # Use a pretrained ResNet and adapt it; only vendored weights, startup never downloads
+        model = build_model('resnet50', 2, pretrained=True, download=False, weights_dir=PRETRAINED_DIR)
         
         # Initialize with random weights for the final layer
-        nn.init.xavier_uniform_(self.model.fc.weight)
+        nn.init.xavier_uniform_(model.fc.weight)
         
-        self.model = self.model.to(self.device)
-        self.model.eval()
+        model = model.to(self.device)
+        model.eval()
+        # The fc layer is randomly initialised, so every fallback instance is its own version
+        self._active = (TorchBackend(model, self.device), f"fallback-{os.urandom(4).hex()}")
         self.is_loaded = True
         logger.info("Fallback model created (accuracy will be limited)")
     
+    def build_model(self, model_path):
+        """
+        Build a backend from a checkpoint without touching the active one; returns
+        (backend, version). backend.model_format is 'onnx', 'int8', 'frozen' or 'eager'.
+        """
+        # Identify the checkpoint by content so caches follow it across retrains
+        digest = checkpoint_sha256(model_path)
+        version = digest[:16]
+        
+        if BACKEND == 'onnx':
+            backend = load_onnx(model_path, digest, intra_op_threads=TORCH_THREADS)
+            if backend is not None:
+                logger.info(f"Using ONNX Runtime with {export_path(model_path, 'onnx')}")
+                return backend, version
+            logger.warning("MODEL_BACKEND=onnx but there is no up-to-date ONNX export; falling back to torch")
+        
+        from architectures import load_checkpoint, with_embedding
+        from export_model import load_frozen
+        from quantize_model import load_quantized
+        from precision import resolve_precision, check_bf16
+        
+        if QUANTIZED:
+            quantized = load_quantized(model_path, digest)
+            if quantized is not None:
+                logger.info(f"Using INT8 model {export_path(model_path, 'int8')}")
+                module, metadata = quantized
+                # INT8 outputs differ slightly from fp32, so they get their own cache namespace
+                return TorchBackend(module, self.device, 'int8', metadata, CHANNELS_LAST), f"{version}-int8"
+            logger.warning("MODEL_QUANTIZED is set but there is no up-to-date INT8 model; serving fp32")
+        
+        # bf16 autocast runs the eager model: a frozen graph's fp32 constants gain little from it
+        if str(self.device) == 'cpu' and resolve_precision(PRECISION) == 'bf16':
+            model, metadata = load_checkpoint(model_path, self.device)
+            model = with_embedding(model, metadata['arch']).eval()
+            backend = TorchBackend(model, self.device, 'eager', metadata, precision='bf16')
+            passed, message = check_bf16(backend, PRECISION_CHECK_DIR, tolerance=PRECISION_TOLERANCE)
+            if passed:
+                logger.info(f"Serving {metadata['arch']} in bf16 ({message})")
+                return backend, f"{version}-bf16"
+            logger.warning(f"bf16 self-check failed ({message})")
+        
+        # A frozen export of this exact checkpoint skips eager construction and runs fused ops
+        frozen = load_frozen(model_path, self.device, digest)
+        if frozen is not None:
+            logger.info(f"Using frozen export {export_path(model_path, 'frozen')}")
+            module, metadata = frozen
+            return TorchBackend(module, self.device, 'frozen', metadata, CHANNELS_LAST), version
+        
+        # The checkpoint names its architecture (older bare state_dicts are recognised by their weights)
+        model, metadata = load_checkpoint(model_path, self.device)
+        logger.info(f"Built {metadata['arch']} for classes {metadata['classes']}")
+        model = with_embedding(model, metadata['arch']).eval()
+        return TorchBackend(model, self.device, 'eager', metadata, CHANNELS_LAST), version
+    
     def load_model(self, model_path):
         """Load a trained model"""
         try:
             logger.info(f"Loading model from {model_path}")
-            
-            # Create model architecture
-            self.model = models.resnet50(pretrained=False)
-            self.model.fc = nn.Linear(self.model.fc.in_features, 2)
-            
-            # Load weights
-            state_dict = torch.load(model_path, map_location=self.device)
-            self.model.load_state_dict(state_dict)
-            
-            self.model = self.model.to(self.device)
-            self.model.eval()
+            self._active = self.build_model(model_path)
             self.is_loaded = True
-            logger.info("Model loaded successfully")
+            logger.info(f"Model loaded successfully (version {self.model_version})")
             
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             self.create_fallback_model()
     
+    def reload(self, model_path, warm_batch_sizes=(1,)):
+        """
+        Load and warm a new checkpoint, then swap it in atomically. In-flight
+        batches keep the model they started with. On failure the old model stays.
+        """
+        backend, version = self.build_model(model_path)
+        backend.warm_up(warm_batch_sizes)
+        self._active = (backend, version)
+        self.is_loaded = True
+        logger.info(f"Swapped in model version {version}")
+        return version
+    
+    def usable_export(self, model_path, model_format, digest):
+        """Whether build_model would use the `model_format` export of `model_path` (content hash `digest`)"""
+        metadata = export_metadata(export_path(model_path, model_format))
+        if metadata.get('source_sha256') != digest:
+            return False
+        if model_format == 'onnx':
+            return ONNX_METADATA in metadata
+        device = 'cpu' if model_format == 'int8' else str(self.device).split(':')[0]
+        return bool(metadata.get('checkpoint')) and metadata.get('device') == device
+    
+    def is_current(self, model_path, digest):
+        """Whether loading `model_path` (content hash `digest`) would give back the active model"""
+        # Exports are matched on the checkpoint hash they record: a stale one next to the
+        # checkpoint is skipped by build_model, so it must not count as a change here
+        if BACKEND == 'onnx' and self.usable_export(model_path, 'onnx', digest):
+            expected = (digest[:16], 'onnx')
+        elif QUANTIZED and self.usable_export(model_path, 'int8', digest):
+            expected = (f"{digest[:16]}-int8", 'int8')
+        elif self.model_version == f"{digest[:16]}-bf16":
+            # bf16 comes next; whether it passes its self-check is only known after loading
+            return True
+        elif self.usable_export(model_path, 'frozen', digest):
+            expected = (digest[:16], 'frozen')
+        else:
+            expected = (digest[:16], 'eager')
+        return (self.model_version, self.model_format) == expected
+    
+    def share_memory(self):
+        """Prepare the active backend for forking workers (torch weights move to shared memory)"""
+        if self.backend is not None:
+            self.backend.share_memory()
+    
+    @contextmanager
+    def open_source(self, image_url, deadline=None):
+        """
+        Yield the raw encoded image as a buffer: downloaded bytes for URLs, or a
+        read-only mmap of the file for local paths under UPLOAD_ROOT (no copy).
+        """
+        check_deadline(deadline)
+        fetch_start = time.perf_counter()
+        if image_url.startswith('http'):
+            response = get_http_session().get(image_url, timeout=remaining_time(deadline, FETCH_TIMEOUT))
+            response.raise_for_status()
+            STAGE_LATENCY.observe(time.perf_counter() - fetch_start, stage='fetch')
+            yield response.content
+            return
+        
+        path = resolve_upload_path(image_url)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Empty image file: {image_url}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                STAGE_LATENCY.observe(time.perf_counter() - fetch_start, stage='fetch')
+                yield mapped
+    
+    def decode_image(self, data):
+        """Decode an encoded image buffer (bytes or mmap) into an RGB PIL image"""
+        with STAGE_LATENCY.time(stage='decode'):
+            if isinstance(data, mmap.mmap):
+                # mmap is file-like, so PIL can decode straight from the mapping
+                data.seek(0)
+                source = data
+            else:
+                source = BytesIO(data)
+            return load_rgb(source, target_size=self.backend.input_size, fast=FAST_DECODE)
+    
+    def load_image(self, image_url):
+        """Fetch or open an image and return it as an RGB PIL image"""
+        with self.open_source(image_url) as data:
+            return self.decode_image(data)
+    
+    def preprocess(self, image):
+        """
+        Resize and normalize a single image into a float32 (3, H, W) array (no batch
+        dimension) with the input size and normalization the active model was trained with
+        """
+        with STAGE_LATENCY.time(stage='transform'):
+            return self.backend.preprocess(image)
+    
+    def predict_tensors(self, batch):
+        """
+        Run one forward pass over a stacked (N, 3, H, W) batch.
+        Returns ({class name: probability} per image, (N, D) embeddings or None,
+        version of the model that produced them).
+        """
+        if not self.is_loaded:
+            raise Exception("Model not loaded")
+        
+        backend, version = self._active
+        with STAGE_LATENCY.time(stage='inference'):
+            probabilities, embeddings = backend.forward(batch)
+        # Label by the checkpoint's own class order rather than assuming an index layout
+        return [dict(zip(backend.classes, row)) for row in probabilities.tolist()], embeddings, version
+    
+    def build_result(self, probabilities, image_size, start_time, model_version=None):
+        """Turn one image's {class name: probability} into the API response dict"""
+        if isinstance(probabilities, list):
+            # Cache entries written before rows were labelled are in config.CLASS_NAMES order
+            probabilities = dict(zip(config.CLASS_NAMES, probabilities))
+        mangrove = probabilities['mangrove']
+        non_mangrove = probabilities.get('non-mangrove', 1.0 - mangrove)
+        is_mangrove = mangrove > non_mangrove
+        confidence_score = mangrove if is_mangrove else non_mangrove
+        model_version = model_version or self.model_version
+        
+        # For fallback model, adjust confidence and add some randomness based on image characteristics
+        if model_version.startswith('fallback-'):
+            # Simple heuristic for fallback
+            confidence_score = min(0.7, confidence_score)  # Cap confidence for untrained model
+            
+            # Add some logic based on image characteristics
+            # This is a very basic approximation
+            width, height = image_size
+            aspect_ratio = width / height
+            
+            # Mangroves often appear in landscape format near water
+            if aspect_ratio > 1.2:  # Landscape
+                confidence_score *= 1.1
+            
+            # Ensure confidence is reasonable for demonstration
+            confidence_score = max(0.3, min(0.8, confidence_score))
+        
+        processing_time = time.time() - start_time
+        
+        return {
+            'is_mangrove': is_mangrove,
+            'confidence': confidence_score,
+            'probabilities': {
+                'non_mangrove': non_mangrove,
+                'mangrove': mangrove
+            },
+            'processing_time_seconds': processing_time,
+            'model_type': self.backend.metadata['arch'],
+            'model_version': model_version
+        }
+    
     def predict(self, image_url):
         """Predict if image contains mangrove"""
         if not self.is_loaded:
@@ -90,108 +533,723 @@ class MangroveClassifier:
         start_time = time.time()
         
         try:
-            # Load image
-            if image_url.startswith('http'):
-                response = requests.get(image_url, timeout=10)
-                image = Image.open(BytesIO(response.content))
-            else:
-                image = Image.open(image_url)
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Apply transform
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # Predict
-            with torch.no_grad():
-                outputs = self.model(image_tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-                confidence, predicted = torch.max(probabilities, 1)
-                
-                # predicted: 0 = non-mangrove, 1 = mangrove
-                is_mangrove = predicted.item() == 1
-                confidence_score = confidence.item()
-                
-                # For fallback model, adjust confidence and add some randomness based on image characteristics
-                if not hasattr(self, 'is_trained_model'):
-                    # Simple heuristic for fallback
-                    confidence_score = min(0.7, confidence_score)  # Cap confidence for untrained model
-                    
-                    # Add some logic based on image characteristics
-                    # This is a very basic approximation
-                    width, height = image.size
-                    aspect_ratio = width / height
-                    
-                    # Mangroves often appear in landscape format near water
-                    if aspect_ratio > 1.2:  # Landscape
-                        confidence_score *= 1.1
-                    
-                    # Ensure confidence is reasonable for demonstration
-                    confidence_score = max(0.3, min(0.8, confidence_score))
-                
-                processing_time = time.time() - start_time
-                
-                return {
-                    'is_mangrove': is_mangrove,
-                    'confidence': confidence_score,
-                    'probabilities': {
-                        'non_mangrove': probabilities[0][0].item(),
-                        'mangrove': probabilities[0][1].item()
-                    },
-                    'processing_time_seconds': processing_time,
-                    'model_type': 'ResNet50'
-                }
+            image = self.load_image(image_url)
+            rows, _, version = self.predict_tensors(self.preprocess(image)[None])
+            return self.build_result(rows[0], image.size, start_time, version)
                 
         except Exception as e:
             logger.error(f"Prediction failed: {e}")
             raise e
 
-# Initialize classifier
-model_path = os.path.join(os.path.dirname(__file__), 'models', 'mangrove_model.pth')
-classifier = MangroveClassifier(model_path)
+class ModelReloader:
+    """
+    Watches the checkpoint file and hot-swaps the classifier's model when its
+    content changes. A change is only acted on once the file has stopped changing
+    for one poll interval, so a checkpoint that is still being written is skipped.
+    In a pre-forked worker (`parent_pid` set) nothing is watched and reloads are
+    handed to the parent, which reloads once and forks new workers.
+    """
+    def __init__(self, classifier, model_path, interval=5.0, on_swap=None, warm_batch_sizes=(1,)):
+        self.classifier = classifier
+        self.model_path = model_path
+        self.interval = interval
+        self.on_swap = on_swap
+        self.warm_batch_sizes = warm_batch_sizes
+        self.last_error = None
+        self.last_reload_at = None
+        self._reload_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+        self.parent_pid = None
+        self._seen = self._signature()
+    
+    def _signature(self):
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        # Writing (or deleting) any export (frozen, INT8, ONNX) also counts as a change
+        exports = []
+        for path in (export_path(self.model_path, model_format) for model_format in EXPORT_SUFFIXES):
+            try:
+                export = os.stat(path)
+                exports.append((export.st_mtime_ns, export.st_size))
+            except OSError:
+                exports.append(None)
+        return (stat.st_mtime_ns, stat.st_size, tuple(exports))
+    
+    @property
+    def in_progress(self):
+        return self._reload_lock.locked()
+    
+    def ensure_started(self):
+        """Start the watcher thread in this process (threads do not survive fork)"""
+        if self.interval <= 0 or self.parent_pid is not None:
+            return
+        if self._watcher is not None and self._watcher.is_alive() and self._watcher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._watcher is None or not self._watcher.is_alive() or self._watcher_pid != os.getpid():
+                self._watcher_pid = os.getpid()
+                self._watcher = threading.Thread(target=self._watch, name='model-reloader', daemon=True)
+                self._watcher.start()
+    
+    def reload(self, force=False):
+        """Reload the checkpoint if its content changed; returns a status dict"""
+        if self.parent_pid is not None:
+            # SIGHUP: reload if changed, SIGUSR1: reload regardless (see serve_prefork)
+            os.kill(self.parent_pid, signal.SIGUSR1 if force else signal.SIGHUP)
+            return {'status': 'forwarded', 'model_version': self.classifier.model_version}
+        if not self._reload_lock.acquire(blocking=False):
+            return {'status': 'in_progress', 'model_version': self.classifier.model_version}
+        try:
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Checkpoint not found: {self.model_path}")
+            if not force and self.classifier.is_current(self.model_path, checkpoint_sha256(self.model_path)):
+                return {'status': 'unchanged', 'model_version': self.classifier.model_version}
+            
+            previous = self.classifier.model_version
+            version = self.classifier.reload(self.model_path, self.warm_batch_sizes)
+            if self.on_swap:
+                self.on_swap(version)
+            self.last_error = None
+            self.last_reload_at = time.time()
+            return {'status': 'reloaded', 'model_version': version, 'previous_version': previous}
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Model reload failed, keeping version {self.classifier.model_version}: {e}")
+            return {'status': 'failed', 'error': str(e), 'model_version': self.classifier.model_version}
+        finally:
+            self._reload_lock.release()
+    
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            signature = self._signature()
+            if signature is None or signature == self._seen:
+                pending = None
+                continue
+            if signature != pending:
+                # Changed since the last poll: wait for the writer to finish
+                pending = signature
+                continue
+            self._seen = signature
+            pending = None
+            logger.info(f"Checkpoint {self.model_path} changed, reloading")
+            self.reload()
+    
+    def stats(self):
+        return {
+            'watching': self.interval > 0,
+            'interval_seconds': self.interval,
+            'in_progress': self.in_progress,
+            'last_reload_at': self.last_reload_at,
+            'last_error': self.last_error
+        }
+
+class Startup:
+    """
+    Loads and warms the model on a background thread so the process can answer
+    liveness probes while it starts. `ready` is set once the model has run every
+    batch size in `warm_batch_sizes`; the time each phase took is kept for /health.
+    """
+    def __init__(self, classifier, model_path, warm_batch_sizes=(1,), on_ready=None):
+        self.classifier = classifier
+        self.model_path = model_path
+        self.warm_batch_sizes = warm_batch_sizes
+        self.on_ready = on_ready
+        self.ready = threading.Event()
+        self.phase = 'starting'
+        self.seconds = {}
+        self.error = None
+        self._thread = None
+    
+    def start(self):
+        self.seconds['imports'] = time.perf_counter() - PROCESS_STARTED
+        self._thread = threading.Thread(target=self.run, name='model-startup', daemon=True)
+        self._thread.start()
+    
+    def wait(self, timeout=None):
+        """Block until startup finished (or failed); returns whether the model is ready"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready.is_set()
+    
+    def run(self):
+        try:
+            self.phase = 'loading'
+            start = time.perf_counter()
+            self.classifier.load(self.model_path)
+            self.seconds['load'] = time.perf_counter() - start
+            # Size the thread pools before the warm-up so it runs the way requests will
+            configure_threads(TORCH_THREADS)
+            
+            self.phase = 'warming'
+            start = time.perf_counter()
+            self.classifier.backend.warm_up(self.warm_batch_sizes)
+            self.seconds['warm_up'] = time.perf_counter() - start
+            
+            if self.on_ready:
+                self.on_ready(self.classifier.model_version)
+            self.seconds['ready'] = time.perf_counter() - PROCESS_STARTED
+            self.phase = 'ready'
+            self.ready.set()
+            logger.info(f"Ready in {self.seconds['ready']:.2f}s (imports {self.seconds['imports']:.2f}s, "
+                        f"load {self.seconds['load']:.2f}s, warm-up of batch sizes "
+                        f"{min(self.warm_batch_sizes)}-{max(self.warm_batch_sizes)} {self.seconds['warm_up']:.2f}s)")
+        except Exception as e:
+            self.phase = 'failed'
+            self.error = str(e)
+            logger.error(f"Startup failed: {e}")
+    
+    def stats(self):
+        return {
+            'ready': self.ready.is_set(),
+            'phase': self.phase,
+            'seconds': dict(self.seconds),
+            'error': self.error
+        }
+
+class BatchScheduler:
+    """
+    Micro-batching queue in front of the classifier.
+    Requests that arrive within `window_ms` of the first queued one (up to
+    `max_batch_size`) are stacked and run through a single forward pass.
+    """
+    def __init__(self, classifier, max_batch_size=16, window_ms=10):
+        self.classifier = classifier
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+    
+    def _ensure_started(self):
+        # Threads do not survive fork(), so (re)start lazily in whichever process submits
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._worker_pid != os.getpid():
+                self.queue = queue.Queue()
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+                self._worker.start()
+    
+    def submit(self, image_tensor, deadline=None):
+        """Queue a preprocessed (C, H, W) tensor; returns a Future resolving to its probability row"""
+        return self.submit_many([image_tensor], deadline)[0]
+    
+    def submit_many(self, image_tensors, deadline=None):
+        """
+        Queue several tensors back to back so they land in the same batch where possible.
+        Items whose monotonic `deadline` has passed when their batch forms are dropped.
+        """
+        self._ensure_started()
+        futures = []
+        for image_tensor in image_tensors:
+            future = Future()
+            self.queue.put((image_tensor, future, deadline))
+            futures.append(future)
+        return futures
+    
+    def predict(self, image_tensor, deadline=None):
+        """Blocking convenience wrapper around submit(); gives up at the deadline"""
+        future = self.submit(image_tensor, deadline)
+        try:
+            return future.result(timeout=remaining_time(deadline))
+        except FutureTimeoutError:
+            future.cancel()
+            REJECTED.inc(reason='deadline')
+            raise DeadlineExceeded("Request deadline exceeded while queued")
+    
+    def _collect(self):
+        batch = [self.queue.get()]
+        window_end = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = window_end - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = []
+            now = time.monotonic()
+            for tensor, future, deadline in self._collect():
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now >= deadline:
+                    # The caller has given up; skip the forward pass for this image
+                    REJECTED.inc(reason='deadline')
+                    future.set_exception(DeadlineExceeded("Request deadline exceeded while queued"))
+                    continue
+                batch.append((tensor, future))
+            if not batch:
+                continue
+            futures = [future for _, future in batch]
+            BATCH_SIZES.observe(len(batch))
+            try:
+                rows, embeddings, version = self.classifier.predict_tensors(np.stack([tensor for tensor, _ in batch]))
+                for i, (future, row) in enumerate(zip(futures, rows)):
+                    future.set_result({'probabilities': row, 'batch_size': len(rows), 'model_version': version,
+                                       'embedding': embeddings[i] if embeddings is not None else None})
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for future in futures:
+                    future.set_exception(e)
+
+# The classifier is loaded by `startup` (started at the end of this module)
+model_path = MODEL_PATH
+classifier = MangroveClassifier()
+
+scheduler = BatchScheduler(classifier, max_batch_size=MAX_BATCH_SIZE, window_ms=BATCH_WINDOW_MS)
+cache = PredictionCache(max_entries=CACHE_SIZE, ttl_seconds=CACHE_TTL, disk_dir=CACHE_DIR)
+embeddings = EmbeddingIndex(EMBEDDING_DIR) if EMBEDDINGS else None
+admission = AdmissionController(MAX_QUEUE)
+
+def calibrate_embeddings():
+    """Calibrate the active version's embedding index on labelled images, unless it already is"""
+    from precision import sample_images
+    if embeddings.calibrated:
+        return
+    paths = sample_images(EMBEDDING_CALIBRATION_DIR, EMBEDDING_CALIBRATION_IMAGES)
+    if len(paths) < 2:
+        logger.warning(f"Fewer than 2 images in {EMBEDDING_CALIBRATION_DIR} to calibrate embeddings with; "
+                       f"the embedding index stays off")
+        return
+    backend = classifier.backend
+    vectors = []
+    for start in range(0, len(paths), 8):
+        batch = np.stack([backend.preprocess(load_rgb(path, target_size=backend.input_size))
+                          for path in paths[start:start + 8]])
+        embedding = backend.forward(batch)[1]
+        if embedding is None:
+            return
+        vectors.append(embedding)
+    labels = [os.path.basename(os.path.dirname(path)) for path in paths]
+    calibration = embeddings.calibrate(np.concatenate(vectors), labels)
+    logger.info(f"Embedding index calibrated on {calibration['images']} images: distinct pairs reach "
+                f"{calibration['distinct_similarity']:.3f}, cross-class pairs {calibration['cross_class_similarity']}")
+
+def neighbour_thresholds():
+    """
+    (near-duplicate, kNN) similarity thresholds of the active index: the configured
+    ones raised to its calibration; the kNN one is None (no vote) without cross-class pairs
+    """
+    calibration = embeddings.calibration
+    near_duplicate = max(NEAR_DUPLICATE_SIMILARITY, calibration['distinct_similarity'])
+    cross_class = calibration['cross_class_similarity']
+    return near_duplicate, (None if cross_class is None else max(KNN_MIN_SIMILARITY, cross_class))
+
+def on_model_swap(version):
+    """Predictions and embeddings of the previous model don't apply to the new one"""
+    cache.set_model_version(version)
+    if embeddings is not None:
+        embeddings.set_model_version(version)
+        try:
+            calibrate_embeddings()
+        except Exception as e:
+            logger.warning(f"Embedding calibration failed, the embedding index stays off: {e}")
+
+startup = Startup(classifier, model_path, WARM_BATCH_SIZES, on_ready=on_model_swap)
+reloader = ModelReloader(classifier, model_path, interval=RELOAD_INTERVAL, on_swap=on_model_swap,
+                         warm_batch_sizes=WARM_BATCH_SIZES)
+
+registry.gauge('mangrove_queue_depth', 'Images waiting in the batch scheduler queue',
+               lambda: scheduler.queue.qsize())
+registry.gauge('mangrove_admitted_images', 'Images admitted and not yet answered',
+               lambda: admission.in_flight)
+registry.counter_callback('mangrove_cache_hits_total', 'Prediction cache hits', lambda: cache.hits)
+registry.counter_callback('mangrove_cache_misses_total', 'Prediction cache misses', lambda: cache.misses)
+registry.gauge('mangrove_cache_hit_ratio', 'Prediction cache hits / lookups since start',
+               lambda: cache.stats()['hit_rate'])
+registry.gauge('mangrove_ready', '1 once the model is loaded and warm at every batch size',
+               lambda: int(startup.ready.is_set()))
+registry.gauge('mangrove_startup_seconds', 'Seconds from process start until ready',
+               lambda: startup.seconds.get('ready', float('nan')))
+if embeddings is not None:
+    registry.gauge('mangrove_embedding_rows', 'Embeddings stored for the active model version',
+                   lambda: len(embeddings))
+
+def json_response(payload, status=200):
+    """jsonify with the serialisation time recorded"""
+    with STAGE_LATENCY.time(stage='serialize'):
+        response = jsonify(payload)
+    return response, status
+
+# Probes and metrics are answered while the model is still loading
+PROBE_ENDPOINTS = {'health_check', 'readiness', 'metrics'}
+
+@app.before_request
+def start_background_threads():
+    """Background threads are started lazily so each pre-forked worker gets its own"""
+    reloader.ensure_started()
+
+@app.before_request
+def require_ready():
+    """Everything but the probes gets 503 + Retry-After until startup has finished"""
+    if not startup.ready.is_set() and request.endpoint not in PROBE_ENDPOINTS:
+        return overload_response(f"Model is still starting ({startup.phase})")
+
+def cached_result(image_hash, start_time, similar=0):
+    """Build a response from the prediction cache, or return None on a miss"""
+    hit = cache.get(image_hash)
+    if hit is None:
+        return None
+    result = classifier.build_result(hit['probabilities'], hit['image_size'], start_time, cache.model_version)
+    result['cached'] = True
+    if embeddings is not None and (similar or KNN_VOTE) and embeddings.calibrated:
+        # Neighbours come from the embedding stored when the image was first classified
+        embedding = embeddings.vector(image_hash)
+        if embedding is not None:
+            with STAGE_LATENCY.time(stage='index'):
+                apply_neighbours(result, image_hash, embedding, similar, centred=True)
+    return result
+
+def request_deadline():
+    """
+    Monotonic deadline from X-Request-Timeout-Ms (relative) or X-Request-Deadline
+    (absolute unix seconds), or None when the caller sent neither.
+    """
+    try:
+        timeout_ms = request.headers.get('X-Request-Timeout-Ms')
+        if timeout_ms:
+            return time.monotonic() + float(timeout_ms) / 1000.0
+        deadline = request.headers.get('X-Request-Deadline')
+        if deadline:
+            return time.monotonic() + (float(deadline) - time.time())
+    except ValueError:
+        logger.warning("Ignoring malformed request deadline header")
+    return None
+
+def overload_response(error):
+    """503 with Retry-After so well-behaved clients back off instead of piling on"""
+    logger.warning(str(error))
+    response = jsonify({'error': str(error), 'is_mangrove': False, 'confidence': 0.0})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+def requested_similar(data=None):
+    """Number of similar past images to return, from a `similar` JSON field or query parameter"""
+    value = (data or {}).get('similar', request.args.get('similar', 0))
+    try:
+        return max(0, min(MAX_SIMILAR, int(value)))
+    except (TypeError, ValueError):
+        return 0
+
+def neighbour_summary(neighbour):
+    return {key: neighbour.get(key) for key in ('image_hash', 'source', 'similarity', 'is_mangrove', 'time')}
+
+def fresh_result(image_hash, image_size, batched, start_time, source=None, similar=0):
+    """
+    Response for an image that just went through the model: cache it, look up
+    its nearest stored neighbours and store its embedding
+    """
+    cache.put(image_hash, {'probabilities': batched['probabilities'], 'image_size': list(image_size)},
+              batched['model_version'])
+    result = classifier.build_result(batched['probabilities'], image_size, start_time, batched['model_version'])
+    result['batch_size'] = batched['batch_size']
+    result['cached'] = False
+    
+    embedding = batched.get('embedding')
+    # Skip models without embeddings and batches that ran on a model that has since been swapped out
+    if (embeddings is None or embedding is None or batched['model_version'] != embeddings.model_version
+            or not embeddings.calibrated):
+        return result
+    with STAGE_LATENCY.time(stage='index'):
+        # Stored labels are always the head's own, so kNN votes never feed back into later votes
+        stored = {'image_hash': image_hash, 'source': source, 'is_mangrove': result['is_mangrove'],
+                  'mangrove': result['probabilities']['mangrove']}
+        apply_neighbours(result, image_hash, embedding, similar, stored)
+    return result
+
+def apply_neighbours(result, image_hash, embedding, similar=0, stored=None, centred=False):
+    """
+    Add near-duplicate / similar-image information and the optional kNN vote to
+    a result. With `stored` (row metadata) the embedding is also appended,
+    unless this exact image is already in the index. `centred`: the embedding
+    came from the index (EmbeddingIndex.vector).
+    """
+    near_duplicate, knn_similarity = neighbour_thresholds()
+    neighbours = embeddings.search(embedding, max(similar, KNN_K, 1) + 1, centred=centred)
+    # The same image classified before (e.g. after a cache eviction) is not a neighbour of itself
+    others = [n for n in neighbours if n['image_hash'] != image_hash]
+    if stored is not None and len(others) == len(neighbours):
+        embeddings.add(embedding, **stored)
+    
+    if others and others[0]['similarity'] >= near_duplicate:
+        result['near_duplicate_of'] = neighbour_summary(others[0])
+    if similar:
+        result['similar'] = [neighbour_summary(n) for n in others[:similar]]
+    if KNN_VOTE:
+        vote = knn_vote(others, knn_similarity, KNN_K) if knn_similarity is not None else None
+        if vote is not None:
+            mangrove, votes = vote
+            result.update({'is_mangrove': mangrove > 0.5, 'confidence': max(mangrove, 1.0 - mangrove),
+                           'decision': 'knn', 'knn': {'mangrove': mangrove, 'votes': votes}})
+        else:
+            result['decision'] = 'head'
+
+def classify_bytes(data, start_time, deadline=None, source=None, similar=0):
+    """Classify an encoded image buffer through the cache and the batch scheduler"""
+    image_hash = hash_bytes(data)
+    result = cached_result(image_hash, start_time, similar)
+    if result is not None:
+        return result
+    
+    check_deadline(deadline)
+    image = classifier.decode_image(data)
+    tensor = classifier.preprocess(image)
+    batched = scheduler.predict(tensor, deadline)
+    return fresh_result(image_hash, image.size, batched, start_time, source, similar)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness probe and status; answers while the model is still loading (see /ready)"""
+    backend = classifier.backend
     return jsonify({
         'status': 'healthy',
+        'ready': startup.ready.is_set(),
+        'startup': startup.stats(),
         'model_loaded': classifier.is_loaded,
-        'device': str(classifier.device),
+        'device': str(classifier.device) if backend is not None else None,
         'model_info': {
-            'model_type': 'ResNet50',
-            'input_size': '224x224',
-            'classes': ['non_mangrove', 'mangrove']
-        }
+            'model_type': backend.metadata['arch'],
+            'input_size': 'x'.join(str(side) for side in backend.input_size),
+            'classes': backend.classes
+        } if backend is not None else None,
+        'model_version': classifier.model_version,
+        'model_format': classifier.model_format,
+        'precision': getattr(backend, 'precision', 'fp32') if backend is not None else None,
+        'batching': {
+            'max_batch_size': scheduler.max_batch_size,
+            'window_ms': scheduler.window * 1000.0
+        },
+        'threads': {
+            'intra_op': TORCH_THREADS,
+            'inter_op': INTEROP_THREADS or None,
+            'channels_last': CHANNELS_LAST,
+            'autotuned': bool(TUNING)
+        },
+        'admission': {
+            'in_flight': admission.in_flight,
+            'max_queue': admission.capacity
+        },
+        'cache': cache.stats(),
+        'embeddings': embeddings.stats() if embeddings is not None else None,
+        'reload': reloader.stats()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the model is loaded and warm, else 503"""
+    stats = startup.stats()
+    if stats['ready']:
+        return jsonify(stats)
+    response = jsonify(stats)
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Load the checkpoint in the background and swap it in once warm"""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Invalid admin token'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    force = bool(data.get('force'))
+    if data.get('wait') or reloader.parent_pid is not None:
+        result = reloader.reload(force=force)
+        status = {'failed': 500, 'forwarded': 202}.get(result['status'], 200)
+        return jsonify(result), status
+    
+    if reloader.in_progress:
+        return jsonify({'status': 'in_progress', 'model_version': classifier.model_version}), 202
+    threading.Thread(target=reloader.reload, kwargs={'force': force}, name='model-reload', daemon=True).start()
+    return jsonify({'status': 'reloading', 'model_version': classifier.model_version}), 202
+
 @app.route('/classify', methods=['POST'])
 def classify_image():
     """Classify an image as mangrove or non-mangrove"""
     try:
         data = request.get_json()
         
-        if not data or 'image_url' not in data:
+        # image_path is the explicit local-file form; local image_url values go through the same check
+        image_url = data and (data.get('image_url') or data.get('image_path'))
+        if not image_url:
             return jsonify({'error': 'Missing image_url parameter'}), 400
         
-        image_url = data['image_url']
         logger.info(f"Classifying image: {image_url}")
         
-        # Perform classification
-        result = classifier.predict(image_url)
+        # Perform classification (cached, or batched with any concurrent requests)
+        start_time = time.time()
+        deadline = request_deadline()
+        with admission.admit(), classifier.open_source(image_url, deadline) as source:
+            result = classify_bytes(source, start_time, deadline, image_url, requested_similar(data))
         
         logger.info(f"Classification result: {result['is_mangrove']} (confidence: {result['confidence']:.3f})")
         
-        return jsonify(result)
+        return json_response(result)
         
     except Exception as e:
-        logger.error(f"Classification error: {e}")
-        return jsonify({
-            'error': str(e),
-            'is_mangrove': False,
-            'confidence': 0.0
-        }), 500
+        return classification_error(e)
+
+@app.route('/classify-upload', methods=['POST'])
+def classify_upload():
+    """Classify an image sent as a multipart `image` file or as the raw request body"""
+    try:
+        start_time = time.time()
+        source = None
+        if 'image' in request.files:
+            source = request.files['image'].filename or None
+            data = request.files['image'].read()
+        elif request.mimetype.startswith('multipart/'):
+            return jsonify({'error': 'Missing image file field'}), 400
+        else:
+            data = request.get_data(cache=False)
+        
+        if not data:
+            return jsonify({'error': 'Empty image body'}), 400
+        
+        with admission.admit():
+            result = classify_bytes(data, start_time, request_deadline(), source,
+                                    requested_similar(request.form))
+        logger.info(f"Upload classification result: {result['is_mangrove']} (confidence: {result['confidence']:.3f})")
+        return json_response(result)
+        
+    except Exception as e:
+        return classification_error(e)
+
+def classification_error(error):
+    """Error response shared by the single-image endpoints"""
+    if isinstance(error, QueueFull):
+        return overload_response(error)
+    logger.error(f"Classification error: {error}")
+    ERRORS.inc(type=type(error).__name__)
+    status = (403 if isinstance(error, PermissionError) else 404 if isinstance(error, FileNotFoundError)
+              else 413 if isinstance(error, (ImageTooLarge, SceneTooLarge)) else 504 if isinstance(error, DeadlineExceeded)
+              else 500)
+    return jsonify({
+        'error': str(error),
+        'is_mangrove': False,
+        'confidence': 0.0
+    }), status
+
+def fetch_and_preprocess(image_url, start_time, deadline=None):
+    """
+    Download/open one image on the fetch pool. Returns (result, None) on a cache
+    hit, otherwise (None, (image_hash, size, tensor)) ready for inference.
+    """
+    with classifier.open_source(image_url, deadline) as data:
+        image_hash = hash_bytes(data)
+        result = cached_result(image_hash, start_time)
+        if result is not None:
+            return result, None
+        check_deadline(deadline)
+        image = classifier.decode_image(data)
+        return None, (image_hash, image.size, classifier.preprocess(image))
+
+def iter_classify_urls(image_urls, flush_size, deadline=None):
+    """
+    Classify a list of URLs, yielding (index, result) in completion order.
+    Downloads run concurrently over the pooled session, each image is decoded as
+    soon as it arrives, and decoded tensors are handed to the batch scheduler once
+    `flush_size` are pending (or no downloads remain), so inference overlaps the
+    remaining downloads. Errors are isolated per URL; once `deadline` passes,
+    images not yet decoded or batched fail with DeadlineExceeded.
+    """
+    start_time = time.time()
+    if not image_urls:
+        return
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(FETCH_CONCURRENCY, len(image_urls)))) as pool:
+        fetches = {pool.submit(fetch_and_preprocess, url, start_time, deadline): index
+                   for index, url in enumerate(image_urls)}
+        inflight = {}
+        pending = []
+        waiting = set(fetches)
+        
+        while waiting:
+            done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetches:
+                    index = fetches.pop(future)
+                    try:
+                        result, work = future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to load {image_urls[index]}: {e}")
+                        yield index, error_result(image_urls[index], e)
+                        continue
+                    if result is not None:
+                        result['image_url'] = image_urls[index]
+                        yield index, result
+                    else:
+                        pending.append((index,) + work)
+                    continue
+                
+                index, image_hash, size = inflight.pop(future)
+                try:
+                    result = fresh_result(image_hash, size, future.result(), start_time, image_urls[index])
+                    result['image_url'] = image_urls[index]
+                    yield index, result
+                except Exception as e:
+                    yield index, error_result(image_urls[index], e)
+            
+            if pending and (len(pending) >= flush_size or not fetches):
+                futures = scheduler.submit_many([tensor for _, _, _, tensor in pending], deadline)
+                for (index, image_hash, size, _), future in zip(pending, futures):
+                    inflight[future] = (index, image_hash, size)
+                    waiting.add(future)
+                pending.clear()
+
+def classify_urls(image_urls, deadline=None):
+    """Classify a list of URLs and return the results in input order"""
+    results = [None] * len(image_urls)
+    for index, result in iter_classify_urls(image_urls, scheduler.max_batch_size, deadline):
+        results[index] = result
+    return results
+
+def wants_stream(data):
+    """Streaming is opt-in via `"stream": true`, `?stream=1` or an NDJSON Accept header"""
+    if data.get('stream') is True:
+        return True
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+def stream_classify_urls(image_urls, deadline=None):
+    """NDJSON body: one line per image, in completion order, tagged with its input index"""
+    # Submit each image as soon as it is decoded; the scheduler still batches concurrent ones
+    for index, result in iter_classify_urls(image_urls, 1, deadline):
+        result['index'] = index
+        with STAGE_LATENCY.time(stage='serialize'):
+            line = json.dumps(result) + '\n'
+        yield line
+
+def error_result(image_url, error):
+    """Per-image error entry used by /batch-classify"""
+    ERRORS.inc(type=type(error).__name__)
+    return {
+        'image_url': image_url,
+        'error': str(error),
+        'is_mangrove': False,
+        'confidence': 0.0
+    }
 
 @app.route('/batch-classify', methods=['POST'])
 def batch_classify():
@@ -206,21 +1264,25 @@ def batch_classify():
         if not isinstance(image_urls, list):
             return jsonify({'error': 'image_urls must be a list'}), 400
         
-        results = []
-        for url in image_urls:
-            try:
-                result = classifier.predict(url)
-                result['image_url'] = url
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'image_url': url,
-                    'error': str(e),
-                    'is_mangrove': False,
-                    'confidence': 0.0
-                })
+        deadline = request_deadline()
+        try:
+            admission.acquire(len(image_urls))
+        except QueueFull as e:
+            return overload_response(e)
         
-        return jsonify({
+        if wants_stream(data):
+            # Admission is held until the stream has been fully sent (or the client went away)
+            response = Response(stream_with_context(stream_classify_urls(image_urls, deadline)),
+                                mimetype='application/x-ndjson')
+            response.call_on_close(lambda: admission.release(len(image_urls)))
+            return response
+        
+        try:
+            results = classify_urls(image_urls, deadline)
+        finally:
+            admission.release(len(image_urls))
+        
+        return json_response({
             'results': results,
             'total_processed': len(results)
         })
@@ -229,6 +1291,64 @@ def batch_classify():
         logger.error(f"Batch classification error: {e}")
         return jsonify({'error': str(e)}), 500
 
+class ScheduledTiles:
+    """
+    The backend interface tiling.classify_scene uses, with forward passes going
+    through the batch scheduler so tiles share batches (and model swaps) with
+    other traffic
+    """
+    def __init__(self, deadline=None):
+        self.input_size = classifier.backend.input_size
+        self.classes = classifier.backend.classes
+        self.deadline = deadline
+        self.model_versions = set()
+
+    def preprocess(self, image):
+        return classifier.preprocess(image)
+
+    def predict(self, batch):
+        futures = scheduler.submit_many(list(batch), self.deadline)
+        try:
+            results = [future.result(timeout=remaining_time(self.deadline)) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            REJECTED.inc(reason='deadline')
+            raise DeadlineExceeded("Request deadline exceeded while queued")
+        self.model_versions.update(result['model_version'] for result in results)
+        return np.array([[result['probabilities'][name] for name in self.classes] for result in results])
+
+@app.route('/classify-tiles', methods=['POST'])
+def classify_tiles():
+    """Tile a large local scene and return its mangrove probability grid and coverage"""
+    from tiling import classify_scene, open_scene
+    try:
+        data = request.get_json()
+        image_path = data and data.get('image_path')
+        if not image_path:
+            return jsonify({'error': 'Missing image_path parameter'}), 400
+
+        path = resolve_upload_path(image_path)
+        logger.info(f"Classifying tiles of: {image_path}")
+        deadline = request_deadline()
+        # At most one batch of tiles is queued at a time, so that is what the scene holds
+        with admission.admit(MAX_BATCH_SIZE):
+            scene = open_scene(path, data.get('bands'))
+            try:
+                tiles = ScheduledTiles(deadline)
+                result = classify_scene(tiles, scene, data.get('overlap'), data.get('scale'),
+                                        MAX_BATCH_SIZE, threshold=float(data.get('threshold', 0.5)))
+            finally:
+                scene.close()
+
+        result['grid'] = result['grid'].tolist()
+        result['model_version'] = ','.join(sorted(tiles.model_versions))
+        logger.info(f"Tiled {result['tiles']} tiles: coverage {result['coverage']:.3f}")
+        return json_response(result)
+
+    except Exception as e:
+        return classification_error(e)
+
 @app.route('/test', methods=['GET'])
 def test_model():
     """Test the model with a sample image"""
@@ -249,15 +1369,168 @@ def test_model():
             'message': 'Model test failed'
         }), 500
 
+def configure_threads(threads):
+    """Limit intra-op parallelism so workers don't oversubscribe the cores"""
+    # ONNX Runtime sessions get their thread count at creation (see build_model)
+    if 'torch' in sys.modules:
+        torch = sys.modules['torch']
+        torch.set_num_threads(threads)
+        if INTEROP_THREADS:
+            try:
+                torch.set_num_interop_threads(INTEROP_THREADS)
+            except RuntimeError:
+                logger.warning(f"Inter-op pool already started; MODEL_INTEROP_THREADS={INTEROP_THREADS} ignored")
+    logger.info(f"Worker {os.getpid()} using {threads} intra-op thread(s) ({classifier.model_format})")
+
+def probe_app(environ, start_response):
+    """Bare WSGI app answering probes from the pre-fork parent while the model starts"""
+    if environ.get('PATH_INFO') == '/health':
+        status, payload, headers = '200 OK', {'status': 'healthy', 'ready': False, 'startup': startup.stats()}, []
+    else:
+        status, payload = '503 Service Unavailable', {'error': f"Model is still starting ({startup.phase})"}
+        headers = [('Retry-After', str(RETRY_AFTER_SECONDS))]
+    body = json.dumps(payload).encode()
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))] + headers)
+    return [body]
+
+def serve_prefork(host, port, workers, threads):
+    """
+    Bind once, then fork `workers` processes that each run a threaded WSGI server
+    on the shared listening socket. The model is loaded before forking, so its
+    weights (moved to shared memory) are mapped by every worker rather than copied;
+    until then the parent answers probes itself. Dead workers are respawned until
+    the parent receives SIGINT/SIGTERM.
+    The parent also watches the checkpoint (and takes SIGHUP / SIGUSR1 from
+    /admin/reload in a worker). After it has swapped in a new model it forks a
+    fresh set of workers, so the new weights are shared as well, and the old
+    workers drain their admitted requests and exit.
+    """
+    from werkzeug.serving import make_server
+    
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+    
+    # The probe server works on a duplicate of the listening socket and is stopped before forking
+    probes = make_server(host, port, probe_app, threaded=True, fd=listener.fileno())
+    threading.Thread(target=probes.serve_forever, name='startup-probes', daemon=True).start()
+    ready = startup.wait()
+    probes.shutdown()
+    probes.server_close()
+    if not ready:
+        raise RuntimeError(f"Model startup failed: {startup.error}")
+    
+    def share():
+        classifier.share_memory()
+        # Keep the collector from touching (and so copying) pages shared with the workers
+        gc.collect()
+        gc.freeze()
+    
+    parent_pid = os.getpid()
+    
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGUSR1):
+                signal.signal(signum, signal.SIG_DFL)
+            reloader.parent_pid = parent_pid
+            configure_threads(threads)
+            server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+            # SIGTERM: stop accepting, then give admitted requests DRAIN_SECONDS to finish
+            signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+            server.serve_forever()
+            deadline = time.monotonic() + DRAIN_SECONDS
+            while admission.in_flight and time.monotonic() < deadline:
+                time.sleep(0.05)
+            os._exit(0)
+        return pid
+    
+    def terminate(pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    share()
+    children = {spawn() for _ in range(workers)}
+    retiring = set()
+    stopping = False
+    swapped = threading.Event()
+    
+    def on_swap(version):
+        on_model_swap(version)
+        swapped.set()
+    reloader.on_swap = on_swap
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        terminate(children)
+    
+    def request_reload(signum, frame):
+        threading.Thread(target=reloader.reload, kwargs={'force': signum == signal.SIGUSR1},
+                         name='model-reload', daemon=True).start()
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, request_reload)
+    signal.signal(signal.SIGUSR1, request_reload)
+    # Forked after the first workers, so they never inherit the watcher thread
+    reloader.ensure_started()
+    
+    while children or retiring:
+        if swapped.is_set() and not stopping:
+            swapped.clear()
+            share()
+            logger.info(f"Replacing {len(children)} workers to serve model version {classifier.model_version}")
+            retiring |= children
+            children = {spawn() for _ in range(workers)}
+            terminate(retiring)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            swapped.wait(0.5)
+            continue
+        if pid in retiring:
+            retiring.discard(pid)
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, respawning")
+            children.add(spawn())
+    
+    listener.close()
+
+# Load and warm the model in the background; the server starts listening meanwhile
+startup.start()
+
 if __name__ == '__main__':
     print("🌿 Starting Mangrove Classification Server")
-    print(f"📱 Device: {classifier.device}")
-    print(f"🤖 Model loaded: {classifier.is_loaded}")
+    print(f"⏳ Loading {model_path} in the background (GET /ready answers 200 once warm)")
+    print(f"🧮 Backend: {BACKEND}")
+    print(f"👷 Workers: {WORKERS} x {TORCH_THREADS} intra-op thread(s)")
+    if TUNING:
+        print(f"🔧 Autotuned: batch {TUNING.get('batch_size')}, channels_last={TUNING.get('channels_last')}")
     print("🔗 Available endpoints:")
-    print("   GET  /health - Health check")
+    print("   GET  /health - Liveness and status")
+    print("   GET  /ready - Readiness (model loaded and warm)")
     print("   POST /classify - Classify single image")
+    print("   POST /classify-upload - Classify an uploaded/raw image body")
     print("   POST /batch-classify - Classify multiple images")
+    print("   POST /classify-tiles - Probability grid and coverage of a large scene")
     print("   GET  /test - Test model")
-    print("🚀 Server starting on http://localhost:5001")
+    print("   GET  /metrics - Prometheus metrics")
+    print("   POST /admin/reload - Hot-reload the checkpoint")
+    print(f"🚀 Server starting on http://localhost:{PORT}")
     
-    app.run(host='0.0.0.0', port=5001, debug=False)
+    if WORKERS > 1 and hasattr(os, 'fork'):
+        serve_prefork('0.0.0.0', PORT, WORKERS, TORCH_THREADS)
+    else:
+        if WORKERS > 1:
+            logger.warning("Pre-fork workers need os.fork(); running a single process instead")
+        app.run(host='0.0.0.0', port=PORT, debug=False)
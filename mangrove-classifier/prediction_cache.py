@@ -0,0 +1,152 @@
+"""
+Content-addressed prediction cache for the model server
+Entries are keyed on a hash of the raw image bytes plus the identity of the
+loaded model, so a new checkpoint never serves stale predictions.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hash_bytes(data):
+    """SHA-256 hex digest of raw image bytes (any buffer: bytes, memoryview, mmap)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PredictionCache:
+    """
+    Two-tier LRU cache with a TTL.
+    The memory tier is an OrderedDict; the optional disk tier stores one JSON
+    file per entry under `disk_dir/<model_version>/` and survives restarts.
+    """
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_dir=None):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.model_version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def set_model_version(self, model_version):
+        """Switch namespaces when the checkpoint changes; older entries are dropped"""
+        with self._lock:
+            if model_version == self.model_version:
+                return
+            self.model_version = model_version
+            self._entries.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name != model_version:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def key(self, image_hash):
+        return f"{self.model_version}:{image_hash}"
+
+    def _disk_path(self, image_hash):
+        return os.path.join(self.disk_dir, self.model_version, image_hash[:2], f"{image_hash}.json")
+
+    def get(self, image_hash):
+        """Return the cached value for an image hash, or None"""
+        if not self.enabled:
+            return None
+        key = self.key(image_hash)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(image_hash, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def put(self, image_hash, value, model_version=None):
+        """
+        Store a JSON-serialisable value for an image hash. Values computed by a
+        model other than the current one (e.g. just before a reload) are dropped.
+        """
+        if not self.enabled:
+            return
+        if model_version is not None and model_version != self.model_version:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(self.key(image_hash), value, now)
+        self._disk_put(image_hash, value)
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, image_hash, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(image_hash)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, image_hash, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(image_hash)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk_dir': self.disk_dir,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -1,24 +1,28 @@
 """
 Enhanced Retraining Script for Mangrove Classifier
 This script will retrain your model with the new data you've added
+(the 'retrain' preset of src/engine.py: warm start from the current model,
+keep the epoch with the best test accuracy).
+With --incremental it only fine-tunes the current model on the images added
+since it was trained, plus a replay sample of older ones, and keeps the result
+only if held-out accuracy didn't regress.
+
+Usage: python retrain_model.py [--incremental] [--resume] [--fresh] [--epochs N]
+       (without options it asks for the settings)
 """
 
 import torch
-import torch.nn as nn
-import torch.optim as optim
-from torchvision import models
-import matplotlib.pyplot as plt
-import numpy as np
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import os
-import shutil
+import json
 import time
-from datetime import datetime
+import argparse
 import sys
 
 # Add src directory to path
 sys.path.append('src')
-from utils import get_data_loaders, count_images, prepare_data_structure
+from utils import count_images
+from engine import PRESETS, Trainer, backup_model
+from manifest import manifest_path, read_manifest, split_known, test_changes
 import config
 
 class MangroveRetrainer:
@@ -26,21 +30,8 @@ class MangroveRetrainer:
         self.data_dir = data_dir
         self.model_dir = model_dir
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
-        # Create backup directory for previous models
+        # Previous models are backed up here before retraining
         self.backup_dir = os.path.join(model_dir, "backups")
-        os.makedirs(self.backup_dir, exist_ok=True)
-        
-    def backup_existing_model(self):
-        """Backup the existing model before retraining"""
-        existing_model = os.path.join(self.model_dir, "mangrove_model.pth")
-        if os.path.exists(existing_model):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(self.backup_dir, f"mangrove_model_backup_{timestamp}.pth")
-            shutil.copy2(existing_model, backup_path)
-            print(f"📦 Backed up existing model to: {backup_path}")
-            return backup_path
-        return None
     
     def analyze_dataset(self):
         """Analyze the current dataset"""
@@ -73,34 +64,25 @@ class MangroveRetrainer:
         
         return mangrove_count, non_mangrove_count
     
-    def create_model(self, pretrained=True):
-        """Create ResNet50 model"""
-        model = models.resnet50(pretrained=pretrained)
-        
-        # Option to fine-tune more layers if you have more data
-        # For small datasets, freeze feature extractor
-        if pretrained:
-            for param in model.parameters():
-                param.requires_grad = False
-        
-        # Replace final layer
-        model.fc = nn.Linear(model.fc.in_features, config.NUM_CLASSES)
-        return model
-    
-    def load_existing_model(self, model_path):
-        """Load existing model for transfer learning"""
-        if os.path.exists(model_path):
-            print(f"📥 Loading existing model from: {model_path}")
-            model = self.create_model(pretrained=True)
-            model.load_state_dict(torch.load(model_path, map_location=self.device))
-            return model
-        return None
+    def training_config(self, total_images, use_existing_model=True, epochs=None):
+        """The 'retrain' preset adjusted to the dataset size"""
+        if total_images < 100:
+            lr = 0.0001  # Lower learning rate for small datasets
+            epochs = epochs or 15
+        else:
+            lr = config.LEARNING_RATE
+            epochs = epochs or config.EPOCHS
+        return PRESETS['retrain']._replace(warm_start=use_existing_model, lr=lr, epochs=epochs)
     
-    def train_model(self, use_existing_model=True, epochs=None):
-        """Main training function"""
+    def train_model(self, use_existing_model=True, epochs=None, resume=False):
+        """Main training function; `resume` continues the last interrupted retraining run"""
         print("🌿 Starting Mangrove Classifier Retraining...")
         print("=" * 60)
         
+        if resume:
+            trainer = Trainer(PRESETS['retrain'], self.data_dir, self.model_dir, self.device)
+            return trainer.run(resume=True, epochs=epochs)
+        
         # Analyze dataset
         mangrove_count, non_mangrove_count = self.analyze_dataset()
         
@@ -111,239 +93,159 @@ class MangroveRetrainer:
             print(f"   • {os.path.join(self.data_dir, 'non-mangrove')} (for non-mangrove images)")
             return None
         
-        # Backup existing model
-        backup_path = self.backup_existing_model()
-        
-        # Prepare data structure
-        print("📂 Preparing data structure...")
-        prepare_data_structure(self.data_dir)
-        
-        # Load data
-        try:
-            train_loader, test_loader, classes = get_data_loaders(
-                self.data_dir, config.BATCH_SIZE, config.IMG_SIZE
-            )
-            print(f"✅ Data loaded successfully. Classes: {classes}")
-            print(f"   • Training batches: {len(train_loader)}")
-            print(f"   • Test batches: {len(test_loader)}")
-        except Exception as e:
-            print(f"❌ Error loading data: {e}")
-            return None
-        
-        # Create or load model
-        existing_model_path = os.path.join(self.model_dir, "mangrove_model.pth")
-        
-        if use_existing_model and backup_path:
-            print("🔄 Using transfer learning from existing model...")
-            model = self.load_existing_model(backup_path)
-            if model is None:
-                print("⚠️  Could not load existing model, creating new one...")
-                model = self.create_model()
-        else:
-            print("🆕 Creating new model...")
-            model = self.create_model()
-        
-        model = model.to(self.device)
-        print(f"🖥️  Using device: {self.device}")
-        
-        # Set up training
-        criterion = nn.CrossEntropyLoss()
-        
-        # Adjust learning rate based on dataset size
-        if mangrove_count + non_mangrove_count < 100:
-            lr = 0.0001  # Lower learning rate for small datasets
-            epochs = epochs or 15
-        else:
-            lr = config.LEARNING_RATE
-            epochs = epochs or config.EPOCHS
-        
-        optimizer = optim.Adam(model.fc.parameters(), lr=lr)
-        scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=7, gamma=0.1)
-        
-        print(f"⚙️  Training configuration:")
-        print(f"   • Epochs: {epochs}")
-        print(f"   • Learning rate: {lr}")
-        print(f"   • Batch size: {config.BATCH_SIZE}")
-        
-        # Training history
-        train_losses = []
-        train_accuracies = []
-        test_accuracies = []
-        
-        print(f"\n🚀 Starting training...")
-        best_test_acc = 0.0
-        
-        for epoch in range(epochs):
-            # Training phase
-            model.train()
-            running_loss = 0.0
-            correct = 0
-            total = 0
-            
-            for batch_idx, (images, labels) in enumerate(train_loader):
-                images, labels = images.to(self.device), labels.to(self.device)
-                
-                optimizer.zero_grad()
-                outputs = model(images)
-                loss = criterion(outputs, labels)
-                loss.backward()
-                optimizer.step()
-                
-                running_loss += loss.item()
-                _, predicted = torch.max(outputs.data, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-            
-            epoch_loss = running_loss / len(train_loader)
-            epoch_acc = 100 * correct / total
-            train_losses.append(epoch_loss)
-            train_accuracies.append(epoch_acc)
-            
-            # Test phase
-            test_acc = self.evaluate_model(model, test_loader)
-            test_accuracies.append(test_acc)
-            
-            # Save best model
-            if test_acc > best_test_acc:
-                best_test_acc = test_acc
-                torch.save(model.state_dict(), existing_model_path)
-                print(f"💾 New best model saved (Test Acc: {test_acc:.2f}%)")
-            
-            print(f"Epoch {epoch+1}/{epochs} - Train Loss: {epoch_loss:.4f}, Train Acc: {epoch_acc:.2f}%, Test Acc: {test_acc:.2f}%")
-            scheduler.step()
-        
-        print(f"\n✅ Training completed!")
-        print(f"🏆 Best test accuracy: {best_test_acc:.2f}%")
-        
-        # Final evaluation
-        self.final_evaluation(model, test_loader, classes)
-        
-        # Save training history
-        self.save_training_plots(train_losses, train_accuracies, test_accuracies, epochs)
-        
-        return model
+        preset = self.training_config(mangrove_count + non_mangrove_count, use_existing_model, epochs)
+        return Trainer(preset, self.data_dir, self.model_dir, self.device).run()
     
-    def evaluate_model(self, model, test_loader):
-        """Evaluate model on test set"""
-        model.eval()
-        correct = 0
-        total = 0
-        
-        with torch.no_grad():
-            for images, labels in test_loader:
-                images, labels = images.to(self.device), labels.to(self.device)
-                outputs = model(images)
-                _, predicted = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-        
-        return 100 * correct / total
+    def replay_sample(self, manifest, old, new_count):
+        """Bounded sample of previously trained images; it changes with every new checkpoint"""
+        count = min(len(old), config.REPLAY_PER_NEW * new_count, config.REPLAY_MAX)
+        seed = int(manifest['checkpoint_sha256'][:8], 16) ^ config.SEED
+        order = torch.randperm(len(old), generator=torch.Generator().manual_seed(seed))
+        return [old[i] for i in order[:count].tolist()]
     
-    def final_evaluation(self, model, test_loader, classes):
-        """Comprehensive evaluation with metrics"""
-        print("\n📊 Final Model Evaluation:")
-        print("=" * 40)
-        
-        model.eval()
-        all_predictions = []
-        all_labels = []
+    def train_incremental(self, epochs=None, resume=False):
+        """
+        Fine-tune the current model on the training images added or changed since it
+        was trained (according to its manifest) plus a bounded replay sample of older
+        ones. The candidate replaces the model unless held-out accuracy dropped by more
+        than config.REGRESSION_TOLERANCE points. Returns the report, or None if there
+        was nothing to train.
+        The candidate's manifest lists the whole training split: the new images it was
+        fine-tuned on, and the known ones, i.e. those listed by the current model's
+        manifest (present when an accepted checkpoint of this lineage was trained on
+        them), whether or not they were replayed this time.
+        """
+        print("🌿 Starting Incremental Mangrove Classifier Retraining...")
+        print("=" * 60)
+        model_path = os.path.join(self.model_dir, "mangrove_model.pth")
+        candidate_path = os.path.join(self.model_dir, "mangrove_model.candidate.pth")
+        manifest = read_manifest(model_path)
+        if manifest is None:
+            if resume:
+                # Every incremental run starts from a model with a manifest: this one was replaced since
+                print(f"❌ {model_path} changed since the interrupted run started; start a new incremental run")
+            else:
+                print(f"❌ {model_path} has no matching training manifest; run a full retraining first")
+            return None
         
-        with torch.no_grad():
-            for images, labels in test_loader:
-                images, labels = images.to(self.device), labels.to(self.device)
-                outputs = model(images)
-                _, predicted = torch.max(outputs, 1)
-                
-                all_predictions.extend(predicted.cpu().numpy())
-                all_labels.extend(labels.cpu().numpy())
+        selected = {}
+        def select(train_data, test_data):
+            if list(train_data.classes) != manifest['classes']:
+                print(f"❌ Classes changed since the model was trained ({manifest['classes']}); run a full retraining")
+                return []
+            # The gate compares both models on today's test split; it means nothing if the
+            # current model trained on some of those images
+            overlap, changed = test_changes(manifest, test_data, os.path.join(self.data_dir, "test"))
+            if overlap:
+                print(f"❌ {len(overlap)} test image(s) were trained on by the current model (e.g. {overlap[0]}); "
+                      f"restore data/test or run a full retraining")
+                return []
+            if changed:
+                print("⚠️  The test split changed since the current model was accepted; "
+                      "accuracy before/after is measured on the new one")
+            selected['test_set_changed'] = changed
+            new, old = split_known(manifest, train_data, os.path.join(self.data_dir, "train"))
+            if not new:
+                print("✅ No training images added since the model was trained")
+                return []
+            replay = self.replay_sample(manifest, old, len(new))
+            print(f"🆕 {len(new)} new training image(s); replaying {len(replay)} of {len(old)} older ones")
+            selected.update(new_images=len(new), replayed_images=len(replay))
+            return sorted(new + replay)
+        
+        start_time = time.time()
+        trainer = Trainer(PRESETS['incremental'], self.data_dir, self.model_dir, self.device,
+                          output_path=candidate_path, select=select)
+        if trainer.run(resume=resume, epochs=epochs) is None:
+            return None
         
-        if len(all_labels) > 0:
-            # Classification report
-            print("📋 Classification Report:")
-            print(classification_report(all_labels, all_predictions, target_names=classes))
-            
-            # Confusion matrix
-            cm = confusion_matrix(all_labels, all_predictions)
-            print("🔀 Confusion Matrix:")
-            print(f"{'':>12} {'Predicted':>20}")
-            print(f"{'Actual':>12} {classes[0]:>10} {classes[1]:>10}")
-            for i, class_name in enumerate(classes):
-                row = f"{class_name:>12}"
-                for j in range(len(classes)):
-                    row += f"{cm[i][j]:>10}"
-                print(row)
+        before, after = trainer.initial_accuracy, trainer.test_accuracy
+        regressed = before is None or after < before - config.REGRESSION_TOLERANCE
+        report = {
+            'new_images': selected.get('new_images'),
+            'replayed_images': selected.get('replayed_images'),
+            'trained_images': len(trainer.train_indices),
+            'total_train_images': len(trainer.train_data),
+            'accuracy_before': before,
+            'accuracy_after': after,
+            'test_set_changed': selected.get('test_set_changed'),
+            'regressed': regressed,
+            'accepted': not regressed,
+            'seconds': round(time.time() - start_time, 1),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        print("\n📊 Incremental Retraining Report:")
+        print("=" * 40)
+        print(f"   • Fine-tuned on {report['trained_images']} of {report['total_train_images']} training images")
+        print(f"   • Held-out accuracy: {f'{before:.2f}%' if before is not None else 'unknown'} -> {after:.2f}%")
+        if regressed:
+            print(f"📉 Held-out accuracy regressed; keeping {model_path} (candidate left at {candidate_path})")
         else:
-            print("⚠️  No test data available for evaluation")
-    
-    def save_training_plots(self, train_losses, train_accuracies, test_accuracies, epochs):
-        """Save training visualization"""
-        plt.figure(figsize=(15, 5))
-        
-        # Loss plot
-        plt.subplot(1, 3, 1)
-        plt.plot(train_losses)
-        plt.title('Training Loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.grid(True)
-        
-        # Training accuracy plot
-        plt.subplot(1, 3, 2)
-        plt.plot(train_accuracies, label='Train Accuracy')
-        plt.plot(test_accuracies, label='Test Accuracy')
-        plt.title('Model Accuracy')
-        plt.xlabel('Epoch')
-        plt.ylabel('Accuracy (%)')
-        plt.legend()
-        plt.grid(True)
-        
-        # Final metrics
-        plt.subplot(1, 3, 3)
-        final_train_acc = train_accuracies[-1] if train_accuracies else 0
-        final_test_acc = test_accuracies[-1] if test_accuracies else 0
-        
-        plt.bar(['Train Accuracy', 'Test Accuracy'], [final_train_acc, final_test_acc])
-        plt.title('Final Performance')
-        plt.ylabel('Accuracy (%)')
-        plt.ylim(0, 100)
-        
-        # Add value labels on bars
-        plt.text(0, final_train_acc + 1, f'{final_train_acc:.1f}%', ha='center')
-        plt.text(1, final_test_acc + 1, f'{final_test_acc:.1f}%', ha='center')
-        
-        plt.tight_layout()
-        
-        # Save plot
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        plot_path = os.path.join(self.model_dir, f'training_history_{timestamp}.png')
-        plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-        print(f"📈 Training plots saved to: {plot_path}")
-        plt.show()
+            backup_model(model_path, os.path.join(self.model_dir, "backups"))
+            # Checkpoint first: its manifest only counts once the checkpoint it hashes is in place
+            os.replace(candidate_path, model_path)
+            os.replace(manifest_path(candidate_path), manifest_path(model_path))
+            print(f"✅ No regression; {model_path} updated")
+        
+        report_path = os.path.join(self.model_dir, "incremental_report.json")
+        tmp_path = f"{report_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, report_path)
+        print(f"📝 Report saved to {report_path}")
+        return report
 
 def main():
     """Main function to run retraining"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incremental', action='store_true',
+                        help='fine-tune on images added since the current model was trained')
+    parser.add_argument('--resume', action='store_true', help='continue the last interrupted retraining run')
+    parser.add_argument('--fresh', action='store_true', help='train a new model instead of the existing one')
+    parser.add_argument('--epochs', type=int, default=None)
+    args = parser.parse_args()
+    
     print("🌿 Mangrove Classifier Retraining Tool")
     print("=" * 50)
     
     # Initialize retrainer
     retrainer = MangroveRetrainer()
     
-    # Ask user for preferences
-    print("\n🔧 Configuration Options:")
-    print("1. Use existing model as starting point (transfer learning) - Recommended")
-    print("2. Train completely new model from scratch")
-    
-    choice = input("\nEnter your choice (1 or 2, default=1): ").strip()
-    use_existing = choice != "2"
+    if args.incremental:
+        try:
+            report = retrainer.train_incremental(epochs=args.epochs, resume=args.resume)
+        except KeyboardInterrupt:
+            print("\n⏸️  Interrupted. Continue with: python retrain_model.py --incremental --resume")
+            sys.exit(130)
+        # Exit status for scheduled runs: 2 when the candidate was rejected
+        sys.exit(2 if report is not None and report['regressed'] else 0)
     
-    epochs_input = input("Enter number of epochs (default=auto): ").strip()
-    epochs = int(epochs_input) if epochs_input.isdigit() else None
+    use_existing = not args.fresh
+    epochs = args.epochs
+    if len(sys.argv) == 1:
+        # Ask user for preferences
+        print("\n🔧 Configuration Options:")
+        print("1. Use existing model as starting point (transfer learning) - Recommended")
+        print("2. Train completely new model from scratch")
+        
+        choice = input("\nEnter your choice (1 or 2, default=1): ").strip()
+        use_existing = choice != "2"
+        
+        epochs_input = input("Enter number of epochs (default=auto): ").strip()
+        epochs = int(epochs_input) if epochs_input.isdigit() else None
     
     # Start training
-    print(f"\n🚀 Starting retraining with {'transfer learning' if use_existing else 'fresh training'}...")
+    if args.resume:
+        print("\n⏯️  Resuming the last retraining run...")
+    else:
+        print(f"\n🚀 Starting retraining with {'transfer learning' if use_existing else 'fresh training'}...")
     
     start_time = time.time()
-    model = retrainer.train_model(use_existing_model=use_existing, epochs=epochs)
+    try:
+        model = retrainer.train_model(use_existing_model=use_existing, epochs=epochs, resume=args.resume)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted. Continue from the last saved epoch with: python retrain_model.py --resume")
+        sys.exit(130)
     end_time = time.time()
     
     if model:
@@ -352,8 +254,8 @@ def main():
         print(f"💾 Updated model saved to: models/mangrove_model.pth")
         print(f"📦 Previous model backed up to: models/backups/")
         
-        print("\n🔄 Don't forget to restart your model server to use the new model!")
-        print("   Command: python model_server.py")
+        print("\n🔄 A running model server picks up the new model automatically.")
+        print("   To reload it right away: POST http://localhost:5001/admin/reload")
         
     else:
         print("❌ Retraining failed. Please check your data and try again.")
@@ -0,0 +1,256 @@
+"""
+Architecture registry and self-describing checkpoints
+Every trainable network is registered under a name, and checkpoints are saved
+as a dict carrying the architecture name, class order, input size and
+normalization next to the weights, so loaders rebuild the right network and
+preprocess images the way it was trained. Bare state_dicts from older training
+runs are still loaded: their architecture is inferred from the weight names.
+ImageNet backbones are read from vendored files in config.PRETRAINED_DIR (see
+src/vendor_weights.py) before torchvision is asked to download them.
+"""
+
+import os
+from collections import namedtuple
+import torch
+import torch.nn as nn
+import config
+from backends import MEAN as IMAGENET_MEAN, STD as IMAGENET_STD
+
+CHECKPOINT_FORMAT = 'mangrove-checkpoint'
+CHECKPOINT_VERSION = 1
+
+# builder(num_classes, pretrained); head: name of the final classification layer;
+# pretrained: whether ImageNet weights exist (otherwise the whole network is trained).
+# Builders import torchvision themselves: it takes seconds to import and frozen/INT8 loads never need it.
+Architecture = namedtuple('Architecture', ['builder', 'head', 'pretrained'])
+
+ARCHITECTURES = {}
+
+def register(name, head, pretrained=True):
+    """Decorator adding a builder to the registry; `head` is the module replaced for our classes"""
+    def decorator(builder):
+        ARCHITECTURES[name] = Architecture(builder, head, pretrained)
+        return builder
+    return decorator
+
+class SimpleCNN(nn.Module):
+    """Small 4-block CNN trained from scratch by robust_retrain.py (~1.6 MB)"""
+    def __init__(self, num_classes=2):
+        super(SimpleCNN, self).__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 32, kernel_size=3, padding=1),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(kernel_size=2, stride=2),
+
+            nn.Conv2d(32, 64, kernel_size=3, padding=1),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(kernel_size=2, stride=2),
+
+            nn.Conv2d(64, 128, kernel_size=3, padding=1),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(kernel_size=2, stride=2),
+
+            nn.Conv2d(128, 256, kernel_size=3, padding=1),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(kernel_size=2, stride=2),
+        )
+
+        self.classifier = nn.Sequential(
+            nn.AdaptiveAvgPool2d((1, 1)),
+            nn.Flatten(),
+            nn.Dropout(0.5),
+            nn.Linear(256, 128),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.5),
+            nn.Linear(128, num_classes)
+        )
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.classifier(x)
+        return x
+
+@register('resnet50', head='fc')
+def build_resnet50(num_classes, pretrained=False):
+    from torchvision import models
+    model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT if pretrained else None)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+@register('simple_cnn', head='classifier.6', pretrained=False)
+def build_simple_cnn(num_classes, pretrained=False):
+    return SimpleCNN(num_classes)
+
+@register('mobilenet_v2', head='classifier.1')
+def build_mobilenet_v2(num_classes, pretrained=False):
+    from torchvision import models
+    model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.DEFAULT if pretrained else None)
+    model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
+    return model
+
+@register('mobilenet_v3_small', head='classifier.3')
+def build_mobilenet_v3_small(num_classes, pretrained=False):
+    from torchvision import models
+    model = models.mobilenet_v3_small(weights=models.MobileNet_V3_Small_Weights.DEFAULT if pretrained else None)
+    model.classifier[3] = nn.Linear(model.classifier[3].in_features, num_classes)
+    return model
+
+@register('mobilenet_v3_large', head='classifier.3')
+def build_mobilenet_v3_large(num_classes, pretrained=False):
+    from torchvision import models
+    model = models.mobilenet_v3_large(weights=models.MobileNet_V3_Large_Weights.DEFAULT if pretrained else None)
+    model.classifier[3] = nn.Linear(model.classifier[3].in_features, num_classes)
+    return model
+
+def pretrained_path(arch, weights_dir=None):
+    """Vendored ImageNet backbone of `arch`: <PRETRAINED_DIR>/<arch>.pth"""
+    return os.path.join(weights_dir or config.PRETRAINED_DIR, f"{arch}.pth")
+
+def vendor_weights(arch, weights_dir=None):
+    """Fetch torchvision's ImageNet weights for `arch` once and store the backbone (without its head)"""
+    spec = ARCHITECTURES[arch]
+    state_dict = {key: value for key, value in spec.builder(1, True).state_dict().items()
+                  if not key.startswith(spec.head + '.')}
+    path = pretrained_path(arch, weights_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(state_dict, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def build_model(arch, num_classes=None, pretrained=False, download=True, weights_dir=None):
+    """
+    Build a registered architecture with a fresh `num_classes`-way head. With
+    `pretrained` the backbone gets ImageNet weights: the vendored file if there is
+    one, else torchvision's download, or (with download=False) none at all.
+    """
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {arch!r}; registered: {', '.join(sorted(ARCHITECTURES))}")
+    spec = ARCHITECTURES[arch]
+    num_classes = num_classes or config.NUM_CLASSES
+    if not (pretrained and spec.pretrained):
+        return spec.builder(num_classes, False)
+
+    path = pretrained_path(arch, weights_dir)
+    if os.path.exists(path):
+        model = spec.builder(num_classes, False)
+        missing, unexpected = model.load_state_dict(torch.load(path, map_location='cpu'), strict=False)
+        if unexpected or any(not key.startswith(spec.head + '.') for key in missing):
+            raise ValueError(f"{path} does not hold {arch} backbone weights")
+        return model
+    if not download:
+        print(f"⚠️  No vendored {arch} weights at {path} (run src/vendor_weights.py); "
+              f"the backbone is randomly initialised")
+        return spec.builder(num_classes, False)
+    return spec.builder(num_classes, True)
+
+def freeze_backbone(model, arch):
+    """
+    Freeze everything except the classification head (transfer learning on small
+    datasets). Architectures without pretrained weights are left fully trainable.
+    """
+    spec = ARCHITECTURES[arch]
+    if spec.pretrained:
+        for name, param in model.named_parameters():
+            param.requires_grad = name.startswith(spec.head + '.')
+    return model
+
+def trainable_parameters(model):
+    """Parameters the optimizer should update"""
+    return [param for param in model.parameters() if param.requires_grad]
+
+class EmbeddingModel(nn.Module):
+    """
+    A registered network whose forward returns (logits, embedding), where the
+    embedding is the input of the classification head (e.g. ResNet50's pooled
+    2048-d features). Takes ownership of `model`: its head is moved out of it.
+    """
+    def __init__(self, model, arch):
+        super(EmbeddingModel, self).__init__()
+        head_name = ARCHITECTURES[arch].head
+        parent_name, _, child_name = head_name.rpartition('.')
+        parent = model.get_submodule(parent_name) if parent_name else model
+        self.head = getattr(parent, child_name)
+        setattr(parent, child_name, nn.Identity())
+        self.body = model
+
+    def forward(self, x):
+        embedding = self.body(x)
+        return self.head(embedding), embedding
+
+def with_embedding(model, arch):
+    """Wrap a model built by build_model() so it also returns its embedding"""
+    return EmbeddingModel(model, arch)
+
+def logits(outputs):
+    """Logits from a plain model's output or an EmbeddingModel's (logits, embedding)"""
+    return outputs[0] if isinstance(outputs, tuple) else outputs
+
+def checkpoint_metadata(arch, classes=None, input_size=None, mean=None, std=None):
+    """Everything a loader needs besides the weights"""
+    return {
+        'arch': arch,
+        'classes': list(classes or config.CLASS_NAMES),
+        'input_size': list(input_size or config.IMG_SIZE),
+        'mean': list(mean or IMAGENET_MEAN),
+        'std': list(std or IMAGENET_STD)
+    }
+
+def save_checkpoint(model, path, arch, classes=None, input_size=None, mean=None, std=None, **extra):
+    """
+    Save weights plus metadata. The file is replaced atomically so a watching
+    model server never loads a half-written checkpoint.
+    """
+    checkpoint = {
+        'format': CHECKPOINT_FORMAT,
+        'format_version': CHECKPOINT_VERSION,
+        **checkpoint_metadata(arch, classes, input_size, mean, std),
+        **extra,
+        'state_dict': model.state_dict()
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def infer_architecture(state_dict):
+    """Name of the registered architecture whose weights match a bare state_dict"""
+    keys = set(state_dict)
+    for arch, spec in ARCHITECTURES.items():
+        head_weight = state_dict.get(f"{spec.head}.weight")
+        if head_weight is None:
+            continue
+        if set(spec.builder(head_weight.shape[0], False).state_dict()) == keys:
+            return arch
+    raise ValueError("Checkpoint weights don't match any registered architecture "
+                     f"({', '.join(sorted(ARCHITECTURES))})")
+
+def read_checkpoint(path, map_location='cpu'):
+    """Return (state_dict, metadata) for new-style and legacy (bare state_dict) checkpoints"""
+    checkpoint = torch.load(path, map_location=map_location)
+    if isinstance(checkpoint, dict) and checkpoint.get('format') == CHECKPOINT_FORMAT:
+        state_dict = checkpoint['state_dict']
+        metadata = {key: value for key, value in checkpoint.items() if key != 'state_dict'}
+        return state_dict, metadata
+
+    # Legacy checkpoint: every training script used ImageFolder-style (alphabetical) class
+    # indices with 224x224 ImageNet-normalized inputs, i.e. config.CLASS_NAMES order, but the
+    # old model server labelled index 1 as mangrove, so the order has to be confirmed
+    state_dict = checkpoint
+    classes = config.LEGACY_CLASS_NAMES
+    if classes is None:
+        classes = config.CLASS_NAMES
+        print(f"⚠️  {path} has no class metadata; assuming {classes} (index 0 = {classes[0]}). "
+              f"The old model server read index 1 as mangrove; set LEGACY_CLASS_NAMES in "
+              f"src/config.py to confirm or swap the order, or retrain to save it")
+    return state_dict, checkpoint_metadata(infer_architecture(state_dict), classes)
+
+def load_checkpoint(path, device='cpu'):
+    """Rebuild the network described by a checkpoint; returns (model in eval mode, metadata)"""
+    state_dict, metadata = read_checkpoint(path, map_location=device)
+    model = build_model(metadata['arch'], len(metadata['classes']))
+    model.load_state_dict(state_dict)
+    return model.to(device).eval(), metadata
@@ -0,0 +1,260 @@
+"""
+CPU inference autotuner
+Benchmarks a checkpoint on this host across intra-op threads, inter-op threads,
+batch size and (torch only) the channels_last memory format, then writes the
+fastest setting to `<name>.autotune.json` next to the checkpoint, together with
+the checkpoint's SHA-256: a retrained checkpoint (possibly another architecture)
+ignores settings tuned for its predecessor. MangroveClassifier (src/predict.py) and model_server.py read that file at
+startup; explicit settings (MODEL_* variables, arguments) still take precedence.
+Each inter-op/layout combination runs in a fresh interpreter because torch fixes
+its inter-op pool size on first use.
+
+Usage: python src/autotune.py [--model models/mangrove_model.pth] [--backend torch|onnx] [--quantized]
+                              [--batch-sizes 1 2 4 8 16 32] [--max-latency-ms 250]
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import numpy as np
+import config
+from backends import checkpoint_sha256
+
+TUNING_SUFFIX = '.autotune.json'
+
+def tuning_path(model_path):
+    """models/mangrove_model.pth -> models/mangrove_model.autotune.json"""
+    return os.path.splitext(model_path)[0] + TUNING_SUFFIX
+
+def tuning_key(backend, quantized=False):
+    """Settings are kept per runtime: 'onnx', 'int8' or 'torch' (fp32 eager/frozen)"""
+    if backend == 'onnx':
+        return 'onnx'
+    return 'int8' if quantized else 'torch'
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def host_fingerprint():
+    """What a tuning result depends on besides the model"""
+    return {'cpu_count': os.cpu_count(), 'machine': platform.machine(), 'cpu': cpu_model()}
+
+def checkpoint_identity(model_path):
+    """(size, mtime) of the checkpoint, the cheap check before hashing it"""
+    stat = os.stat(model_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_tuning(model_path, key='torch'):
+    """
+    Tuned settings for runtime `key` (see tuning_key) on this host, or None if the
+    checkpoint was never tuned, was tuned for another runtime or on another host,
+    or has changed since it was tuned
+    """
+    path = tuning_path(model_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            tuning = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable tuning file {path}: {e}")
+        return None
+    if tuning.get('host') != host_fingerprint():
+        print(f"⚠️  Ignoring {path}: tuned on a different host (re-run src/autotune.py)")
+        return None
+    settings = tuning.get('settings', {}).get(key)
+    if settings is None or not os.path.exists(model_path):
+        return None
+    # Hash only when size or mtime differ from the tuned file (e.g. a copy), not on every startup
+    if settings.get('checkpoint') != checkpoint_identity(model_path) and \
+            settings.get('checkpoint_sha256') != checkpoint_sha256(model_path):
+        print(f"⚠️  Ignoring {path}: tuned for another checkpoint ({settings.get('arch')}); "
+              f"re-run src/autotune.py for this one")
+        return None
+    return settings
+
+def apply_threads(settings):
+    """Size torch's thread pools from tuned settings"""
+    import torch
+    if settings.get('threads'):
+        torch.set_num_threads(settings['threads'])
+    if settings.get('interop_threads'):
+        try:
+            torch.set_num_interop_threads(settings['interop_threads'])
+        except RuntimeError:
+            # The inter-op pool has already started in this process; its size can't change
+            pass
+
+def time_batch(backend, batch, min_seconds, min_runs=3):
+    """Median seconds per forward pass of `batch`, after two warm-up passes"""
+    for _ in range(2):
+        backend.predict(batch)
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < min_runs or time.perf_counter() - start < min_seconds:
+        run_start = time.perf_counter()
+        backend.predict(batch)
+        timings.append(time.perf_counter() - run_start)
+    return float(np.median(timings))
+
+def worker(args):
+    """Measure every thread count and batch size for one inter-op/layout setting"""
+    if args.backend == 'onnx':
+        from backends import load_onnx
+        backends = {threads: load_onnx(args.model, intra_op_threads=threads) for threads in args.threads}
+        if None in backends.values():
+            raise RuntimeError(f"No up-to-date ONNX export for {args.model}; run src/export_onnx.py first")
+    else:
+        import torch
+        torch.set_num_interop_threads(args.interop_threads)
+        from predict import MangroveClassifier
+        classifier = MangroveClassifier(args.model, quantized=args.quantized, backend='torch',
+                                        tuning={'channels_last': args.channels_last})
+        backends = dict.fromkeys(args.threads, classifier.backend)
+
+    results = []
+    for threads, backend in backends.items():
+        if args.backend != 'onnx':
+            torch.set_num_threads(threads)
+        for batch_size in args.batch_sizes:
+            batch = np.random.default_rng(0).standard_normal((batch_size, 3) + backend.input_size,
+                                                             dtype=np.float32)
+            seconds = time_batch(backend, batch, args.min_seconds)
+            results.append({
+                'threads': threads,
+                'interop_threads': args.interop_threads,
+                'channels_last': args.channels_last,
+                'batch_size': batch_size,
+                'latency_ms': seconds * 1000,
+                'images_per_second': batch_size / seconds
+            })
+    print(json.dumps({'arch': backend.metadata['arch'], 'model_format': backend.model_format,
+                      'results': results}))
+
+def measure_in_subprocess(args, interop_threads, channels_last):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--model', args.model,
+               '--backend', args.backend, '--interop-threads', str(interop_threads),
+               '--min-seconds', str(args.min_seconds),
+               '--threads'] + [str(t) for t in args.threads] + ['--batch-sizes'] + [str(b) for b in args.batch_sizes]
+    if args.quantized:
+        command.append('--quantized')
+    if channels_last:
+        command.append('--channels-last')
+    # CPU hosts are what we tune; keep a visible GPU out of the measurement
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES='')
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def default_threads():
+    """Powers of two up to the core count, plus the core count itself"""
+    cores = os.cpu_count() or 1
+    return sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores})
+
+def best_setting(results, max_latency_ms=None):
+    """Highest throughput whose per-batch latency stays within the budget (if any)"""
+    allowed = [r for r in results if max_latency_ms is None or r['latency_ms'] <= max_latency_ms]
+    if not allowed:
+        return None
+    # Among equally fast settings prefer fewer threads and smaller batches
+    return max(allowed, key=lambda r: (round(r['images_per_second'], 1), -r['threads'], -r['batch_size']))
+
+def write_tuning(model_path, key, setting, arch):
+    """Merge the setting for runtime `key` into the tuning file; returns its path"""
+    path = tuning_path(model_path)
+    tuning = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                tuning = json.load(f)
+        except (OSError, ValueError):
+            tuning = {}
+    # Settings measured on another machine are meaningless here
+    if tuning.get('host') != host_fingerprint():
+        tuning = {}
+    tuning['host'] = host_fingerprint()
+    tuning.setdefault('settings', {})[key] = {
+        **setting,
+        'arch': arch,
+        'checkpoint_sha256': checkpoint_sha256(model_path),
+        'checkpoint': checkpoint_identity(model_path),
+        'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--backend', choices=('torch', 'onnx'), default=config.BACKEND)
+    parser.add_argument('--quantized', action='store_true', default=config.QUANTIZED,
+                        help='tune the INT8 model from src/quantize_model.py')
+    parser.add_argument('--threads', type=int, nargs='+', default=default_threads(),
+                        help='intra-op thread counts to try')
+    parser.add_argument('--interop-threads', type=int, nargs='+', default=None,
+                        help='inter-op thread counts to try (torch only)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--min-seconds', type=float, default=1.0, help='measuring time per setting')
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help='only consider settings whose forward pass stays under this latency')
+    parser.add_argument('--dry-run', action='store_true', help='print the results without writing the file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--channels-last', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.interop_threads = args.interop_threads[0]
+        worker(args)
+        return
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        sys.exit(1)
+
+    cores = os.cpu_count() or 1
+    if args.backend == 'onnx':
+        # ONNX Runtime sessions run sequentially (one inter-op thread) and have no layout switch
+        combinations = [(1, False)]
+    else:
+        interop = args.interop_threads or sorted({1, min(2, cores)})
+        combinations = [(n, layout) for n in interop for layout in (False, True)]
+
+    key = tuning_key(args.backend, args.quantized)
+    print(f"🔧 Autotuning {args.model} ({key}) on {cores} core(s): {cpu_model()}")
+    results, arch = [], None
+    for interop_threads, channels_last in combinations:
+        print(f"   measuring inter-op={interop_threads} channels_last={channels_last}...")
+        measured = measure_in_subprocess(args, interop_threads, channels_last)
+        arch = measured['arch']
+        results.extend(measured['results'])
+
+    print(f"\n{'threads':>7} {'interop':>7} {'ch_last':>7} {'batch':>5} {'ms/batch':>9} {'img/s':>8}")
+    for r in sorted(results, key=lambda r: -r['images_per_second']):
+        print(f"{r['threads']:>7} {r['interop_threads']:>7} {str(r['channels_last']):>7} {r['batch_size']:>5} "
+              f"{r['latency_ms']:>9.1f} {r['images_per_second']:>8.1f}")
+
+    best = best_setting(results, args.max_latency_ms)
+    if best is None:
+        print(f"❌ No setting runs a batch within {args.max_latency_ms:g} ms")
+        sys.exit(1)
+    print(f"\n🏆 Best: {best['threads']} thread(s), {best['interop_threads']} inter-op, batch {best['batch_size']}, "
+          f"channels_last={best['channels_last']}: {best['images_per_second']:.1f} img/s "
+          f"({best['latency_ms']:.1f} ms per batch)")
+    if not args.dry_run:
+        print(f"✅ Tuning saved to {write_tuning(args.model, key, best, arch)}")
+
+if __name__ == "__main__":
+    main()
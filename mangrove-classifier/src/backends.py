@@ -0,0 +1,247 @@
+"""
+Inference backends behind MangroveClassifier and the model server
+A backend takes a preprocessed float32 batch (N, 3, H, W) as a numpy array and
+returns class probabilities (N, C), plus the penultimate-layer embeddings (N, D)
+when the model exposes them (see architectures.EmbeddingModel). Preprocessing here is plain numpy, so the
+ONNX Runtime backend can serve without importing torch at all.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+import config
+
+BACKENDS = ('torch', 'onnx')
+
+# Torch inference precision: 'bf16' runs under CPU autocast (see src/precision.py)
+PRECISIONS = ('fp32', 'bf16')
+
+# File written next to the checkpoint for each exported format
+EXPORT_SUFFIXES = {
+    'frozen': '.frozen.pt',
+    'int8': '.int8.pt',
+    'onnx': '.onnx'
+}
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+ONNX_INPUT = 'input'
+ONNX_OUTPUT = 'logits'
+ONNX_EMBEDDING = 'embedding'
+# Key of the ONNX metadata entry holding the checkpoint metadata (see architectures.py)
+ONNX_METADATA = 'checkpoint_metadata'
+# Extra file of a TorchScript export (frozen, INT8) with its metadata (see export_model.write_export)
+TORCHSCRIPT_METADATA = 'metadata.json'
+
+def checkpoint_sha256(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a checkpoint file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def export_metadata(path):
+    """
+    Metadata an export carries (source_sha256 and, for TorchScript, device and
+    checkpoint; for ONNX, ONNX_METADATA), read without loading the model; {} if
+    the file is missing or unreadable
+    """
+    try:
+        if path.endswith('.onnx'):
+            import onnx
+            return {entry.key: entry.value for entry in onnx.load(path, load_external_data=False).metadata_props}
+        import zipfile
+        with zipfile.ZipFile(path) as archive:
+            name = next(name for name in archive.namelist() if name.endswith('/extra/' + TORCHSCRIPT_METADATA))
+            return json.loads(archive.read(name))
+    except Exception:
+        return {}
+
+def export_path(model_path, model_format):
+    """models/mangrove_model.pth -> models/mangrove_model<suffix> for an exported format"""
+    return os.path.splitext(model_path)[0] + EXPORT_SUFFIXES[model_format]
+
+def preprocess(image, size=None, mean=None, std=None):
+    """
+    numpy equivalent of Resize(size) + ToTensor() + Normalize(mean, std) on a
+    PIL image (defaults: config.IMG_SIZE, ImageNet stats); returns a float32 (3, H, W) array
+    """
+    height, width = size or config.IMG_SIZE
+    if image.size != (width, height):
+        # torchvision resizes PIL images with PIL's antialiased bilinear filter too
+        image = image.resize((width, height), Image.BILINEAR)
+    array = np.asarray(image, dtype=np.float32).transpose(2, 0, 1)
+    mean = np.asarray(mean or MEAN, dtype=np.float32).reshape(3, 1, 1)
+    std = np.asarray(std or STD, dtype=np.float32).reshape(3, 1, 1)
+    return (array / 255.0 - mean) / std
+
+def softmax(logits):
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+class InferenceBackend:
+    """
+    Common interface: predict() plus the hooks the server calls around loading
+    and forking. `metadata` describes the model (architecture, class order,
+    input size, normalization) as stored in its checkpoint.
+    """
+    name = None
+
+    def __init__(self, model_format, metadata=None):
+        self.model_format = model_format
+        self.metadata = metadata or {
+            'arch': 'resnet50',
+            'classes': list(config.CLASS_NAMES),
+            'input_size': list(config.IMG_SIZE),
+            'mean': MEAN,
+            'std': STD
+        }
+
+    @property
+    def classes(self):
+        return self.metadata['classes']
+
+    @property
+    def input_size(self):
+        return tuple(self.metadata['input_size'])
+
+    def preprocess(self, image):
+        """PIL image -> float32 (3, H, W) array, as this model was trained"""
+        return preprocess(image, self.input_size, self.metadata['mean'], self.metadata['std'])
+
+    def forward(self, batch):
+        """
+        float32 (N, 3, H, W) array -> ((N, C) class probabilities, (N, D) float32
+        embeddings or None if this model does not output them)
+        """
+        raise NotImplementedError
+
+    def predict(self, batch):
+        """float32 (N, 3, H, W) array -> (N, C) array of class probabilities"""
+        return self.forward(batch)[0]
+
+    def warm_up(self, batch_sizes=(1,)):
+        """Run dummy batches so the first real request doesn't pay allocation costs"""
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, 3) + self.input_size, dtype=np.float32))
+
+    def share_memory(self):
+        """Called before forking workers"""
+
+class TorchBackend(InferenceBackend):
+    """
+    Any torch module: eager, frozen TorchScript or INT8. With `channels_last`
+    inputs (and an eager model's weights) use the NHWC memory format, which
+    oneDNN's CPU convolutions often run faster (see src/autotune.py). With
+    precision 'bf16' the forward pass runs under CPU autocast in bfloat16, which
+    always uses channels_last; outputs are returned as float32 either way.
+    """
+    name = 'torch'
+
+    def __init__(self, model, device, model_format='eager', metadata=None, channels_last=False,
+                 precision='fp32'):
+        super().__init__(model_format, metadata)
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        self.precision = precision
+        self.channels_last = channels_last or precision == 'bf16'
+        if self.channels_last:
+            import torch
+            # A frozen export's weights are graph constants; only its inputs change layout
+            if not isinstance(model, torch.jit.ScriptModule):
+                model = model.to(memory_format=torch.channels_last)
+        self.model = model
+        self.device = device
+
+    def forward(self, batch):
+        import torch
+        with torch.no_grad():
+            inputs = torch.from_numpy(np.ascontiguousarray(batch)).to(self.device)
+            if self.channels_last:
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+            with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.precision == 'bf16'):
+                outputs = self.model(inputs)
+            logits, embeddings = outputs if isinstance(outputs, tuple) else (outputs, None)
+            # Single device sync for the whole batch
+            probabilities = torch.softmax(logits.float(), dim=1).cpu().numpy()
+            if embeddings is not None:
+                embeddings = embeddings.float().cpu().numpy()
+            return probabilities, embeddings
+
+    def warm_up(self, batch_sizes=(1,)):
+        import torch
+        # TorchScript's profiling executor only optimizes the graph after a couple of runs
+        passes = 2 if isinstance(self.model, torch.jit.ScriptModule) else 1
+        for _ in range(passes):
+            super().warm_up(batch_sizes)
+
+    def share_memory(self):
+        # Forked workers then map a single copy of the weights
+        if str(self.device) == 'cpu':
+            self.model.share_memory()
+
+class OnnxBackend(InferenceBackend):
+    """ONNX export run by ONNX Runtime's CPU execution provider"""
+    name = 'onnx'
+
+    def __init__(self, onnx_path, intra_op_threads=0, metadata=None):
+        super().__init__('onnx', metadata)
+        self.onnx_path = onnx_path
+        self.intra_op_threads = intra_op_threads
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # ONNX Runtime's thread pools don't survive fork(), so every process builds its own session
+        if self._session_pid != os.getpid():
+            with self._lock:
+                if self._session_pid != os.getpid():
+                    self._session = create_onnx_session(self.onnx_path, self.intra_op_threads)
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def forward(self, batch):
+        session = self.session
+        # Exports written before embeddings were added only have the logits output
+        outputs = [output.name for output in session.get_outputs() if output.name in (ONNX_OUTPUT, ONNX_EMBEDDING)]
+        results = dict(zip(outputs, session.run(outputs, {ONNX_INPUT: np.ascontiguousarray(batch, dtype=np.float32)})))
+        return softmax(results[ONNX_OUTPUT]), results.get(ONNX_EMBEDDING)
+
+    def predict(self, batch):
+        logits = self.session.run([ONNX_OUTPUT], {ONNX_INPUT: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+        return softmax(logits)
+
+def create_onnx_session(onnx_path, intra_op_threads=0):
+    """CPU session with all graph optimizations; 0 threads lets ONNX Runtime use every core"""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+def load_onnx(model_path, source_sha256=None, intra_op_threads=0):
+    """
+    ONNX backend for the export of `model_path` (src/export_onnx.py), or None if
+    it is missing, was exported from a different checkpoint or lacks its metadata
+    """
+    path = export_path(model_path, 'onnx')
+    if not os.path.exists(path):
+        return None
+    backend = OnnxBackend(path, intra_op_threads)
+    metadata = backend.session.get_modelmeta().custom_metadata_map
+    if metadata.get('source_sha256') != (source_sha256 or checkpoint_sha256(model_path)) or \
+            ONNX_METADATA not in metadata:
+        print(f"⚠️  Ignoring stale export {path} (re-run src/export_onnx.py)")
+        return None
+    backend.metadata = json.loads(metadata[ONNX_METADATA])
+    return backend
@@ -11,7 +11,72 @@ BATCH_SIZE = 32
 EPOCHS = 10
 LEARNING_RATE = 0.001
 IMG_SIZE = (224, 224)  # resize for pre-trained model
+ARCH = 'resnet50'  # network to train, see ARCHITECTURES in src/architectures.py
+TEST_FRACTION = 0.2  # per-class share of data/<class>/ images held out in data/test (new images only; see prepare_data_structure)
+SEED = 0  # shuffle order and augmentation of training runs (src/engine.py) and cached feature views
+PRETRAINED_DIR = os.path.join(MODEL_DIR, "pretrained")  # vendored ImageNet backbones (src/vendor_weights.py)
+
+# Training data: decode each image once into a memory-mapped uint8 cache (src/dataset_cache.py)
+DATASET_CACHE = True
+DATASET_CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+# Frozen-backbone training on cached features (src/feature_cache.py): the backbone runs once per image
+# and augmented view, then the head trains on the stored features for every epoch
+FEATURE_CACHE = True
+FEATURE_VIEWS = 5  # augmented views per training image (each epoch draws one)
+FEATURE_CACHE_DIR = os.path.join(DATASET_CACHE_DIR, "features")
+
+# Resumable training (src/engine.py): the full training state of a run is saved to
+# RUNS_DIR/<preset>.state.pth after an epoch once this many seconds passed since the last save
+CHECKPOINT_INTERVAL = 30
+RUNS_DIR = os.path.join(MODEL_DIR, "runs")
+
+# Incremental retraining (retrain_model.py --incremental): fine-tune the current model on the images
+# added since it was trained plus a replay sample of older ones; the result replaces it unless held-out
+# accuracy drops by more than REGRESSION_TOLERANCE percentage points
+INCREMENTAL_EPOCHS = 5
+INCREMENTAL_LR = 0.0001
+REPLAY_PER_NEW = 2  # older training images replayed per new one...
+REPLAY_MAX = 256  # ...but at most this many
+REGRESSION_TOLERANCE = 0.0
+
+# Training data loading (src/loaders.py): DataLoader worker processes per loader. None derives them
+# from the core count; 'auto' measures the loader against the training step and picks the fewest
+# workers that keep the model busy
+LOADER_WORKERS = None
+LOADER_PREFETCH = 2  # batches each worker loads ahead
+
+# Inference decoding
+FAST_DECODE = True  # decode JPEGs at reduced scale (and box-reduce other formats) before resizing
+DECODE_OVERSAMPLE = 2  # decode to at least this multiple of IMG_SIZE so the resize stays antialiased
+DECODE_MAX_PIXELS = 50_000_000  # refuse images that would decode larger (after the JPEG DCT scaler); None = no limit
+
+# Offline batch prediction (MangroveClassifier.predict_batch)
+PREDICT_BATCH_SIZE = 32  # images per forward pass
+DECODE_WORKERS = min(8, os.cpu_count() or 1)  # threads decoding/preprocessing ahead of inference
+
+# Tiled inference on large scenes (src/tiling.py, MangroveClassifier.predict_tiles)
+TILE_OVERLAP = 0.25  # fraction of a tile shared with each neighbour
+TILE_SCALE = 1.0  # scene pixels per model input pixel (2.0 reads 448x448 windows for a 224x224 model)
+TILE_MAX_PIXELS = 100_000_000  # largest scene the PIL fallback decodes whole (~300 MB as RGB); rasterio has no limit
+
+# Use the INT8 model from src/quantize_model.py (CPU only)
+QUANTIZED = False
+
+# Inference backend: 'torch', or 'onnx' to run the src/export_onnx.py export with ONNX Runtime
+BACKEND = 'torch'
+
+# Torch inference precision on CPU: 'fp32', 'bf16' (autocast + channels_last, see src/precision.py)
+# or 'auto' (bf16 when the CPU has native bf16 units). bf16 is only kept if, on
+# PRECISION_CHECK_IMAGES images from TEST_DIR, no probability differs from fp32 by more than PRECISION_TOLERANCE
+PRECISION = 'fp32'
+PRECISION_TOLERANCE = 0.02
+PRECISION_CHECK_IMAGES = 32
 
 # Class names
 CLASS_NAMES = ['mangrove', 'non-mangrove']
 NUM_CLASSES = len(CLASS_NAMES)
+# Class order of checkpoints saved as a bare state_dict (no metadata). The training scripts used
+# CLASS_NAMES order (index 0 = mangrove) but the old model server read index 1 as mangrove, so it
+# can't be known from the file; None assumes CLASS_NAMES and warns on every load
+LEGACY_CLASS_NAMES = None
@@ -0,0 +1,228 @@
+"""
+Pre-decoded dataset cache for training
+Every image of an ImageFolder-style directory (one sub-folder per class) is
+decoded once, resized to IMG_SIZE and stored as uint8 (3, H, W) rows of a
+memory-mapped .npy shard. A JSON index next to it records each row's source
+file, label and (size, mtime), so a rebuild only decodes files that were added
+or changed and copies the other rows over. CachedImageDataset serves the rows as
+zero-copy tensors; augmentation then runs on tensors (utils.get_tensor_transforms)
+instead of re-decoding JPEG/WebP files every epoch.
+
+Usage: python src/dataset_cache.py [--data-dir data] [--splits train test] [--rebuild]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.datasets.folder import IMG_EXTENSIONS
+import config
+from image_io import load_rgb
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index.json'
+# Images decoded and written per chunk, so decoded rows never pile up in memory
+DECODE_CHUNK = 256
+
+def index_path(root, cache_dir=None):
+    """data/train -> data/cache/train.index.json"""
+    name = os.path.basename(os.path.normpath(root))
+    return os.path.join(cache_dir or config.DATASET_CACHE_DIR, name + INDEX_SUFFIX)
+
+def read_index(path):
+    """The index at `path`, or None if it is missing, unreadable or from another format version"""
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION:
+        return None
+    return index
+
+def scan_folder(root):
+    """
+    (classes, [(relative path, label, size, mtime_ns)]) in the order ImageFolder
+    lists them: sorted class folders, files sorted within each
+    """
+    classes = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+    files = []
+    for label, class_name in enumerate(classes):
+        for dirpath, _, filenames in sorted(os.walk(os.path.join(root, class_name), followlinks=True)):
+            for name in sorted(filenames):
+                if name.lower().endswith(IMG_EXTENSIONS):
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    files.append((os.path.relpath(path, root), label, stat.st_size, stat.st_mtime_ns))
+    return classes, files
+
+def decode(path, image_size):
+    """uint8 (3, H, W) array of the image resized to `image_size` (h, w), as transforms.Resize would"""
+    image = load_rgb(path, target_size=image_size).resize((image_size[1], image_size[0]), Image.BILINEAR)
+    return np.asarray(image).transpose(2, 0, 1)
+
+def build_cache(root, cache_dir=None, image_size=None, workers=None, rebuild=False):
+    """
+    Bring the cache of `root` up to date and return its index path.
+    Rows of files whose size and mtime are unchanged are copied from the current
+    shard; only new or modified files are decoded. Files that fail to decode are
+    skipped with a warning (and not retried until they change).
+    """
+    image_size = tuple(image_size or config.IMG_SIZE)
+    workers = workers or config.DECODE_WORKERS
+    path = index_path(root, cache_dir)
+    cache_dir = os.path.dirname(path)
+    classes, files = scan_folder(root)
+
+    old = None if rebuild else read_index(path)
+    if old is not None and (tuple(old['image_size']) != image_size
+                            or not os.path.exists(os.path.join(cache_dir, old['shard']))):
+        old = None
+    previous = {}
+    if old is not None:
+        for entry in old['entries'] + old['skipped']:
+            previous[entry['path']] = entry
+
+    def unchanged(entry, size, mtime_ns):
+        return entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns
+
+    # Same classes and the same (path, size, mtime) for every file: nothing to do
+    if old is not None and old['classes'] == classes:
+        known = {(e['path'], e['size'], e['mtime_ns']) for e in old['entries'] + old['skipped']}
+        if known == {(relative, size, mtime_ns) for relative, _, size, mtime_ns in files}:
+            return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.basename(path)[:-len(INDEX_SUFFIX)]
+    shard_name = f"{name}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}.npy"
+    shard_path = os.path.join(cache_dir, shard_name)
+    old_shard = np.load(os.path.join(cache_dir, old['shard']), mmap_mode='r') if old is not None else None
+    shard = np.lib.format.open_memmap(shard_path + '.tmp', mode='w+', dtype=np.uint8,
+                                      shape=(len(files), 3) + image_size)
+
+    entries, skipped, pending = [], [], []
+    reused = 0
+    for row, (relative, label, size, mtime_ns) in enumerate(files):
+        entry = {'path': relative, 'label': label, 'size': size, 'mtime_ns': mtime_ns, 'row': row}
+        before = previous.get(relative)
+        if unchanged(before, size, mtime_ns):
+            if 'row' not in before:
+                skipped.append(before)
+                continue
+            shard[row] = old_shard[before['row']]
+            entries.append(entry)
+            reused += 1
+        else:
+            pending.append(entry)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(pending), DECODE_CHUNK):
+            chunk = pending[i:i + DECODE_CHUNK]
+            futures = [pool.submit(decode, os.path.join(root, entry['path']), image_size) for entry in chunk]
+            for entry, future in zip(chunk, futures):
+                try:
+                    shard[entry['row']] = future.result()
+                    entries.append(entry)
+                except Exception as e:
+                    print(f"⚠️  Skipping undecodable image {entry['path']}: {e}")
+                    skipped.append({key: entry[key] for key in ('path', 'size', 'mtime_ns')})
+    shard.flush()
+    del shard, old_shard
+    entries.sort(key=lambda entry: entry['row'])
+
+    index = {
+        'version': INDEX_VERSION,
+        'root': os.path.abspath(root),
+        'image_size': list(image_size),
+        'shard': shard_name,
+        'classes': classes,
+        'entries': entries,
+        'skipped': skipped,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    # Shard first, then the index that points at it; readers never see a half-written pair
+    os.replace(shard_path + '.tmp', shard_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    shard_pattern = re.compile(rf"{re.escape(name)}-\d+-\d+\.npy")
+    for stale in os.listdir(cache_dir):
+        if shard_pattern.fullmatch(stale) and stale != shard_name:
+            os.remove(os.path.join(cache_dir, stale))
+
+    decoded = len(entries) - reused
+    print(f"🗄️  Cached {root}: {len(entries)} images ({decoded} decoded in {time.perf_counter() - start:.1f}s, "
+          f"{reused} reused, {len(skipped)} skipped)")
+    return path
+
+class CachedImageDataset(torch.utils.data.Dataset):
+    """
+    ImageFolder-compatible dataset (classes, class_to_idx, samples, targets) over
+    a build_cache shard. Items are (uint8 (3, H, W) tensor, label); the tensor is
+    a view of the memory-mapped row, so `transform` should produce a new tensor
+    (e.g. utils.get_tensor_transforms) rather than modify it in place.
+    """
+    def __init__(self, index_path, transform=None):
+        index = read_index(index_path)
+        if index is None:
+            raise ValueError(f"No dataset cache at {index_path}; run src/dataset_cache.py")
+        self.shard_path = os.path.join(os.path.dirname(index_path), index['shard'])
+        self.classes = index['classes']
+        self.class_to_idx = {name: label for label, name in enumerate(self.classes)}
+        self.samples = [(os.path.join(index['root'], entry['path']), entry['label']) for entry in index['entries']]
+        self.targets = [label for _, label in self.samples]
+        self.rows = [entry['row'] for entry in index['entries']]
+        self.transform = transform
+        self._images = None
+
+    @property
+    def images(self):
+        # Opened lazily so each DataLoader worker maps the shard itself instead of unpickling a copy.
+        # Copy-on-write keeps the mapping writable for torch.from_numpy without touching the file.
+        if self._images is None:
+            self._images = np.load(self.shard_path, mmap_mode='c')
+        return self._images
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        image = torch.from_numpy(self.images[self.rows[index]])
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[index]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=config.DATA_DIR)
+    parser.add_argument('--splits', nargs='+', default=['train', 'test'])
+    parser.add_argument('--cache-dir', default=config.DATASET_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='decoding threads')
+    parser.add_argument('--rebuild', action='store_true', help='decode every image again')
+    args = parser.parse_args()
+
+    for split in args.splits:
+        root = os.path.join(args.data_dir, split)
+        if not os.path.isdir(root):
+            print(f"❌ Split not found: {root}")
+            sys.exit(1)
+        path = build_cache(root, args.cache_dir, workers=args.workers, rebuild=args.rebuild)
+        index = read_index(path)
+        shard_mb = os.path.getsize(os.path.join(os.path.dirname(path), index['shard'])) / 1e6
+        print(f"✅ {split}: {len(index['entries'])} images, {shard_mb:.1f} MB shard, index {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Training engine behind every training script
+One loop trains any registered architecture from a TrainingConfig preset: the
+model (architecture, frozen ImageNet backbone or not, warm start from the current
+checkpoint), the data (augmentation, cached backbone features) and the schedule
+(epochs, batch size, learning rate, StepLR, keeping the last or the best epoch).
+src/train.py, retrain_model.py, simple_retrain.py and robust_retrain.py run presets.
+
+After an epoch the full training state (model, optimizer, scheduler, RNG states,
+epoch, history) is saved to RUNS_DIR/<preset>.state.pth, at most once every
+CHECKPOINT_INTERVAL seconds, and --resume continues from it. Each epoch's
+shuffle order and augmentations are derived from (SEED, epoch, file name) alone,
+so a resumed run ends with the same weights as an uninterrupted one, whatever
+the number of loader workers.
+Every saved model gets a training manifest (src/manifest.py) listing the images
+it was trained on, which incremental retraining compares the data against.
+
+Usage: python src/engine.py [--preset train|retrain|simple|robust] [--resume] [--epochs N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import hashlib
+import argparse
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+import torch
+import torch.nn as nn
+import config
+from architectures import (ARCHITECTURES, build_model, freeze_backbone, trainable_parameters, read_checkpoint,
+                           save_checkpoint)
+from feature_cache import build_feature_cache, head_module, predict_head, sample_identities, view_seed
+from loaders import make_loader, resolve_workers
+from manifest import write_manifest
+from utils import get_datasets, prepare_data_structure
+
+STATE_VERSION = 1
+
+# name: preset and run state name; arch: registered architecture; pretrained: start from the ImageNet
+# backbone and train only the head; warm_start: start from the current model checkpoint instead;
+# step_size/gamma: StepLR schedule (None keeps the learning rate); augment: utils.AUGMENTATIONS entry;
+# feature_cache: train a frozen backbone's head on cached features; keep: 'last' epoch or 'best' test accuracy
+TrainingConfig = namedtuple('TrainingConfig', [
+    'name', 'arch', 'pretrained', 'warm_start', 'epochs', 'batch_size', 'lr', 'step_size', 'gamma',
+    'augment', 'feature_cache', 'keep'])
+
+PRESETS = {
+    # src/train.py: head of the ImageNet backbone
+    'train': TrainingConfig(
+        name='train', arch=config.ARCH, pretrained=True, warm_start=False, epochs=config.EPOCHS,
+        batch_size=config.BATCH_SIZE, lr=config.LEARNING_RATE, step_size=7, gamma=0.1, augment='standard',
+        feature_cache=config.FEATURE_CACHE, keep='last'),
+    # retrain_model.py: continue from the current model, keep the best epoch
+    'retrain': TrainingConfig(
+        name='retrain', arch=config.ARCH, pretrained=True, warm_start=True, epochs=config.EPOCHS,
+        batch_size=config.BATCH_SIZE, lr=config.LEARNING_RATE, step_size=7, gamma=0.1, augment='standard',
+        feature_cache=config.FEATURE_CACHE, keep='best'),
+    # simple_retrain.py: ResNet50 head, constant learning rate, lighter augmentation
+    'simple': TrainingConfig(
+        name='simple', arch='resnet50', pretrained=True, warm_start=False, epochs=10, batch_size=8, lr=0.001,
+        step_size=None, gamma=None, augment='light', feature_cache=config.FEATURE_CACHE, keep='last'),
+    # robust_retrain.py: small CNN from scratch, no augmentation
+    'robust': TrainingConfig(
+        name='robust', arch='simple_cnn', pretrained=False, warm_start=False, epochs=15, batch_size=4, lr=0.001,
+        step_size=None, gamma=None, augment='none', feature_cache=False, keep='best'),
+    # retrain_model.py --incremental: short fine-tune of the current model on new images plus replay
+    'incremental': TrainingConfig(
+        name='incremental', arch=config.ARCH, pretrained=True, warm_start=True, epochs=config.INCREMENTAL_EPOCHS,
+        batch_size=config.BATCH_SIZE, lr=config.INCREMENTAL_LR, step_size=None, gamma=None, augment='standard',
+        feature_cache=config.FEATURE_CACHE, keep='last')
+}
+
+def state_path(name, runs_dir=None):
+    """models/runs/<preset name>.state.pth"""
+    return os.path.join(runs_dir or config.RUNS_DIR, f"{name}.state.pth")
+
+def epoch_generator(seed, epoch):
+    """Random generator of one epoch of a run: the same for the same (seed, epoch)"""
+    return torch.Generator().manual_seed(seed * 1000003 + epoch)
+
+def get_rng_state():
+    """Global RNG states (torch, CUDA, numpy, random): dropout and anything else not seeded per epoch"""
+    return {
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'numpy': np.random.get_state(),
+        'python': random.getstate()
+    }
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+
+def data_fingerprint(*datasets):
+    """Hash of the (path, size, mtime) of every sample: a run can only resume on the data it started with"""
+    digest = hashlib.sha1()
+    for dataset in datasets:
+        for identity in sample_identities(dataset):
+            digest.update(repr(identity).encode())
+    return digest.hexdigest()
+
+def backup_model(model_path, backup_dir):
+    """Copy the current model to <backup_dir>/mangrove_model_backup_<timestamp>.pth; returns the copy's path"""
+    if not os.path.exists(model_path):
+        return None
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_path = os.path.join(backup_dir, f"mangrove_model_backup_{timestamp}.pth")
+    shutil.copy2(model_path, backup_path)
+    print(f"📦 Backed up existing model to: {backup_path}")
+    return backup_path
+
+def accuracy(predictions, labels):
+    """Percentage of matching predictions (0 for no labels)"""
+    return 100 * sum(int(p == l) for p, l in zip(predictions, labels)) / len(labels) if labels else 0.0
+
+class EpochSampler(torch.utils.data.Sampler):
+    """Shuffled (sample index, epoch) keys of `indices` for one epoch; the order depends only on (seed, epoch)"""
+    def __init__(self, indices, seed=0):
+        self.indices = list(indices)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        order = torch.randperm(len(self.indices), generator=epoch_generator(self.seed, self.epoch))
+        return iter([(self.indices[i], self.epoch) for i in order.tolist()])
+
+class EpochViews(torch.utils.data.Dataset):
+    """
+    Samples of `dataset` by EpochSampler key: sample i in epoch e is augmented
+    under view_seed(file, e, seed), in whichever process loads it
+    """
+    def __init__(self, dataset, seed=0):
+        self.dataset = dataset
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, key):
+        index, epoch = key
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(view_seed(self.dataset.samples[index][0], epoch, self.seed))
+            return self.dataset[index]
+
+def feature_batches(features, labels, batch_size, generator):
+    """One epoch of (features, labels) batches from (N, views, D) features, one random view per image"""
+    count, views = features.shape[:2]
+    view = torch.randint(views, (count,), generator=generator)
+    order = torch.randperm(count, generator=generator)
+    for start in range(0, count, batch_size):
+        batch = order[start:start + batch_size]
+        yield features[batch, view[batch]], labels[batch]
+
+class Trainer:
+    """
+    Runs one preset: a fresh run, or the resumption of its saved state.
+    The model warm-starts from (and is saved to) models/mangrove_model.pth unless
+    `output_path` says otherwise; `select(train_dataset, test_dataset)` may pick the indices of
+    the training images to train on (all by default, none to skip the run).
+    """
+    def __init__(self, preset, data_dir=None, model_dir=None, device=None, runs_dir=None, output_path=None,
+                 select=None):
+        self.preset = preset
+        self.data_dir = data_dir or config.DATA_DIR
+        self.model_dir = model_dir or config.MODEL_DIR
+        self.model_path = os.path.join(self.model_dir, "mangrove_model.pth")
+        self.output_path = output_path or self.model_path
+        self.state_path = state_path(preset.name, runs_dir)
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.select = select
+        self.train_indices = None
+        self.history = {'loss': [], 'train_accuracy': [], 'test_accuracy': []}
+        self.best_accuracy = None
+        self.best_epoch = None
+        # Test accuracy of the warm-started model before training, and of the kept model
+        self.initial_accuracy = None
+        self.test_accuracy = None
+
+    def create_model(self, classes):
+        """The preset's network: warm-started from the current checkpoint, or a fresh head"""
+        preset = self.preset
+        if preset.warm_start and os.path.exists(self.model_path):
+            state_dict, metadata = read_checkpoint(self.model_path)
+            if metadata['classes'] == list(classes):
+                # Continue training the network the checkpoint was saved from
+                self.preset = preset = preset._replace(arch=metadata['arch'])
+                print(f"🔄 Warm start from {self.model_path} ({preset.arch})")
+                self.warm_started = True
+                model = build_model(preset.arch, len(classes))
+                model.load_state_dict(state_dict)
+                return freeze_backbone(model, preset.arch) if preset.pretrained else model
+            print(f"⚠️  {self.model_path} was trained on classes {metadata['classes']}; starting a new model")
+        print(f"🆕 Creating new {preset.arch} model")
+        model = build_model(preset.arch, len(classes), pretrained=preset.pretrained)
+        return freeze_backbone(model, preset.arch) if preset.pretrained else model
+
+    def save_state(self, epoch):
+        """Everything needed to continue after `epoch` completed epochs, replaced atomically"""
+        state = {
+            'version': STATE_VERSION,
+            'preset': self.preset._asdict(),
+            'seed': self.seed,
+            'epoch': epoch,
+            'classes': self.classes,
+            'data': self.fingerprint,
+            'train_indices': self.train_indices,
+            'model': self.model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'scheduler': self.scheduler.state_dict() if self.scheduler is not None else None,
+            'rng': get_rng_state(),
+            'history': self.history,
+            'best_accuracy': self.best_accuracy,
+            'best_epoch': self.best_epoch,
+            'initial_accuracy': self.initial_accuracy,
+            'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, self.state_path)
+
+    def prepare_data(self):
+        """Set up datasets, model, optimizer and batches; returns False if there is nothing to train on"""
+        preset = self.preset
+        self.train_dir = os.path.join(self.data_dir, "train")
+        self.test_dir = os.path.join(self.data_dir, "test")
+        train_data, test_data = get_datasets(self.train_dir, self.test_dir, config.IMG_SIZE, augment=preset.augment)
+        if len(train_data) == 0:
+            print(f"❌ No training images in {self.train_dir}")
+            return False
+        self.train_data, self.test_data = train_data, test_data
+        self.classes = list(train_data.classes)
+        self.fingerprint = data_fingerprint(train_data, test_data)
+        print(f"✅ Data loaded. Classes: {self.classes} ({len(train_data)} train, {len(test_data)} test images)")
+        if self.resumed is not None:
+            self.train_indices = self.resumed['train_indices']
+        elif self.select is not None:
+            self.train_indices = self.select(train_data, test_data)
+            if not self.train_indices:
+                return False
+        indices = self.train_indices if self.train_indices is not None else range(len(train_data))
+
+        if self.resumed is None:
+            model = self.create_model(self.classes)
+            preset = self.preset
+        else:
+            model = build_model(preset.arch, len(self.classes))
+            model.load_state_dict(self.resumed['model'])
+            if preset.pretrained:
+                freeze_backbone(model, preset.arch)
+        self.model = model.to(self.device)
+        self.on_features = preset.feature_cache and preset.pretrained and ARCHITECTURES[preset.arch].pretrained
+
+        if self.on_features:
+            print(f"🧠 Caching backbone features ({config.FEATURE_VIEWS} augmented views per training image)...")
+            # Shared by every preset with this augmentation: only images new to the cache hit the backbone
+            features, labels = build_feature_cache(self.model, preset.arch, train_data, f"train-{preset.augment}",
+                                                   views=config.FEATURE_VIEWS, seed=self.seed, device=self.device)
+            indices = list(indices)
+            self.train_features = torch.from_numpy(np.array(features[indices])).to(self.device)
+            self.train_labels = torch.from_numpy(labels[indices]).to(self.device)
+            features, labels = build_feature_cache(self.model, preset.arch, test_data, "test", device=self.device)
+            self.test_features, self.test_labels = np.array(features), labels
+            self.trained = head_module(self.model, preset.arch)
+        else:
+            num_workers = resolve_workers(train_data, preset.batch_size)
+            self.sampler = EpochSampler(indices, self.seed)
+            # Seeded loaders draw their worker seeds from their own generator, not the global RNG that
+            # dropout uses, so the global stream doesn't depend on worker counts or restarts
+            self.train_loader = make_loader(EpochViews(train_data, self.seed), preset.batch_size,
+                                            num_workers=num_workers, seed=self.seed, sampler=self.sampler)
+            self.test_loader = make_loader(test_data, preset.batch_size, num_workers=num_workers, seed=self.seed)
+            self.trained = self.model
+
+        self.optimizer = torch.optim.Adam(trainable_parameters(self.trained), lr=preset.lr)
+        self.scheduler = None
+        if preset.step_size:
+            self.scheduler = torch.optim.lr_scheduler.StepLR(self.optimizer, step_size=preset.step_size,
+                                                             gamma=preset.gamma)
+        return True
+
+    def batches(self, epoch):
+        """(inputs, labels) batches of one epoch: images, or cached features of one view per image"""
+        if self.on_features:
+            yield from feature_batches(self.train_features, self.train_labels, self.preset.batch_size,
+                                       epoch_generator(self.seed, epoch))
+            return
+        self.sampler.set_epoch(epoch)
+        for images, labels in self.train_loader:
+            yield images.to(self.device), labels.to(self.device)
+
+    def train_epoch(self, epoch):
+        """Train for one epoch; returns (mean batch loss, train accuracy %)"""
+        criterion = nn.CrossEntropyLoss()
+        self.trained.train()
+        running_loss, correct, total, steps = 0.0, 0, 0, 0
+        for inputs, labels in self.batches(epoch):
+            self.optimizer.zero_grad()
+            outputs = self.trained(inputs)
+            loss = criterion(outputs, labels)
+            loss.backward()
+            self.optimizer.step()
+
+            running_loss += loss.item()
+            correct += (outputs.argmax(1) == labels).sum().item()
+            total += labels.size(0)
+            steps += 1
+        if self.scheduler is not None:
+            self.scheduler.step()
+        return running_loss / max(steps, 1), 100 * correct / max(total, 1)
+
+    def predict_test(self):
+        """(predicted classes, true classes) on the test split"""
+        if self.on_features:
+            return list(predict_head(self.trained, self.test_features)), list(self.test_labels)
+        self.model.eval()
+        predictions, labels = [], []
+        with torch.no_grad():
+            for images, batch_labels in self.test_loader:
+                predictions.extend(self.model(images.to(self.device)).argmax(1).cpu().numpy())
+                labels.extend(batch_labels.numpy())
+        return predictions, labels
+
+    def evaluate(self):
+        """Test accuracy % (0 without test images)"""
+        return accuracy(*self.predict_test())
+
+    def run(self, resume=False, epochs=None):
+        """
+        Train the preset (or, with `resume`, continue its saved run, optionally up to
+        `epochs`); returns the model, or None if there was nothing to train
+        """
+        self.resumed = None
+        self.warm_started = False
+        start_epoch = 0
+        if resume:
+            if not os.path.exists(self.state_path):
+                print(f"❌ No saved '{self.preset.name}' run at {self.state_path}")
+                return None
+            self.resumed = torch.load(self.state_path, map_location='cpu', weights_only=False)
+            self.preset = TrainingConfig(**self.resumed['preset'])
+            start_epoch = self.resumed['epoch']
+            print(f"⏯️  Resuming '{self.preset.name}' run after epoch {start_epoch} "
+                  f"(saved {self.resumed['saved_at']})")
+        else:
+            print("📂 Preparing data structure...")
+            counts = prepare_data_structure(self.data_dir)
+            for class_name in config.CLASS_NAMES:
+                print(f"   • {class_name}: {counts[('train', class_name)]} train, "
+                      f"{counts[('test', class_name)]} test")
+        if epochs:
+            self.preset = self.preset._replace(epochs=epochs)
+        self.seed = self.resumed['seed'] if self.resumed is not None else config.SEED
+        if self.resumed is None:
+            torch.manual_seed(self.seed)
+
+        if not self.prepare_data():
+            return None
+        preset = self.preset
+        if self.resumed is None and self.output_path == self.model_path:
+            backup_model(self.model_path, os.path.join(self.model_dir, "backups"))
+        if self.resumed is not None:
+            if self.resumed['data'] != self.fingerprint:
+                print("❌ The training data changed since this run started; start a new run instead of resuming")
+                return None
+            self.optimizer.load_state_dict(self.resumed['optimizer'])
+            if self.scheduler is not None:
+                self.scheduler.load_state_dict(self.resumed['scheduler'])
+            self.history = self.resumed['history']
+            self.best_accuracy = self.resumed['best_accuracy']
+            self.best_epoch = self.resumed['best_epoch']
+            self.initial_accuracy = self.resumed['initial_accuracy']
+            set_rng_state(self.resumed['rng'])
+            self.resumed = None
+
+        print(f"🖥️  Using device: {self.device}")
+        print(f"⚙️  {preset.name}: {preset.arch}, epochs {preset.epochs}, learning rate {preset.lr}, "
+              f"batch size {preset.batch_size}" + (" (cached features)" if self.on_features else ""))
+        if self.warm_started and start_epoch == 0:
+            self.initial_accuracy = self.evaluate()
+            print(f"📏 Test accuracy before training: {self.initial_accuracy:.2f}%")
+        if start_epoch >= preset.epochs:
+            print(f"✅ Run already trained for {start_epoch} epochs (pass --epochs to train further)")
+        else:
+            print(f"🚀 Training epochs {start_epoch + 1}-{preset.epochs}...")
+        last_saved = time.monotonic()
+        for epoch in range(start_epoch, preset.epochs):
+            loss, train_accuracy = self.train_epoch(epoch)
+            test_accuracy = self.evaluate()
+            self.history['loss'].append(loss)
+            self.history['train_accuracy'].append(train_accuracy)
+            self.history['test_accuracy'].append(test_accuracy)
+            print(f"Epoch {epoch+1}/{preset.epochs} - Loss: {loss:.4f}, Train Acc: {train_accuracy:.2f}%, "
+                  f"Test Acc: {test_accuracy:.2f}%")
+
+            if preset.keep == 'best' and (self.best_accuracy is None or test_accuracy > self.best_accuracy):
+                self.best_accuracy, self.best_epoch = test_accuracy, epoch + 1
+                save_checkpoint(self.model, self.output_path, preset.arch, classes=self.classes)
+                print(f"💾 New best model saved (Test Acc: {test_accuracy:.2f}%)")
+            if epoch + 1 == preset.epochs or time.monotonic() - last_saved >= config.CHECKPOINT_INTERVAL:
+                self.save_state(epoch + 1)
+                last_saved = time.monotonic()
+
+        if preset.keep == 'last' or self.best_epoch is None:
+            save_checkpoint(self.model, self.output_path, preset.arch, classes=self.classes)
+            print(f"💾 Model saved to: {self.output_path}")
+        elif self.best_epoch != len(self.history['loss']):
+            # Report on the kept model, not the last epoch
+            self.model.load_state_dict(read_checkpoint(self.output_path, map_location=self.device)[0])
+            print(f"🏆 Kept epoch {self.best_epoch} (Test Acc: {self.best_accuracy:.2f}%)")
+        write_manifest(self.output_path, self.train_data, self.train_dir, self.test_data, self.test_dir)
+        self.report()
+        return self.model
+
+    def report(self):
+        """Classification report, confusion matrix and training curves of the kept model"""
+        from sklearn.metrics import classification_report, confusion_matrix
+
+        predictions, labels = self.predict_test()
+        self.test_accuracy = accuracy(predictions, labels)
+        print(f"🎯 Test Accuracy: {self.test_accuracy:.2f}%")
+        if labels:
+            print("\n📋 Classification Report:")
+            print(classification_report(labels, predictions, labels=list(range(len(self.classes))),
+                                        target_names=self.classes, zero_division=0))
+            matrix = confusion_matrix(labels, predictions, labels=list(range(len(self.classes))))
+            print("🔀 Confusion Matrix (rows: actual, columns: predicted):")
+            print(f"{'':>14}" + "".join(f"{name:>14}" for name in self.classes))
+            for name, row in zip(self.classes, matrix):
+                print(f"{name:>14}" + "".join(f"{count:>14}" for count in row))
+        else:
+            print("⚠️  No test data available for evaluation")
+        self.save_plot()
+
+    def save_plot(self):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(12, 4))
+        plt.subplot(1, 2, 1)
+        plt.plot(self.history['loss'])
+        plt.title('Training Loss')
+        plt.xlabel('Epoch')
+        plt.ylabel('Loss')
+
+        plt.subplot(1, 2, 2)
+        plt.plot(self.history['train_accuracy'], label='Train')
+        plt.plot(self.history['test_accuracy'], label='Test')
+        plt.title('Accuracy')
+        plt.xlabel('Epoch')
+        plt.ylabel('Accuracy (%)')
+        plt.legend()
+
+        plt.tight_layout()
+        plot_path = os.path.join(self.model_dir, 'training_history.png')
+        plt.savefig(plot_path)
+        plt.close()
+        print(f"📈 Training history saved to {plot_path}")
+
+def main(preset=None, description=None):
+    """Command line of the engine; the training scripts call it with their preset"""
+    parser = argparse.ArgumentParser(description=description or __doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default=preset or 'train')
+    parser.add_argument('--resume', action='store_true',
+                        help=f"continue the preset's saved run from {config.RUNS_DIR}")
+    parser.add_argument('--epochs', type=int, default=None, help='total epochs (also extends a resumed run)')
+    parser.add_argument('--lr', type=float, default=None, help='learning rate of a new run')
+    parser.add_argument('--batch-size', type=int, default=None, help='batch size of a new run')
+    parser.add_argument('--data-dir', default=config.DATA_DIR)
+    parser.add_argument('--model-dir', default=config.MODEL_DIR)
+    args = parser.parse_args()
+
+    settings = PRESETS[args.preset]
+    if args.lr:
+        settings = settings._replace(lr=args.lr)
+    if args.batch_size:
+        settings = settings._replace(batch_size=args.batch_size)
+    trainer = Trainer(settings, args.data_dir, args.model_dir)
+    start = time.time()
+    try:
+        model = trainer.run(resume=args.resume, epochs=args.epochs)
+    except KeyboardInterrupt:
+        print(f"\n⏸️  Interrupted. Continue from the last saved epoch with: --preset {args.preset} --resume")
+        sys.exit(130)
+    if model is None:
+        sys.exit(1)
+    print(f"\n✅ Training completed in {(time.time() - start) / 60:.1f} minutes")
+    print("🔄 A running model server picks up the new model automatically.")
+
+if __name__ == "__main__":
+    main()
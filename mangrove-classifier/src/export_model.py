@@ -0,0 +1,135 @@
+"""
+Export a trained checkpoint as a frozen TorchScript module for inference
+The module is traced and frozen (weights become constants, conv+BN folded), then
+saved next to the checkpoint as `<name>.frozen.pt`. Loaders pick it up
+automatically while it matches the checkpoint it was exported from, and apply
+optimize_for_inference on load: its CPU fusions (MKLDNN weight layouts) cannot
+be serialized, so they are rebuilt in each process.
+
+Usage: python src/export_model.py [--model models/mangrove_model.pth] [--device cpu]
+"""
+
+import os
+import json
+import argparse
+import torch
+import config
+from architectures import load_checkpoint, with_embedding, logits
+from backends import TORCHSCRIPT_METADATA as METADATA_FILE, checkpoint_sha256, export_path
+
+def frozen_path(model_path):
+    """Where the frozen export of a checkpoint lives: models/mangrove_model.pth -> models/mangrove_model.frozen.pt"""
+    return export_path(model_path, 'frozen')
+
+def build_eager_model(model_path, device):
+    """
+    The eager network a checkpoint describes, returning (logits, embedding) so
+    exports expose the embedding too; returns (model, checkpoint metadata)
+    """
+    model, metadata = load_checkpoint(model_path, device)
+    return with_embedding(model, metadata['arch']).eval(), metadata
+
+def export_frozen(model_path, device=None, output_path=None):
+    """Trace, freeze and optimize the checkpoint; returns (written path, max logit diff vs eager)"""
+    device = torch.device(device or 'cpu')
+    output_path = output_path or frozen_path(model_path)
+    model, checkpoint = build_eager_model(model_path, device)
+    example = torch.zeros(1, 3, *checkpoint['input_size'], device=device)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        # freeze() inlines the weights and folds BatchNorm into the preceding convs
+        frozen = torch.jit.freeze(traced)
+
+    def max_logit_diff(tmp_path):
+        # optimize_for_inference rewrites the module in place, so check a freshly loaded copy
+        served = optimize(torch.jit.load(tmp_path, map_location=device).eval(), device)
+        check = torch.randn(2, 3, *checkpoint['input_size'], device=device)
+        with torch.no_grad():
+            return (logits(model(check)) - logits(served(check))).abs().max().item()
+
+    max_diff = write_export(frozen, output_path, model_path, device, check=max_logit_diff, tolerance=1e-3,
+                            checkpoint=checkpoint)
+    return output_path, max_diff
+
+def write_export(module, output_path, model_path, device, check, tolerance, checkpoint, **metadata):
+    """
+    Save a TorchScript export with metadata tying it to its source checkpoint
+    and carrying that checkpoint's metadata (architecture, classes, preprocessing).
+    `check(tmp_path)` reports the max logit difference from the eager model; the
+    export is only published (atomically) if it stays within `tolerance`.
+    """
+    metadata.update({
+        'source_sha256': checkpoint_sha256(model_path),
+        'device': torch.device(device).type,
+        'torch_version': torch.__version__,
+        'checkpoint': checkpoint
+    })
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    torch.jit.save(module, tmp_path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+    try:
+        max_diff = check(tmp_path)
+        if max_diff > tolerance:
+            raise RuntimeError(f"Export differs from the eager model (max logit diff {max_diff:.2e})")
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    # Atomic replace so a watching server never sees a half-written export
+    os.replace(tmp_path, output_path)
+    return max_diff
+
+def optimize(module, device):
+    """Apply the non-serializable inference fusions to a frozen module (CPU only)"""
+    if torch.device(device).type != 'cpu':
+        return module
+    return torch.jit.optimize_for_inference(module)
+
+def load_export(path, model_path, device, source_sha256=None, exporter='src/export_model.py'):
+    """
+    Load the TorchScript export at `path` if it exists, was exported (with its
+    metadata) from this exact checkpoint and for this device type, as
+    (module, checkpoint metadata);
+    otherwise return None so the caller falls back to the eager model.
+    """
+    if not os.path.exists(path):
+        return None
+
+    extra_files = {METADATA_FILE: ''}
+    module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    metadata = json.loads(extra_files[METADATA_FILE] or '{}')
+    # An export without the checkpoint's metadata predates self-describing exports: rebuild it too
+    if metadata.get('source_sha256') != (source_sha256 or checkpoint_sha256(model_path)) or \
+            not metadata.get('checkpoint'):
+        print(f"⚠️  Ignoring stale export {path} (re-run {exporter})")
+        return None
+    if metadata.get('device') != torch.device(device).type:
+        print(f"⚠️  Ignoring export {path}: exported for {metadata.get('device')}, running on {device}")
+        return None
+    return module.eval(), metadata['checkpoint']
+
+def load_frozen(model_path, device, source_sha256=None):
+    """Frozen export of `model_path` ready for inference as (module, metadata), or None (see load_export)"""
+    loaded = load_export(frozen_path(model_path), model_path, device, source_sha256)
+    if loaded is None:
+        return None
+    module, checkpoint = loaded
+    return optimize(module, device), checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--device', default='cpu', help='device the export will run on (cpu or cuda)')
+    parser.add_argument('--output', help='output path (default: <model>.frozen.pt)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        raise SystemExit(1)
+
+    print(f"🧊 Exporting {args.model} for {args.device}...")
+    output_path, max_diff = export_frozen(args.model, args.device, args.output)
+    print(f"✅ Frozen module saved to {output_path} (max logit diff vs eager: {max_diff:.2e})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Export a trained checkpoint to ONNX for the ONNX Runtime backend
+Writes `<name>.onnx` next to the checkpoint with a dynamic batch dimension and
+the source checkpoint's SHA-256 in its metadata, then runs a parity check of
+ONNX Runtime against the torch model on data/test. Select the backend with
+BACKEND = 'onnx' in src/config.py or MODEL_BACKEND=onnx for the server.
+
+Usage: python src/export_onnx.py [--model models/mangrove_model.pth] [--data data/test] [--parity-only]
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import config
+from image_io import load_rgb
+from backends import (ONNX_INPUT, ONNX_OUTPUT, ONNX_EMBEDDING, ONNX_METADATA, checkpoint_sha256,
+                      export_path, load_onnx)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def onnx_path(model_path):
+    """models/mangrove_model.pth -> models/mangrove_model.onnx"""
+    return export_path(model_path, 'onnx')
+
+def export_onnx(model_path, output_path=None, opset=17):
+    """Export the eager model with a dynamic batch axis; returns the written path"""
+    import torch
+    import onnx
+    from export_model import build_eager_model
+
+    output_path = output_path or onnx_path(model_path)
+    model, checkpoint = build_eager_model(model_path, 'cpu')
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(model, torch.zeros(1, 3, *checkpoint['input_size']), tmp_path,
+                          input_names=[ONNX_INPUT], output_names=[ONNX_OUTPUT, ONNX_EMBEDDING],
+                          dynamic_axes={ONNX_INPUT: {0: 'batch'}, ONNX_OUTPUT: {0: 'batch'},
+                                        ONNX_EMBEDDING: {0: 'batch'}},
+                          opset_version=opset, dynamo=False)
+
+    # Tie the export to its checkpoint so loaders can detect a stale file, and carry
+    # the checkpoint metadata so the backend preprocesses and labels without torch
+    exported = onnx.load(tmp_path)
+    for key, value in (('source_sha256', checkpoint_sha256(model_path)),
+                       (ONNX_METADATA, json.dumps(checkpoint))):
+        entry = exported.metadata_props.add()
+        entry.key, entry.value = key, value
+    onnx.save(exported, tmp_path)
+    # Atomic replace so a watching server never sees a half-written export
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def check_parity(model_path, data_dir, batch_size=8):
+    """
+    Run torch and ONNX Runtime on the same preprocessed images.
+    Returns (number of images, max probability difference, prediction agreement).
+    """
+    import torch
+    from architectures import logits
+    from export_model import build_eager_model
+
+    image_paths = [os.path.join(dirpath, name) for dirpath, _, filenames in os.walk(data_dir)
+                   for name in sorted(filenames) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    if not image_paths:
+        raise FileNotFoundError(f"No images found in {data_dir}")
+
+    model, _ = build_eager_model(model_path, 'cpu')
+    backend = load_onnx(model_path)
+    if backend is None:
+        raise RuntimeError(f"No up-to-date ONNX export at {onnx_path(model_path)}")
+
+    max_diff, agree = 0.0, 0
+    for start in range(0, len(image_paths), batch_size):
+        batch = np.stack([backend.preprocess(load_rgb(path, target_size=backend.input_size))
+                          for path in image_paths[start:start + batch_size]])
+        with torch.no_grad():
+            expected = torch.softmax(logits(model(torch.from_numpy(batch))), dim=1).numpy()
+        actual = backend.predict(batch)
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+        agree += int((expected.argmax(1) == actual.argmax(1)).sum())
+    return len(image_paths), max_diff, agree / len(image_paths)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--data', default=config.TEST_DIR, help='images for the parity check')
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='max allowed probability difference')
+    parser.add_argument('--parity-only', action='store_true', help='only check an existing export')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        sys.exit(1)
+
+    if not args.parity_only:
+        print(f"📦 Exporting {args.model} to ONNX (opset {args.opset})...")
+        print(f"✅ ONNX model saved to {export_onnx(args.model, opset=args.opset)}")
+
+    count, max_diff, agreement = check_parity(args.model, args.data)
+    print(f"🔬 Parity on {args.data} ({count} images): max probability diff {max_diff:.2e}, "
+          f"prediction agreement {agreement:.2%}")
+    if max_diff > args.tolerance or agreement < 1.0:
+        print(f"❌ ONNX Runtime output differs from torch beyond tolerance {args.tolerance:g}")
+        sys.exit(1)
+    print("✅ ONNX Runtime matches torch")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Cached-feature training for frozen backbones
+With a frozen backbone only the classification head learns, yet a normal epoch
+still pushes every image through the whole network. Here the backbone runs once
+per (image, augmented view): the head's input (ResNet50's pooled 2048-d
+features) is stored in a memory-mapped .npy file, and the head then trains on
+the stored features for every epoch, each epoch drawing one view per image.
+View v of an image is always augmented with the same seed, so features can be
+reused across runs. They are recomputed when the backbone weights, the
+transform, the view count or the seed change, and per image when its file does.
+The backbone runs in eval mode, so BatchNorm keeps its ImageNet statistics.
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import numpy as np
+import torch
+import config
+from architectures import ARCHITECTURES
+from loaders import make_loader
+
+FEATURE_INDEX_VERSION = 1
+INDEX_SUFFIX = '.features.json'
+
+def head_module(model, arch):
+    """The classification layer of a build_model() network"""
+    return model.get_submodule(ARCHITECTURES[arch].head)
+
+def backbone_fingerprint(model, arch):
+    """Hash of every weight and buffer outside the head: what the cached features depend on"""
+    prefix = ARCHITECTURES[arch].head + '.'
+    digest = hashlib.sha1()
+    for name, tensor in sorted(model.state_dict().items()):
+        if not name.startswith(prefix):
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+def view_seed(path, view, seed=0):
+    """Seed of the augmentation of view `view` of an image file: stable across runs, sample order and data moves"""
+    return (zlib.crc32(f"{os.path.basename(path)}:{view}".encode()) ^ seed) & 0xffffffff
+
+class SeededViews(torch.utils.data.Dataset):
+    """(sample index, view) items of `dataset`, each transformed under its own view_seed"""
+    def __init__(self, dataset, items, seed=0):
+        self.dataset = dataset
+        self.items = items
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        index, view = self.items[i]
+        torch.manual_seed(view_seed(self.dataset.samples[index][0], view, self.seed))
+        return self.dataset[index][0]
+
+def extract_features(model, arch, dataset, items, seed=0, batch_size=None, device='cpu'):
+    """(len(items), D) float32 head inputs of the (sample index, view) `items` of `dataset`"""
+    if not items:
+        return np.zeros((0, head_module(model, arch).in_features), dtype=np.float32)
+    captured = []
+    hook = head_module(model, arch).register_forward_pre_hook(lambda module, inputs: captured.append(inputs[0]))
+    loader = make_loader(SeededViews(dataset, items, seed), batch_size or config.BATCH_SIZE)
+    was_training = model.training
+    model.eval()
+    try:
+        # Per-view seeding must not disturb the caller's random stream
+        with torch.random.fork_rng(devices=[]), torch.no_grad():
+            for images in loader:
+                model(images.to(device))
+    finally:
+        hook.remove()
+        model.train(was_training)
+    return torch.cat(captured).flatten(1).float().cpu().numpy()
+
+def sample_identities(dataset):
+    """(path, size, mtime_ns) of every sample: a cached row stays valid while its file is unchanged"""
+    identities = []
+    for path, _ in dataset.samples:
+        stat = os.stat(path)
+        identities.append((path, stat.st_size, stat.st_mtime_ns))
+    return identities
+
+def build_feature_cache(model, arch, dataset, name, views=1, seed=0, cache_dir=None, batch_size=None,
+                        device='cpu'):
+    """
+    Features of `views` augmented views of every sample of `dataset` (anything
+    with ImageFolder-style `samples`, e.g. CachedImageDataset), stored under
+    `name` in `cache_dir`. Returns ((N, views, D) float32 features, (N,) labels).
+    """
+    cache_dir = cache_dir or config.FEATURE_CACHE_DIR
+    index_path = os.path.join(cache_dir, name + INDEX_SUFFIX)
+    key = hashlib.sha1(json.dumps({
+        'arch': arch,
+        'backbone': backbone_fingerprint(model, arch),
+        'transform': repr(getattr(dataset, 'transform', None)),
+        'views': views,
+        'seed': seed
+    }, sort_keys=True).encode()).hexdigest()
+    identities = sample_identities(dataset)
+    labels = np.array([label for _, label in dataset.samples], dtype=np.int64)
+
+    old = None
+    try:
+        with open(index_path) as f:
+            old = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if old is not None and (old.get('version') != FEATURE_INDEX_VERSION or old.get('key') != key
+                            or not os.path.exists(os.path.join(cache_dir, old['features']))):
+        old = None
+    previous = {}
+    if old is not None:
+        previous = {tuple(entry['identity']): entry['row'] for entry in old['entries']}
+        if [tuple(entry['identity']) for entry in old['entries']] == identities:
+            return np.load(os.path.join(cache_dir, old['features']), mmap_mode='r'), labels
+
+    start = time.perf_counter()
+    old_features = np.load(os.path.join(cache_dir, old['features']), mmap_mode='r') if old is not None else None
+    pending = [index for index, identity in enumerate(identities) if identity not in previous]
+    computed = extract_features(model, arch, dataset, [(index, view) for index in pending for view in range(views)],
+                                seed, batch_size, device)
+    dimension = computed.shape[1] if len(pending) else old_features.shape[2]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    features_name = f"{name}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}.npy"
+    features_path = os.path.join(cache_dir, features_name)
+    features = np.lib.format.open_memmap(features_path + '.tmp', mode='w+', dtype=np.float32,
+                                         shape=(len(identities), views, dimension))
+    for index, identity in enumerate(identities):
+        if identity in previous:
+            features[index] = old_features[previous[identity]]
+    if pending:
+        features[pending] = computed.reshape(len(pending), views, dimension)
+    features.flush()
+    del features, old_features
+
+    index = {
+        'version': FEATURE_INDEX_VERSION,
+        'key': key,
+        'arch': arch,
+        'views': views,
+        'seed': seed,
+        'features': features_name,
+        'entries': [{'identity': list(identity), 'row': row} for row, identity in enumerate(identities)],
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    os.replace(features_path + '.tmp', features_path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    stale_pattern = re.compile(rf"{re.escape(name)}-\d+-\d+\.npy")
+    for stale in os.listdir(cache_dir):
+        if stale_pattern.fullmatch(stale) and stale != features_name:
+            os.remove(os.path.join(cache_dir, stale))
+
+    print(f"🧠 Cached {name} features: {len(pending)} of {len(identities)} images x {views} view(s) "
+          f"through the backbone in {time.perf_counter() - start:.1f}s")
+    return np.load(features_path, mmap_mode='r'), labels
+
+def predict_head(head, features):
+    """Predicted class per row of (N, D) features (or view 0 of (N, views, D))"""
+    features = torch.from_numpy(np.ascontiguousarray(features))
+    if features.dim() == 3:
+        features = features[:, 0]
+    head.eval()
+    with torch.no_grad():
+        return head(features.to(next(head.parameters()).device)).argmax(1).cpu().numpy()
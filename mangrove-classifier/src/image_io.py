@@ -0,0 +1,52 @@
+from PIL import Image
+import config
+
+class ImageTooLarge(ValueError):
+    """The image would decode to more than config.DECODE_MAX_PIXELS pixels"""
+
+def reduced_decode_size(target_size, oversample=None):
+    """
+    Smallest size (h, w) worth decoding for a model input of `target_size` (h, w).
+    Decoding `oversample` times larger keeps the final resize antialiased.
+    """
+    if oversample is None:
+        oversample = config.DECODE_OVERSAMPLE
+    return (int(target_size[0] * oversample), int(target_size[1] * oversample))
+
+def load_rgb(source, target_size=None, fast=None, oversample=None, max_pixels=None):
+    """
+    Open an image (path or file-like object) as RGB.
+    `target_size` is the model input (h, w), as in backends.preprocess. With
+    fast decoding and a `target_size`, JPEGs are decoded by the DCT scaler
+    directly at 1/2, 1/4 or 1/8 scale (never below the reduced decode size),
+    and other formats are box-reduced after decoding so the following Resize
+    touches a bounded number of pixels. Only JPEG has a reduced decode, so the
+    size left to decode is checked against `max_pixels` (config.DECODE_MAX_PIXELS)
+    from the header first and ImageTooLarge is raised above it.
+    """
+    if fast is None:
+        fast = config.FAST_DECODE
+    if max_pixels is None:
+        max_pixels = config.DECODE_MAX_PIXELS
+
+    image = Image.open(source)
+
+    decode_size = None
+    if fast and target_size is not None:
+        decode_size = reduced_decode_size(target_size, oversample)
+        # draft() only changes how the image is decoded (JPEG only); it must run before load()
+        image.draft('RGB', (decode_size[1], decode_size[0]))
+    if max_pixels and image.width * image.height > max_pixels:
+        image.close()
+        raise ImageTooLarge(f"Image decodes to {image.width}x{image.height}, over the "
+                            f"{max_pixels} pixel limit (DECODE_MAX_PIXELS)")
+    image.load()
+
+    if decode_size is not None:
+        factor = min(image.height // decode_size[0], image.width // decode_size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
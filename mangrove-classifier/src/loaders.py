@@ -0,0 +1,119 @@
+"""
+Shared DataLoader factory for training
+Decoding and augmentation run in worker processes that outlive each epoch
+(persistent workers) and load `LOADER_PREFETCH` batches ahead, so the training
+step doesn't wait on them. Each worker seeds numpy and `random` from torch's
+per-worker seed, so forked workers never repeat each other's augmentations
+(older torch releases leave them with identical numpy state). With LOADER_WORKERS = 'auto' the factory measures the training
+step and the loader at several worker counts and picks the fewest workers that
+keep up with the model (workers compete with torch's compute threads for cores).
+"""
+
+import os
+import time
+import random
+import numpy as np
+import torch
+import torch.nn as nn
+import config
+
+def default_workers():
+    """Half the cores (the training step keeps the rest busy), at most 8; none on a single core"""
+    return min(8, (os.cpu_count() or 1) // 2)
+
+def seed_worker(worker_id):
+    """worker_init_fn: give numpy and `random` the per-worker seed torch already derived"""
+    seed = torch.initial_seed() % 2 ** 32
+    np.random.seed(seed)
+    random.seed(seed)
+
+def build_loader(dataset, batch_size, shuffle=False, num_workers=0, prefetch_factor=None, seed=None,
+                 persistent_workers=True, sampler=None):
+    """
+    A DataLoader with the given worker settings; a `seed` fixes the shuffle order
+    and worker seeds, a `sampler` (e.g. engine.EpochSampler) replaces `shuffle`
+    """
+    options = {}
+    if num_workers > 0:
+        options = {
+            'worker_init_fn': seed_worker,
+            'prefetch_factor': prefetch_factor or config.LOADER_PREFETCH,
+            'persistent_workers': persistent_workers
+        }
+    generator = torch.Generator().manual_seed(seed) if seed is not None else None
+    return torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler,
+                                       num_workers=num_workers, pin_memory=torch.cuda.is_available(),
+                                       generator=generator, **options)
+
+def time_loader(dataset, batch_size, num_workers, prefetch_factor=None, min_seconds=1.0):
+    """Images per second a loader delivers once its workers are running"""
+    loader = build_loader(dataset, batch_size, shuffle=True, num_workers=num_workers,
+                          prefetch_factor=prefetch_factor, seed=0)
+    # The first batch pays for starting the workers, which persistent workers pay once per run
+    next(iter(loader))
+    images = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        for batch, _ in loader:
+            images += len(batch)
+            if time.perf_counter() - start >= min_seconds:
+                break
+    return images / (time.perf_counter() - start)
+
+def time_training_step(model, batch_size, input_size=None, device='cpu', min_seconds=1.0):
+    """Images per second of forward + backward through `model` on random batches"""
+    input_size = tuple(input_size or config.IMG_SIZE)
+    images = torch.randn((batch_size, 3) + input_size, device=device)
+    model = model.to(device).train()
+    outputs = model(images)
+    labels = torch.zeros(len(outputs), dtype=torch.long, device=device)
+    criterion = nn.CrossEntropyLoss()
+    steps = 0
+    start = time.perf_counter()
+    while steps < 2 or time.perf_counter() - start < min_seconds:
+        model.zero_grad(set_to_none=True)
+        criterion(model(images), labels).backward()
+        steps += 1
+    model.zero_grad(set_to_none=True)
+    return steps * batch_size / (time.perf_counter() - start)
+
+def autotune_workers(dataset, batch_size, model=None, candidates=None, min_seconds=1.0, device='cpu'):
+    """
+    Fewest workers whose loader keeps up with the training step of `model`
+    (default: a config.ARCH network with its backbone frozen, as train.py trains it),
+    or the fastest loader if none does
+    """
+    if model is None:
+        from architectures import build_model, freeze_backbone
+        model = freeze_backbone(build_model(config.ARCH), config.ARCH)
+    cores = os.cpu_count() or 1
+    candidates = candidates or sorted({0, cores} | {2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores})
+    compute = time_training_step(model, batch_size, device=device, min_seconds=min_seconds)
+    loaders = {workers: time_loader(dataset, batch_size, workers, min_seconds=min_seconds) for workers in candidates}
+
+    keeping_up = [workers for workers, speed in loaders.items() if speed >= compute]
+    choice = min(keeping_up) if keeping_up else max(loaders, key=loaders.get)
+    print(f"⚙️  Loader autotune: training step {compute:.0f} img/s; "
+          + ", ".join(f"{workers} worker(s) {speed:.0f} img/s" for workers, speed in loaders.items())
+          + f" -> {choice} worker(s)")
+    return choice
+
+def resolve_workers(dataset, batch_size, num_workers=None, model=None):
+    """
+    Worker count for `num_workers` (default config.LOADER_WORKERS): an int, None
+    for default_workers(), or 'auto' to measure with autotune_workers (against
+    `model`'s training step if given)
+    """
+    if num_workers is None:
+        num_workers = config.LOADER_WORKERS
+    if num_workers is None:
+        return default_workers()
+    if num_workers == 'auto':
+        return autotune_workers(dataset, batch_size, model)
+    return int(num_workers)
+
+def make_loader(dataset, batch_size, shuffle=False, num_workers=None, prefetch_factor=None, seed=None,
+                model=None, sampler=None):
+    """DataLoader for training/evaluation with workers resolved by resolve_workers"""
+    num_workers = resolve_workers(dataset, batch_size, num_workers, model)
+    return build_loader(dataset, batch_size, shuffle, num_workers, prefetch_factor, seed, sampler=sampler)
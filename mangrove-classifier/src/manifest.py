@@ -0,0 +1,89 @@
+"""
+Training manifests
+Every training run writes <checkpoint>.manifest.json next to the checkpoint it
+saves. The manifest lists the training images (path within the split, label,
+size, mtime) and holds the SHA-256 of the checkpoint file, so it only counts for
+that exact checkpoint. The test split it was scored on is listed too. A full run trains on every image it lists; an incremental
+run fine-tunes on the new ones and keeps listing the images its starting
+checkpoint's manifest did, replayed or not. Incremental retraining (retrain_model.py --incremental)
+compares the training split with the manifest to find the images that were
+added or changed since the checkpoint was trained.
+"""
+
+import os
+import json
+import time
+from backends import checkpoint_sha256
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.manifest.json'
+
+def manifest_path(model_path):
+    """models/mangrove_model.pth -> models/mangrove_model.manifest.json"""
+    return os.path.splitext(model_path)[0] + MANIFEST_SUFFIX
+
+def image_entries(dataset, root):
+    """Manifest entry of every sample of an ImageFolder-style dataset whose split folder is `root`"""
+    entries = []
+    for path, label in dataset.samples:
+        stat = os.stat(path)
+        entries.append({'path': os.path.relpath(path, root), 'label': label, 'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns})
+    return entries
+
+def write_manifest(model_path, dataset, root, test_dataset=None, test_root=None):
+    """
+    Record that the checkpoint at `model_path` was trained on `dataset` (the split
+    folder `root`) and, if given, evaluated on `test_dataset` (`test_root`)
+    """
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'checkpoint_sha256': checkpoint_sha256(model_path),
+        'classes': list(dataset.classes),
+        'images': image_entries(dataset, root),
+        'test_images': image_entries(test_dataset, test_root) if test_dataset is not None else None,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    path = manifest_path(model_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    return path
+
+def read_manifest(model_path):
+    """The manifest of the checkpoint at `model_path`, or None if it has none that matches the file"""
+    try:
+        with open(manifest_path(model_path)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or not os.path.exists(model_path):
+        return None
+    if manifest.get('checkpoint_sha256') != checkpoint_sha256(model_path):
+        return None
+    return manifest
+
+def split_known(manifest, dataset, root):
+    """
+    (indices of samples added or changed since the manifest, indices of the known
+    others: present, unchanged, when the checkpoint's lineage was trained on them)
+    """
+    known = {(entry['path'], entry['size'], entry['mtime_ns']) for entry in manifest['images']}
+    new, old = [], []
+    for index, entry in enumerate(image_entries(dataset, root)):
+        (old if (entry['path'], entry['size'], entry['mtime_ns']) in known else new).append(index)
+    return new, old
+
+def test_changes(manifest, test_dataset, test_root):
+    """
+    (test images the checkpoint's lineage was trained on, whether the test split
+    differs from the one the checkpoint was scored on; True if that is unknown)
+    """
+    trained = {entry['path'] for entry in manifest['images']}
+    entries = image_entries(test_dataset, test_root)
+    overlap = sorted(entry['path'] for entry in entries if entry['path'] in trained)
+    identity = lambda entry: (entry['path'], entry['size'], entry['mtime_ns'])
+    recorded = manifest.get('test_images')
+    changed = recorded is None or set(map(identity, recorded)) != set(map(identity, entries))
+    return overlap, changed
@@ -0,0 +1,87 @@
+"""
+bfloat16 CPU inference with an fp32 self-check
+On CPUs with native bf16 matrix units (AVX512-BF16, AMX) the eager model runs
+under torch.autocast in bfloat16 with channels_last inputs (see
+backends.TorchBackend), over twice as fast as fp32 for ResNet50. Before the mode
+is kept, a sample of labelled images is run in both precisions; if any class
+probability moves by more than the tolerance the backend goes back to fp32.
+"""
+
+import os
+import numpy as np
+import config
+from image_io import load_rgb
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# /proc/cpuinfo flags of the instructions oneDNN uses for bf16 matmuls and convolutions
+BF16_CPU_FLAGS = ('avx512_bf16', 'amx_bf16')
+
+def cpu_flags():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def bf16_supported():
+    """Whether this CPU has native bf16 instructions that torch's oneDNN kernels can use"""
+    import torch
+    return torch.backends.mkldnn.is_available() and bool(cpu_flags() & set(BF16_CPU_FLAGS))
+
+def resolve_precision(precision):
+    """'auto' -> 'bf16' on CPUs with native support, else 'fp32'; other values pass through"""
+    if precision == 'auto':
+        return 'bf16' if bf16_supported() else 'fp32'
+    return precision
+
+def sample_images(data_dir, count):
+    """Up to `count` images spread evenly over the (sorted) images below `data_dir`"""
+    paths = sorted(os.path.join(dirpath, name) for dirpath, _, filenames in os.walk(data_dir)
+                   for name in filenames if name.lower().endswith(IMAGE_EXTENSIONS))
+    if len(paths) <= count:
+        return paths
+    return [paths[i] for i in np.linspace(0, len(paths) - 1, count).round().astype(int)]
+
+def compare_precisions(backend, batch, batch_size=8):
+    """Max class-probability difference and argmax agreement of bf16 vs fp32 on `batch`"""
+    precision = backend.precision
+    try:
+        outputs = {}
+        for mode in ('fp32', 'bf16'):
+            backend.precision = mode
+            outputs[mode] = np.concatenate([backend.predict(batch[i:i + batch_size])
+                                            for i in range(0, len(batch), batch_size)])
+    finally:
+        backend.precision = precision
+    max_diff = float(np.abs(outputs['bf16'] - outputs['fp32']).max())
+    agreement = float((outputs['bf16'].argmax(1) == outputs['fp32'].argmax(1)).mean())
+    return max_diff, agreement
+
+def check_bf16(backend, data_dir=None, samples=None, tolerance=None):
+    """
+    Self-check a TorchBackend's bf16 mode against fp32 on up to `samples` images
+    of `data_dir` (defaults from config). Leaves the backend in bf16 if its
+    probabilities stay within `tolerance`, otherwise in fp32 (also when there
+    are no images to check with). Returns (passed, message).
+    """
+    data_dir = data_dir or config.TEST_DIR
+    tolerance = config.PRECISION_TOLERANCE if tolerance is None else tolerance
+    image_paths = sample_images(data_dir, samples or config.PRECISION_CHECK_IMAGES)
+    if not image_paths:
+        backend.precision = 'fp32'
+        return False, f"no images in {data_dir} to self-check bf16 with; using fp32"
+
+    batch = np.stack([backend.preprocess(load_rgb(path, target_size=backend.input_size))
+                      for path in image_paths])
+    max_diff, agreement = compare_precisions(backend, batch)
+    passed = max_diff <= tolerance
+    backend.precision = 'bf16' if passed else 'fp32'
+    summary = (f"bf16 vs fp32 on {len(image_paths)} images: max probability diff {max_diff:.2e}, "
+               f"prediction agreement {agreement:.2%}")
+    if passed:
+        return True, f"{summary}; using bf16"
+    return False, f"{summary} exceeds tolerance {tolerance:g}; using fp32"
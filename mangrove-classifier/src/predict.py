@@ -1,40 +1,109 @@
 import torch
-import torch.nn as nn
-from torchvision import models, transforms
-from PIL import Image
+from torchvision import transforms
 import os
+from concurrent.futures import ThreadPoolExecutor
 import config
+from image_io import load_rgb
+from architectures import load_checkpoint
+from export_model import load_frozen, frozen_path
+from quantize_model import load_quantized, quantized_path
+from backends import TorchBackend, load_onnx, export_path
+from autotune import load_tuning, tuning_key, apply_threads
+from precision import resolve_precision, check_bf16
 
 class MangroveClassifier:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, quantized=None, backend=None, tuning=None, precision=None):
         """
         Initialize the mangrove classifier
+        With `quantized` (default: config.QUANTIZED) the INT8 model written by
+        src/quantize_model.py is used on CPU. `backend` (default: config.BACKEND)
+        selects 'torch' or 'onnx' (the src/export_onnx.py export under ONNX Runtime).
+        `tuning` holds threads, interop_threads, batch_size and channels_last
+        (default: what src/autotune.py measured for this checkpoint on this host).
+        `precision` (default: config.PRECISION) 'bf16' or 'auto' runs the fp32
+        torch model under bfloat16 autocast on CPU, if it passes a self-check.
         """
         if model_path is None:
             model_path = os.path.join(config.MODEL_DIR, "mangrove_model.pth")
+        if quantized is None:
+            quantized = config.QUANTIZED
         
         self.model_path = model_path
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = self.load_model()
+        self.quantized = quantized
+        self.backend_name = backend or config.BACKEND
+        if tuning is None:
+            tuning = load_tuning(model_path, tuning_key(self.backend_name, quantized)) or {}
+        self.tuning = tuning
+        self.batch_size = tuning.get('batch_size', config.PREDICT_BATCH_SIZE)
+        # Quantized kernels and ONNX Runtime's CPU provider are CPU-only
+        use_cuda = torch.cuda.is_available() and not quantized and self.backend_name == 'torch'
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+        # CPU autocast only; the INT8 model and ONNX Runtime have their own kernels
+        precision = resolve_precision(precision or config.PRECISION)
+        use_bf16 = precision == 'bf16' and self.backend_name == 'torch' and not quantized and not use_cuda
+        self.precision = 'bf16' if use_bf16 else 'fp32'
+        if not use_cuda:
+            apply_threads(tuning)
+        self.backend = self.load_backend()
+        # The torch module, for callers that need it directly (None with the onnx backend)
+        self.model = getattr(self.backend, 'model', None)
         self.transform = self.get_transform()
-        self.classes = config.CLASS_NAMES
+        # Class order, input size and normalization come from the checkpoint metadata
+        self.classes = self.backend.classes
+    
+    def load_backend(self):
+        """
+        Load the inference backend selected for this classifier
+        """
+        if self.backend_name == 'onnx':
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Model file not found: {self.model_path}")
+            backend = load_onnx(self.model_path, intra_op_threads=self.tuning.get('threads', 0))
+            if backend is None:
+                raise RuntimeError(f"No up-to-date ONNX model at {export_path(self.model_path, 'onnx')}; "
+                                   f"run src/export_onnx.py first")
+            print(f"✅ ONNX model loaded from {export_path(self.model_path, 'onnx')}")
+            return backend
+        if self.backend_name != 'torch':
+            raise ValueError(f"Unknown backend: {self.backend_name}")
+        
+        model, metadata = self.load_model()
+        model_format = 'int8' if self.quantized else 'frozen' if isinstance(model, torch.jit.ScriptModule) else 'eager'
+        backend = TorchBackend(model, self.device, model_format, metadata,
+                               channels_last=self.tuning.get('channels_last', False), precision=self.precision)
+        if self.precision == 'bf16':
+            passed, message = check_bf16(backend)
+            print(f"{'✅' if passed else '⚠️ '} {message}")
+            self.precision = backend.precision
+        return backend
     
     def load_model(self):
         """
-        Load the trained model
+        Load the trained model; returns (model, checkpoint metadata)
         """
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
         
-        model = models.resnet50(pretrained=False)
-        model.fc = nn.Linear(model.fc.in_features, config.NUM_CLASSES)
+        if self.quantized:
+            loaded = load_quantized(self.model_path)
+            if loaded is None:
+                raise RuntimeError(f"No up-to-date INT8 model at {quantized_path(self.model_path)}; "
+                                   f"run src/quantize_model.py first")
+            print(f"✅ INT8 model loaded from {quantized_path(self.model_path)}")
+            return loaded
+        
+        # Prefer the frozen TorchScript export (src/export_model.py) when it matches this checkpoint.
+        # Autocast barely speeds up a frozen graph (its weights are fp32 constants), so bf16 runs eager.
+        frozen = load_frozen(self.model_path, self.device) if self.precision == 'fp32' else None
+        if frozen is not None:
+            print(f"✅ Frozen model loaded from {frozen_path(self.model_path)}")
+            return frozen
         
         try:
-            model.load_state_dict(torch.load(self.model_path, map_location=self.device))
-            model.to(self.device)
-            model.eval()
-            print(f"✅ Model loaded successfully from {self.model_path}")
-            return model
+            # Rebuilds whichever registered architecture the checkpoint was trained with
+            model, metadata = load_checkpoint(self.model_path, self.device)
+            print(f"✅ Model loaded successfully from {self.model_path} ({metadata['arch']})")
+            return model, metadata
         except Exception as e:
             raise RuntimeError(f"Error loading model: {e}")
     
@@ -42,63 +111,124 @@ class MangroveClassifier:
         """
         Get image preprocessing transforms
         """
+        metadata = self.backend.metadata
         return transforms.Compose([
-            transforms.Resize(config.IMG_SIZE),
+            transforms.Resize(self.backend.input_size),
             transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+            transforms.Normalize(metadata['mean'], metadata['std'])
         ])
     
-    def preprocess_image(self, image_path):
+    def load_tensor(self, image_path):
         """
-        Preprocess image for prediction
+        Decode and transform one image into an unbatched (C, H, W) CPU tensor
         """
         try:
-            image = Image.open(image_path).convert("RGB")
-            image_tensor = self.transform(image).unsqueeze(0)
-            return image_tensor.to(self.device)
+            image = load_rgb(image_path, target_size=self.backend.input_size)
+            return self.transform(image)
         except Exception as e:
             raise ValueError(f"Error processing image {image_path}: {e}")
     
+    def preprocess_image(self, image_path):
+        """
+        Preprocess image for prediction
+        """
+        return self.load_tensor(image_path).unsqueeze(0).to(self.device)
+    
     def predict(self, image_path, return_confidence=False):
         """
         Predict if image contains mangrove or not
         """
-        image_tensor = self.preprocess_image(image_path)
+        probabilities = self.backend.predict(self.load_tensor(image_path).unsqueeze(0).numpy())[0]
+        predicted = int(probabilities.argmax())
         
-        with torch.no_grad():
-            outputs = self.model(image_tensor)
-            probabilities = torch.nn.functional.softmax(outputs, dim=1)
-            confidence, predicted = torch.max(probabilities, 1)
-            
-            predicted_class = self.classes[predicted.item()]
-            confidence_score = confidence.item()
+        predicted_class = self.classes[predicted]
+        confidence_score = float(probabilities[predicted])
         
         if return_confidence:
             return predicted_class, confidence_score
         else:
             return predicted_class
     
-    def predict_batch(self, image_paths):
+    def predict_batch(self, image_paths, batch_size=None, num_workers=None):
         """
         Predict multiple images at once
+        Images are decoded on a thread pool while the previous chunk runs, then
+        stacked into chunks of `batch_size` (default: the tuned batch size, else
+        config.PREDICT_BATCH_SIZE) for one forward pass each. A failed image only
+        produces an error entry for that image.
         """
+        batch_size = batch_size or self.batch_size
+        num_workers = num_workers or config.DECODE_WORKERS
+        image_paths = list(image_paths)
+        chunks = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        
         predictions = []
-        for image_path in image_paths:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            decoding = [pool.submit(self.load_tensor, path) for path in chunks[0]] if chunks else []
+            for index, chunk in enumerate(chunks):
+                decoded = decoding
+                # Keep the pool busy with the next chunk while this one is on the model
+                if index + 1 < len(chunks):
+                    decoding = [pool.submit(self.load_tensor, path) for path in chunks[index + 1]]
+                predictions.extend(self.predict_chunk(chunk, decoded))
+        return predictions
+    
+    def predict_chunk(self, image_paths, decoded):
+        """
+        Run one forward pass over the successfully decoded images of a chunk
+        """
+        tensors, errors = {}, {}
+        for i, future in enumerate(decoded):
             try:
-                prediction, confidence = self.predict(image_path, return_confidence=True)
+                tensors[i] = future.result()
+            except Exception as e:
+                errors[i] = e
+        
+        if tensors:
+            try:
+                # One forward pass (and one device sync) per chunk instead of one per image
+                probabilities = self.backend.predict(torch.stack(list(tensors.values())).numpy())
+                predicted = probabilities.argmax(axis=1)
+                rows = dict(zip(tensors, zip(predicted.tolist(), probabilities.max(axis=1).tolist())))
+            except Exception as e:
+                errors.update(dict.fromkeys(tensors, e))
+                rows = {}
+        else:
+            rows = {}
+        
+        predictions = []
+        for i, image_path in enumerate(image_paths):
+            if i in rows:
+                predicted_index, confidence = rows[i]
                 predictions.append({
                     'image': os.path.basename(image_path),
-                    'prediction': prediction,
+                    'prediction': self.classes[predicted_index],
                     'confidence': confidence
                 })
-            except Exception as e:
+            else:
                 predictions.append({
                     'image': os.path.basename(image_path),
                     'prediction': 'Error',
                     'confidence': 0.0,
-                    'error': str(e)
+                    'error': str(errors[i])
                 })
         return predictions
+    
+    def predict_tiles(self, image_path, overlap=None, scale=None, bands=None, batch_size=None, num_workers=None,
+                      threshold=0.5):
+        """
+        Classify a large scene tile by tile instead of squashing it to the input size
+        Returns a (rows, cols) grid of mangrove probabilities and the mangrove
+        coverage fraction of the scene (see src/tiling.py). Tiles are read window
+        by window when rasterio is installed.
+        """
+        from tiling import open_scene, classify_scene
+        scene = open_scene(image_path, bands)
+        try:
+            return classify_scene(self.backend, scene, overlap, scale, batch_size or self.batch_size,
+                                  num_workers, threshold)
+        finally:
+            scene.close()
 
 def predict_image(image_path, model_path=None):
     """
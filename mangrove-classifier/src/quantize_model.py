@@ -0,0 +1,132 @@
+"""
+Post-training static INT8 quantization of the classifier (CPU)
+Activation ranges are calibrated on real images from data/train (or data/test),
+the network is converted with FX graph mode quantization, then traced and frozen
+into `<name>.int8.pt` next to the checkpoint. Load it with
+MangroveClassifier(quantized=True) or MODEL_QUANTIZED=1 for the server.
+An accuracy/latency/memory report against fp32 is generated afterwards.
+
+Usage: python src/quantize_model.py [--model models/mangrove_model.pth] [--calibration data/train] [--num-images 64]
+"""
+
+import os
+import sys
+import copy
+import random
+import argparse
+import subprocess
+import torch
+import config
+from image_io import load_rgb
+from architectures import logits
+from export_model import build_eager_model, write_export, load_export
+from backends import export_path
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def quantized_path(model_path):
+    """models/mangrove_model.pth -> models/mangrove_model.int8.pt"""
+    return export_path(model_path, 'int8')
+
+def calibration_images(data_dir, num_images, seed=42):
+    """A class-balanced random sample of image paths below data_dir"""
+    by_class = {}
+    for dirpath, _, filenames in os.walk(data_dir):
+        images = [os.path.join(dirpath, name) for name in sorted(filenames)
+                  if name.lower().endswith(IMAGE_EXTENSIONS)]
+        if images:
+            by_class[dirpath] = images
+
+    rng = random.Random(seed)
+    for images in by_class.values():
+        rng.shuffle(images)
+    # Round-robin over classes so neither class dominates the activation ranges
+    sample = []
+    while len(sample) < num_images and any(by_class.values()):
+        for images in by_class.values():
+            if images and len(sample) < num_images:
+                sample.append(images.pop())
+    return sample
+
+def calibration_batches(image_paths, batch_size, checkpoint):
+    """Preprocess exactly like MangroveClassifier (per the checkpoint metadata) and yield stacked batches"""
+    from torchvision import transforms
+    size = tuple(checkpoint['input_size'])
+    transform = transforms.Compose([
+        transforms.Resize(size),
+        transforms.ToTensor(),
+        transforms.Normalize(checkpoint['mean'], checkpoint['std'])
+    ])
+    for start in range(0, len(image_paths), batch_size):
+        chunk = image_paths[start:start + batch_size]
+        yield torch.stack([transform(load_rgb(path, target_size=size)) for path in chunk])
+
+def quantize(model_path, calibration_dir, num_images=64, batch_size=16, output_path=None):
+    """Calibrate, convert and save the INT8 module; returns (path, number of calibration images)"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    output_path = output_path or quantized_path(model_path)
+    image_paths = calibration_images(calibration_dir, num_images)
+    if not image_paths:
+        raise FileNotFoundError(f"No calibration images found in {calibration_dir}")
+
+    engine = torch.backends.quantized.engine
+    model, checkpoint = build_eager_model(model_path, 'cpu')
+    example = torch.zeros(1, 3, *checkpoint['input_size'])
+
+    # Observers record activation ranges while the calibration images run through the model
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for batch in calibration_batches(image_paths, batch_size, checkpoint):
+            prepared(batch)
+        quantized = convert_fx(prepared)
+        frozen = torch.jit.freeze(torch.jit.trace(quantized, example))
+
+    check_batch = next(calibration_batches(image_paths, batch_size, checkpoint))
+
+    def max_logit_diff(tmp_path):
+        served = torch.jit.load(tmp_path, map_location='cpu').eval()
+        with torch.no_grad():
+            return (logits(model(check_batch)) - logits(served(check_batch))).abs().max().item()
+
+    # Quantization error is expected; the report judges accuracy, here we only check the export runs
+    write_export(frozen, output_path, model_path, 'cpu', check=max_logit_diff, tolerance=float('inf'),
+                 checkpoint=checkpoint, quantization='int8-static', engine=engine, calibration_images=len(image_paths),
+                 calibration_dir=os.path.abspath(calibration_dir))
+    return output_path, len(image_paths)
+
+def load_quantized(model_path, source_sha256=None):
+    """INT8 export of `model_path` ready for CPU inference as (module, metadata), or None if missing or stale"""
+    return load_export(quantized_path(model_path), model_path, 'cpu', source_sha256,
+                       exporter='src/quantize_model.py')
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--calibration', help='calibration image folder (default: data/train, else data/test)')
+    parser.add_argument('--num-images', type=int, default=64, help='calibration images to use')
+    parser.add_argument('--output', help='output path (default: <model>.int8.pt)')
+    parser.add_argument('--no-report', action='store_true', help='skip the fp32 vs int8 report')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        sys.exit(1)
+
+    calibration_dir = args.calibration
+    if calibration_dir is None:
+        calibration_dir = next((d for d in (config.TRAIN_DIR, config.TEST_DIR)
+                                if calibration_images(d, 1)), config.TRAIN_DIR)
+
+    print(f"🔢 Quantizing {args.model} (calibrating on {calibration_dir})...")
+    output_path, count = quantize(args.model, calibration_dir, args.num_images, output_path=args.output)
+    print(f"✅ INT8 model saved to {output_path} ({count} calibration images)")
+
+    if not args.no_report and args.output is None:
+        subprocess.run([sys.executable, os.path.join(root, 'benchmarks', 'benchmark_quantized.py'),
+                        '--model', args.model], check=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Tiled inference for large aerial and satellite scenes
+A scene is split into overlapping tiles of the model's input size. Tiles are
+read window by window and classified in batches, while a thread pool reads the
+next batch. Windows are read with rasterio (in requirements.txt), so a scene in
+any GDAL format never has to fit in memory. Only a file GDAL can't open, or an
+install without rasterio, falls back to PIL, which is not windowed: it decodes
+the whole image, so it refuses scenes above config.TILE_MAX_PIXELS. The
+result is a grid of per-tile mangrove probabilities plus the fraction of the
+scene's area whose overlap-averaged probability reaches the threshold.
+
+Usage: python src/tiling.py <scene> [--overlap 0.25] [--scale 1.0] [--bands 4 3 2] [--output grid.tif]
+"""
+
+import os
+import sys
+import time
+import warnings
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import config
+
+def stretch_to_uint8(data, low, high):
+    """Linearly map [low, high] per band (first axis) onto 0-255"""
+    low = np.asarray(low, dtype=np.float32).reshape(-1, 1, 1)
+    high = np.asarray(high, dtype=np.float32).reshape(-1, 1, 1)
+    scaled = (data.astype(np.float32) - low) * (255.0 / np.maximum(high - low, 1e-6))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+class RasterioScene:
+    """
+    Windowed reads through GDAL. Each thread opens its own handle because
+    rasterio datasets are not thread-safe. Bands other than 8-bit are stretched
+    from their 2nd-98th percentile (measured on a decimated read) to 0-255.
+    """
+    def __init__(self, path, bands=None):
+        import rasterio
+        # Plain photos and scans open fine; they just have no geotransform
+        warnings.filterwarnings('ignore', category=rasterio.errors.NotGeoreferencedWarning)
+        self.path = path
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+        with rasterio.open(path) as dataset:
+            self.width, self.height = dataset.width, dataset.height
+            self.bands = list(bands or ((1, 2, 3) if dataset.count >= 3 else (1, 1, 1)))
+            self.transform = dataset.transform if not dataset.transform.is_identity else None
+            self.crs = dataset.crs
+            if all(dataset.dtypes[band - 1] == 'uint8' for band in self.bands):
+                self.value_range = None
+            else:
+                factor = max(1, max(self.width, self.height) // 1024)
+                overview = dataset.read(self.bands, out_shape=(len(self.bands), max(1, self.height // factor),
+                                                               max(1, self.width // factor))).astype(np.float32)
+                flat = overview.reshape(len(self.bands), -1)
+                self.value_range = (np.percentile(flat, 2, axis=1), np.percentile(flat, 98, axis=1))
+
+    def _dataset(self):
+        dataset = getattr(self._local, 'dataset', None)
+        if dataset is None:
+            import rasterio
+            dataset = self._local.dataset = rasterio.open(self.path)
+            with self._lock:
+                self._handles.append(dataset)
+        return dataset
+
+    def read(self, x, y, width, height, out_size):
+        """(out_h, out_w, 3) uint8 RGB of the window, resampled to `out_size` (h, w)"""
+        from rasterio.enums import Resampling
+        from rasterio.windows import Window
+        data = self._dataset().read(self.bands, window=Window(x, y, width, height),
+                                    out_shape=(len(self.bands),) + tuple(out_size), resampling=Resampling.bilinear)
+        if self.value_range is not None:
+            data = stretch_to_uint8(data, *self.value_range)
+        return np.ascontiguousarray(data.transpose(1, 2, 0), dtype=np.uint8)
+
+    def close(self):
+        with self._lock:
+            for dataset in self._handles:
+                dataset.close()
+            self._handles = []
+
+class SceneTooLarge(ValueError):
+    """The scene needs windowed reads (rasterio) to be tiled within config.TILE_MAX_PIXELS"""
+
+class PILScene:
+    """
+    Fallback without rasterio. Not windowed: the whole image is decoded once and
+    tiles are cut from it, so the size from the header is checked against
+    `max_pixels` (config.TILE_MAX_PIXELS) before anything is decoded.
+    """
+    transform = None
+    crs = None
+
+    def __init__(self, path, max_pixels=None):
+        max_pixels = config.TILE_MAX_PIXELS if max_pixels is None else max_pixels
+        image = Image.open(path)
+        width, height = image.size
+        if max_pixels and width * height > max_pixels:
+            image.close()
+            raise SceneTooLarge(f"Scene is {width}x{height} ({width * height} pixels), over the "
+                                f"{max_pixels} pixels PIL may decode (TILE_MAX_PIXELS); "
+                                f"install rasterio for windowed reads")
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        self.array = np.asarray(image)
+        self.height, self.width = self.array.shape[:2]
+
+    def read(self, x, y, width, height, out_size):
+        tile = self.array[y:y + height, x:x + width]
+        if (height, width) != tuple(out_size):
+            tile = np.asarray(Image.fromarray(tile).resize((out_size[1], out_size[0]), Image.BILINEAR))
+        return tile
+
+    def close(self):
+        self.array = None
+
+def open_scene(path, bands=None, max_pixels=None):
+    """RasterioScene if rasterio is installed and GDAL can read `path`, else PILScene (up to `max_pixels`)"""
+    try:
+        import rasterio
+    except ImportError:
+        rasterio = None
+    if rasterio is not None:
+        try:
+            return RasterioScene(path, bands)
+        except rasterio.errors.RasterioIOError:
+            pass
+    if bands:
+        raise ValueError("Selecting bands needs rasterio (pip install rasterio)")
+    return PILScene(path, max_pixels)
+
+def tile_origins(length, size, stride):
+    """Start offsets of `size`-long tiles `stride` apart, the last one flush with the edge"""
+    origins = list(range(0, max(length - size, 0) + 1, stride))
+    if origins[-1] + size < length:
+        origins.append(length - size)
+    return np.array(origins)
+
+def area_coverage(grid, ys, xs, window, threshold):
+    """
+    Average the probabilities of overlapping tiles over the regions they share and
+    return (fraction of the area at or above `threshold`, area-weighted mean probability)
+    """
+    height, width = window
+    y_edges = np.unique(np.concatenate([ys, ys + height]))
+    x_edges = np.unique(np.concatenate([xs, xs + width]))
+    sums = np.zeros((len(y_edges) - 1, len(x_edges) - 1))
+    counts = np.zeros_like(sums)
+    for row, y in enumerate(ys):
+        y0, y1 = np.searchsorted(y_edges, [y, y + height])
+        for col, x in enumerate(xs):
+            x0, x1 = np.searchsorted(x_edges, [x, x + width])
+            sums[y0:y1, x0:x1] += grid[row, col]
+            counts[y0:y1, x0:x1] += 1
+    probabilities = sums / counts
+    areas = np.outer(np.diff(y_edges), np.diff(x_edges)) / float(height * width)
+    total = areas.sum()
+    return float(areas[probabilities >= threshold].sum() / total), float((probabilities * areas).sum() / total)
+
+def classify_scene(backend, scene, overlap=None, scale=None, batch_size=None, workers=None, threshold=0.5):
+    """
+    Classify every tile of an open scene with an inference backend.
+    Tiles cover `scale` scene pixels per model input pixel (so 2.0 reads a
+    448x448 window for a 224x224 model), neighbours share `overlap` of a tile.
+    Returns a dict with the (rows, cols) mangrove probability `grid`, tile
+    origins, the area `coverage` at `threshold` and throughput.
+    """
+    overlap = config.TILE_OVERLAP if overlap is None else overlap
+    scale = scale or config.TILE_SCALE
+    batch_size = batch_size or config.PREDICT_BATCH_SIZE
+    workers = workers or config.DECODE_WORKERS
+    if not 0 <= overlap < 1:
+        raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+
+    input_size = backend.input_size
+    # Scenes smaller than one tile are classified whole
+    window = (min(scene.height, round(input_size[0] * scale)), min(scene.width, round(input_size[1] * scale)))
+    stride = (max(1, round(window[0] * (1 - overlap))), max(1, round(window[1] * (1 - overlap))))
+    ys = tile_origins(scene.height, window[0], stride[0])
+    xs = tile_origins(scene.width, window[1], stride[1])
+    positions = [(row, col) for row in range(len(ys)) for col in range(len(xs))]
+    mangrove = backend.classes.index('mangrove')
+
+    def load_tile(position):
+        row, col = position
+        tile = scene.read(int(xs[col]), int(ys[row]), window[1], window[0], input_size)
+        return backend.preprocess(Image.fromarray(tile))
+
+    grid = np.zeros((len(ys), len(xs)), dtype=np.float32)
+    chunks = [positions[i:i + batch_size] for i in range(0, len(positions), batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        reading = [pool.submit(load_tile, position) for position in chunks[0]]
+        for index, chunk in enumerate(chunks):
+            tiles = reading
+            # Read the next batch while this one is on the model
+            if index + 1 < len(chunks):
+                reading = [pool.submit(load_tile, position) for position in chunks[index + 1]]
+            probabilities = backend.predict(np.stack([future.result() for future in tiles]))
+            rows, cols = zip(*chunk)
+            grid[list(rows), list(cols)] = probabilities[:, mangrove]
+    seconds = time.perf_counter() - start
+
+    coverage, mean_probability = area_coverage(grid, ys, xs, window, threshold)
+    return {
+        'grid': grid,
+        'tile_origins': {'y': ys.tolist(), 'x': xs.tolist()},
+        'tile_size': list(window),
+        'stride': list(stride),
+        'image_size': [scene.width, scene.height],
+        'threshold': threshold,
+        'coverage': coverage,
+        'mean_probability': mean_probability,
+        'tiles': len(positions),
+        'seconds': seconds,
+        'tiles_per_second': len(positions) / seconds if seconds else None
+    }
+
+def write_geotiff(result, scene, path):
+    """Save the probability grid as a float32 GeoTIFF, one pixel per tile stride (needs rasterio)"""
+    import rasterio
+    from rasterio.transform import Affine
+    (height, width), (stride_y, stride_x) = result['tile_size'], result['stride']
+    # Pixel (row, col) is centred on its tile; the first pixel starts half a stride before the first centre
+    transform = (scene.transform or Affine.identity()) * Affine.translation(
+        width / 2 - stride_x / 2, height / 2 - stride_y / 2) * Affine.scale(stride_x, stride_y)
+    grid = result['grid']
+    with rasterio.open(path, 'w', driver='GTiff', width=grid.shape[1], height=grid.shape[0], count=1,
+                       dtype='float32', crs=scene.crs, transform=transform) as output:
+        output.write(grid, 1)
+
+def main():
+    from predict import MangroveClassifier
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scene', help='large image: GeoTIFF/JP2 (with rasterio), or any image PIL reads')
+    parser.add_argument('--model', default=os.path.join(config.MODEL_DIR, 'mangrove_model.pth'))
+    parser.add_argument('--overlap', type=float, default=config.TILE_OVERLAP)
+    parser.add_argument('--scale', type=float, default=config.TILE_SCALE, help='scene pixels per model pixel')
+    parser.add_argument('--bands', type=int, nargs=3, help='1-based band indices read as RGB (e.g. 4 3 2 for Sentinel-2)')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help='threads reading tiles')
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--output', help='save the grid: .npy, or .tif as a georeferenced GeoTIFF (rasterio)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.scene):
+        print(f"❌ Scene not found: {args.scene}")
+        sys.exit(1)
+
+    classifier = MangroveClassifier(args.model)
+    scene = open_scene(args.scene, args.bands)
+    try:
+        print(f"🛰️  {args.scene}: {scene.width}x{scene.height} ({type(scene).__name__})")
+        result = classify_scene(classifier.backend, scene, args.overlap, args.scale,
+                                args.batch_size or classifier.batch_size, args.workers, args.threshold)
+        grid = result['grid']
+        print(f"🧩 {result['tiles']} tiles ({grid.shape[0]}x{grid.shape[1]}) of {result['tile_size'][1]}x"
+              f"{result['tile_size'][0]} px in {result['seconds']:.1f}s ({result['tiles_per_second']:.1f} tiles/s)")
+        print(f"🌿 Mangrove coverage: {result['coverage']:.1%} of the area "
+              f"(probability >= {args.threshold:g}; mean {result['mean_probability']:.3f})")
+        if args.output:
+            if args.output.lower().endswith(('.tif', '.tiff')):
+                write_geotiff(result, scene, args.output)
+            else:
+                np.save(args.output, grid)
+            print(f"✅ Probability grid saved to {args.output}")
+    finally:
+        scene.close()
+
+if __name__ == "__main__":
+    main()
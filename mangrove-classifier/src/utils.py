@@ -1,73 +1,135 @@
 import torch
 import os
 import shutil
+import zlib
 from torchvision import datasets, transforms
-from sklearn.model_selection import train_test_split
 from PIL import Image
 import config
+from dataset_cache import CachedImageDataset, build_cache
+from loaders import make_loader, resolve_workers
 
-def prepare_data_structure(data_dir):
+# Image files the training scripts pick up from data/<class>/
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Training augmentation presets: (geometric steps, photometric steps)
+AUGMENTATIONS = {
+    'standard': (lambda: [transforms.RandomHorizontalFlip(p=0.5), transforms.RandomRotation(degrees=15)],
+                 lambda: [transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1)]),
+    'light': (lambda: [transforms.RandomHorizontalFlip(p=0.5), transforms.RandomRotation(degrees=10)],
+              lambda: []),
+    'none': (lambda: [], lambda: [])
+}
+
+def new_file_order(file_name):
+    """Order in which new images of a class are considered for the test split (a hash of the name)"""
+    return zlib.crc32(file_name.encode()), file_name
+
+def prepare_data_structure(data_dir, test_fraction=None):
     """
-    Reorganizes data from mangrove/non-mangrove folders to train/test structure
+    Mirror data/<class>/ into data/train/<class>/ and data/test/<class>/.
+    Images already in either split stay there (refreshed when their source
+    changed), so models are never scored on images they trained on. New images
+    are assigned per class: in new_file_order, as many go to test as it takes to
+    bring the class's test share up to `test_fraction` (config.TEST_FRACTION),
+    the rest to train. Nothing is ever removed from a split.
+    Returns {(split, class): image count}.
     """
-    mangrove_dir = os.path.join(data_dir, "mangrove")
-    non_mangrove_dir = os.path.join(data_dir, "non-mangrove")
-    
-    # Create train/test directories
-    train_dir = os.path.join(data_dir, "train")
-    test_dir = os.path.join(data_dir, "test")
-    
-    os.makedirs(os.path.join(train_dir, "mangrove"), exist_ok=True)
-    os.makedirs(os.path.join(train_dir, "non-mangrove"), exist_ok=True)
-    os.makedirs(os.path.join(test_dir, "mangrove"), exist_ok=True)
-    os.makedirs(os.path.join(test_dir, "non-mangrove"), exist_ok=True)
-    
-    # Split mangrove images
-    if os.path.exists(mangrove_dir):
-        mangrove_files = [f for f in os.listdir(mangrove_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        if mangrove_files:
-            train_files, test_files = train_test_split(mangrove_files, test_size=0.2, random_state=42)
-            
-            for file in train_files:
-                shutil.copy2(os.path.join(mangrove_dir, file), os.path.join(train_dir, "mangrove", file))
-            for file in test_files:
-                shutil.copy2(os.path.join(mangrove_dir, file), os.path.join(test_dir, "mangrove", file))
-    
-    # Split non-mangrove images
-    if os.path.exists(non_mangrove_dir):
-        non_mangrove_files = [f for f in os.listdir(non_mangrove_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        if non_mangrove_files:
-            train_files, test_files = train_test_split(non_mangrove_files, test_size=0.2, random_state=42)
-            
-            for file in train_files:
-                shutil.copy2(os.path.join(non_mangrove_dir, file), os.path.join(train_dir, "non-mangrove", file))
-            for file in test_files:
-                shutil.copy2(os.path.join(non_mangrove_dir, file), os.path.join(test_dir, "non-mangrove", file))
+    if test_fraction is None:
+        test_fraction = config.TEST_FRACTION
+    counts = {}
+    for class_name in config.CLASS_NAMES:
+        source_dir = os.path.join(data_dir, class_name)
+        split_dirs = {split: os.path.join(data_dir, split, class_name) for split in ('train', 'test')}
+        for split, directory in split_dirs.items():
+            os.makedirs(directory, exist_ok=True)
+            counts[(split, class_name)] = sum(1 for file in os.listdir(directory)
+                                              if file.lower().endswith(IMAGE_EXTENSIONS))
+        if not os.path.exists(source_dir):
+            continue
+        
+        new_files = []
+        for file in sorted(os.listdir(source_dir)):
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            source = os.path.join(source_dir, file)
+            existing = [os.path.join(directory, file) for directory in split_dirs.values()
+                        if os.path.exists(os.path.join(directory, file))]
+            if not existing:
+                new_files.append(file)
+            for target in existing:
+                if not same_file_contents(source, target):
+                    shutil.copy2(source, target)
+        
+        total = counts[('train', class_name)] + counts[('test', class_name)] + len(new_files)
+        to_test = min(len(new_files), max(0, round(total * test_fraction) - counts[('test', class_name)]))
+        for index, file in enumerate(sorted(new_files, key=new_file_order)):
+            split = 'test' if index < to_test else 'train'
+            shutil.copy2(os.path.join(source_dir, file), os.path.join(split_dirs[split], file))
+            counts[(split, class_name)] += 1
+    return counts
+
+def same_file_contents(a, b):
+    """Cheap check that `b` is a copy2 of `a` (same size and modification time)"""
+    stat_a, stat_b = os.stat(a), os.stat(b)
+    return stat_a.st_size == stat_b.st_size and int(stat_a.st_mtime) == int(stat_b.st_mtime)
 
-def get_data_transforms():
+def get_data_transforms(augment='standard'):
     """
-    Returns data transforms for training and testing
+    Returns data transforms for training and testing; `augment` names the
+    training augmentation in AUGMENTATIONS
     """
-    train_transform = transforms.Compose([
+    geometric, photometric = AUGMENTATIONS[augment]
+    train_transform = transforms.Compose(
+        [transforms.Resize(config.IMG_SIZE)] + geometric() + photometric() + [
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+    
+    test_transform = transforms.Compose([
         transforms.Resize(config.IMG_SIZE),
-        transforms.RandomHorizontalFlip(p=0.5),
-        transforms.RandomRotation(degrees=15),
-        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
     
+    return train_transform, test_transform
+
+def get_tensor_transforms(augment='standard'):
+    """
+    get_data_transforms for the uint8 (3, H, W) tensors of CachedImageDataset,
+    which are already resized: geometric augmentation runs on uint8, colour
+    jitter after conversion to float
+    """
+    geometric, photometric = AUGMENTATIONS[augment]
+    train_transform = transforms.Compose(
+        geometric() + [transforms.ConvertImageDtype(torch.float32)] + photometric() + [
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+    
     test_transform = transforms.Compose([
-        transforms.Resize(config.IMG_SIZE),
-        transforms.ToTensor(),
+        transforms.ConvertImageDtype(torch.float32),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
     
     return train_transform, test_transform
 
-def get_data_loaders(data_dir, batch_size, img_size):
+def get_datasets(train_dir, test_dir, img_size, cached=None, augment='standard'):
+    """
+    (train, test) datasets: CachedImageDataset over an up-to-date decode cache
+    when `cached` (default config.DATASET_CACHE), else ImageFolder
+    """
+    if cached is None:
+        cached = config.DATASET_CACHE
+    if cached:
+        train_transform, test_transform = get_tensor_transforms(augment)
+        return (CachedImageDataset(build_cache(train_dir, image_size=img_size), transform=train_transform),
+                CachedImageDataset(build_cache(test_dir, image_size=img_size), transform=test_transform))
+    train_transform, test_transform = get_data_transforms(augment)
+    return (datasets.ImageFolder(root=train_dir, transform=train_transform),
+            datasets.ImageFolder(root=test_dir, transform=test_transform))
+
+def get_data_loaders(data_dir, batch_size, img_size, cached=None, num_workers=None):
     """
-    Creates data loaders for training and testing
+    Creates data loaders for training and testing (workers: see loaders.resolve_workers)
     """
     # Prepare data structure if needed
     train_dir = os.path.join(data_dir, "train")
@@ -77,27 +139,15 @@ def get_data_loaders(data_dir, batch_size, img_size):
         print("Preparing data structure...")
         prepare_data_structure(data_dir)
     
-    train_transform, test_transform = get_data_transforms()
-    
     # Check if data exists
     if not os.path.exists(train_dir) or not os.listdir(train_dir):
         raise ValueError(f"No training data found in {train_dir}")
     
-    train_data = datasets.ImageFolder(root=train_dir, transform=train_transform)
-    test_data = datasets.ImageFolder(root=test_dir, transform=test_transform)
+    train_data, test_data = get_datasets(train_dir, test_dir, img_size, cached)
     
-    train_loader = torch.utils.data.DataLoader(
-        train_data, 
-        batch_size=batch_size, 
-        shuffle=True,
-        num_workers=2 if torch.cuda.is_available() else 0
-    )
-    test_loader = torch.utils.data.DataLoader(
-        test_data, 
-        batch_size=batch_size, 
-        shuffle=False,
-        num_workers=2 if torch.cuda.is_available() else 0
-    )
+    num_workers = resolve_workers(train_data, batch_size, num_workers)
+    train_loader = make_loader(train_data, batch_size, shuffle=True, num_workers=num_workers)
+    test_loader = make_loader(test_data, batch_size, shuffle=False, num_workers=num_workers)
     
     return train_loader, test_loader, train_data.classes
 
@@ -112,9 +162,9 @@ def count_images(data_dir):
     non_mangrove_count = 0
     
     if os.path.exists(mangrove_dir):
-        mangrove_count = len([f for f in os.listdir(mangrove_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
+        mangrove_count = len([f for f in os.listdir(mangrove_dir) if f.lower().endswith(IMAGE_EXTENSIONS)])
     
     if os.path.exists(non_mangrove_dir):
-        non_mangrove_count = len([f for f in os.listdir(non_mangrove_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
+        non_mangrove_count = len([f for f in os.listdir(non_mangrove_dir) if f.lower().endswith(IMAGE_EXTENSIONS)])
     
     return mangrove_count, non_mangrove_count
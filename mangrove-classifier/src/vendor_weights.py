@@ -0,0 +1,30 @@
+"""
+Vendor ImageNet backbone weights
+Stores torchvision's pretrained weights (without the classification head) as
+models/pretrained/<arch>.pth, so training and the model server's fallback model
+build pretrained networks without downloading anything. Run it once where the
+network is reachable and ship the files with the models.
+
+Usage: python src/vendor_weights.py [--archs resnet50 mobilenet_v3_small] [--output models/pretrained]
+"""
+
+import os
+import argparse
+import config
+from architectures import ARCHITECTURES, vendor_weights
+
+def main():
+    pretrained = sorted(arch for arch, spec in ARCHITECTURES.items() if spec.pretrained)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--archs', nargs='+', choices=pretrained,
+                        default=sorted({config.ARCH, 'resnet50'} & set(pretrained)),
+                        help='architectures to vendor (default: config.ARCH and the server fallback, resnet50)')
+    parser.add_argument('--output', default=config.PRETRAINED_DIR)
+    args = parser.parse_args()
+
+    for arch in args.archs:
+        path = vendor_weights(arch, args.output)
+        print(f"✅ {arch} backbone saved to {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -72,6 +72,8 @@ class MangroveImageClassifier {
 				},
 				{
 					timeout: 30000,
+					// Lets the model server drop the work if we have already given up
+					headers: { 'X-Request-Timeout-Ms': '30000' },
 				}
 			);
 